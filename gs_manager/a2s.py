@@ -0,0 +1,349 @@
+import bz2
+import selectors
+import socket
+import struct
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+__all__ = [
+    "Address",
+    "A2S_INFO",
+    "A2S_PLAYERS",
+    "A2S_RULES",
+    "query_servers",
+    "query_info",
+    "ping",
+]
+
+Address = Tuple[str, int]
+
+A2S_INFO = "info"
+A2S_PLAYERS = "players"
+A2S_RULES = "rules"
+
+HEADER_SIMPLE = b"\xff\xff\xff\xff"
+HEADER_SPLIT = b"\xfe\xff\xff\xff"
+NO_CHALLENGE = b"\xff\xff\xff\xff"
+
+S2C_CHALLENGE = ord("A")
+
+# request type -> (request header, response header)
+_REQUESTS = {
+    A2S_INFO: (b"T", ord("I")),
+    A2S_PLAYERS: (b"U", ord("D")),
+    A2S_RULES: (b"V", ord("E")),
+}
+
+_MAX_CHALLENGES = 3
+_RETRY_INTERVAL = 1.0
+
+SERVER_TYPES = {"d": "dedicated", "l": "non-dedicated", "p": "SourceTV"}
+PLATFORMS = {"l": "linux", "w": "windows", "m": "mac", "o": "mac"}
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.offset = 0
+
+    def _unpack(self, fmt: str) -> Any:
+        value = struct.unpack_from(fmt, self.data, self.offset)[0]
+        self.offset += struct.calcsize(fmt)
+        return value
+
+    def byte(self) -> int:
+        return self._unpack("<B")
+
+    def short(self) -> int:
+        return self._unpack("<h")
+
+    def long(self) -> int:
+        return self._unpack("<l")
+
+    def long_long(self) -> int:
+        return self._unpack("<Q")
+
+    def float(self) -> float:
+        return self._unpack("<f")
+
+    def char(self) -> str:
+        return chr(self.byte())
+
+    def string(self) -> str:
+        end = self.data.index(b"\x00", self.offset)
+        value = self.data[self.offset : end]  # noqa
+        self.offset = end + 1
+        return value.decode("utf8", errors="replace")
+
+    def remaining(self) -> int:
+        return len(self.data) - self.offset
+
+
+def _parse_info(reader: _Reader) -> Dict[str, Any]:
+    info = {
+        "protocol": reader.byte(),
+        "server_name": reader.string(),
+        "map": reader.string(),
+        "folder": reader.string(),
+        "game": reader.string(),
+        "app_id": reader.short(),
+        "player_count": reader.byte(),
+        "max_players": reader.byte(),
+        "bot_count": reader.byte(),
+    }
+    server_type = reader.char().lower()
+    platform = reader.char().lower()
+    info["server_type"] = SERVER_TYPES.get(server_type, server_type)
+    info["platform"] = PLATFORMS.get(platform, platform)
+    info["password_protected"] = bool(reader.byte())
+    info["vac_enabled"] = bool(reader.byte())
+
+    # The Ship has extra fields before the version
+    if info["app_id"] == 2400:
+        reader.offset += 3
+
+    info["version"] = reader.string()
+
+    if reader.remaining() > 0:
+        flags = reader.byte()
+        if flags & 0x80:
+            info["port"] = reader.short()
+        if flags & 0x10:
+            info["steam_id"] = reader.long_long()
+        if flags & 0x40:
+            info["spectator_port"] = reader.short()
+            info["spectator_name"] = reader.string()
+        if flags & 0x20:
+            info["keywords"] = reader.string()
+        if flags & 0x01:
+            info["game_id"] = reader.long_long()
+
+    return info
+
+
+def _parse_players(reader: _Reader) -> List[Dict[str, Any]]:
+    players = []
+    for _ in range(reader.byte()):
+        if reader.remaining() == 0:
+            break
+        players.append(
+            {
+                "index": reader.byte(),
+                "name": reader.string(),
+                "score": reader.long(),
+                "duration": reader.float(),
+            }
+        )
+    return players
+
+
+def _parse_rules(reader: _Reader) -> Dict[str, str]:
+    rules = {}
+    for _ in range(reader.short()):
+        if reader.remaining() == 0:
+            break
+        name = reader.string()
+        rules[name] = reader.string()
+    return rules
+
+
+_PARSERS = {
+    A2S_INFO: _parse_info,
+    A2S_PLAYERS: _parse_players,
+    A2S_RULES: _parse_rules,
+}
+
+
+def _request_packet(request: str, challenge: Optional[bytes]) -> bytes:
+    header = _REQUESTS[request][0]
+    if request == A2S_INFO:
+        return (
+            HEADER_SIMPLE
+            + header
+            + b"Source Engine Query\x00"
+            + (challenge or b"")
+        )
+    return HEADER_SIMPLE + header + (challenge or NO_CHALLENGE)
+
+
+class _Target:
+    """ request state for a single server """
+
+    def __init__(self, address: Address, requests: List[str]):
+        self.address = address
+        self.pending = list(requests)
+        self.results: Dict[str, Any] = {}
+
+        self.challenge: Optional[bytes] = None
+        self.challenges = 0
+        self.sent_at = 0.0
+        self._fragments: Dict[int, Dict[int, bytes]] = {}
+
+    @property
+    def done(self) -> bool:
+        return len(self.pending) == 0
+
+    @property
+    def packet(self) -> bytes:
+        return _request_packet(self.pending[0], self.challenge)
+
+    def _reassemble(self, data: bytes) -> Optional[bytes]:
+        reader = _Reader(data)
+        reader.offset = 4
+        packet_id = reader.long() & 0xFFFFFFFF
+        total = reader.byte()
+        number = reader.byte()
+        reader.offset += 2  # max packet size
+
+        fragments = self._fragments.setdefault(packet_id, {})
+        fragments[number] = data[reader.offset :]  # noqa
+        if len(fragments) < total:
+            return None
+
+        del self._fragments[packet_id]
+        payload = b"".join(fragments[i] for i in range(total))
+        if packet_id & 0x80000000:
+            # the first fragment of a compressed response is prefixed
+            # with the decompressed size and CRC32
+            payload = bz2.decompress(payload[8:])
+        return payload
+
+    def feed(self, data: bytes) -> bool:
+        """
+        handles a response packet. Returns True if the next request
+        should be sent
+        """
+
+        if self.done:
+            return False
+
+        if data[:4] == HEADER_SPLIT:
+            data = self._reassemble(data)
+            if data is None:
+                return False
+
+        if data[:4] != HEADER_SIMPLE or len(data) < 5:
+            return False
+
+        response = data[4]
+        request = self.pending[0]
+        if response == S2C_CHALLENGE:
+            self.challenges += 1
+            if self.challenges > _MAX_CHALLENGES:
+                self.pending.pop(0)
+                return not self.done
+            self.challenge = data[5:9]
+            return True
+
+        if response != _REQUESTS[request][1]:
+            return False
+
+        self.results[request] = _PARSERS[request](_Reader(data[5:]))
+        self.pending.pop(0)
+        self.challenges = 0
+        return not self.done
+
+
+def _resolve(address: Address) -> Optional[Address]:
+    try:
+        return (socket.gethostbyname(address[0]), int(address[1]))
+    except (OSError, ValueError):
+        return None
+
+
+def query_servers(
+    addresses: Iterable[Address],
+    requests: Iterable[str] = (A2S_INFO,),
+    timeout: float = 5.0,
+) -> Dict[Address, Dict[str, Any]]:
+    """
+    queries every server at once from a single UDP socket. All servers
+    share one deadline, so a batch takes at most timeout seconds no matter
+    how many servers do not respond. Results are keyed by the address
+    passed in and only contain the requests that were answered in time.
+    """
+
+    requests = list(requests)
+    results: Dict[Address, Dict[str, Any]] = {}
+    targets: Dict[Address, _Target] = {}
+    for address in addresses:
+        target = _Target(address, requests)
+        results[address] = target.results
+
+        resolved = _resolve(address)
+        if resolved is not None:
+            targets[resolved] = target
+
+    if len(targets) == 0 or len(requests) == 0:
+        return results
+
+    deadline = time.monotonic() + timeout
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.setblocking(False)
+
+        def send(resolved: Address, target: _Target):
+            target.sent_at = time.monotonic()
+            try:
+                sock.sendto(target.packet, resolved)
+            except OSError:
+                pass
+
+        for resolved, target in targets.items():
+            send(resolved, target)
+
+        with selectors.DefaultSelector() as selector:
+            selector.register(sock, selectors.EVENT_READ)
+            while True:
+                pending = [
+                    (r, t) for r, t in targets.items() if not t.done
+                ]
+                now = time.monotonic()
+                if len(pending) == 0 or now >= deadline:
+                    break
+
+                # UDP is lossy, so repeat requests that went unanswered
+                for resolved, target in pending:
+                    if now - target.sent_at >= _RETRY_INTERVAL:
+                        send(resolved, target)
+
+                wake = min(
+                    [t.sent_at + _RETRY_INTERVAL for _, t in pending]
+                    + [deadline]
+                )
+                if not selector.select(max(0.0, wake - now)):
+                    continue
+
+                while True:
+                    try:
+                        data, resolved = sock.recvfrom(65535)
+                    except BlockingIOError:
+                        break
+                    except OSError:
+                        continue
+
+                    target = targets.get(resolved[:2])
+                    if target is None:
+                        continue
+
+                    try:
+                        send_next = target.feed(data)
+                    except (struct.error, ValueError, OSError, EOFError):
+                        continue
+                    if send_next:
+                        send(resolved, target)
+
+    return results
+
+
+def query_info(
+    address: Address, timeout: float = 5.0
+) -> Optional[Dict[str, Any]]:
+    """ gets A2S_INFO for a single server or None if it did not respond """
+
+    return query_servers([address], timeout=timeout)[address].get(A2S_INFO)
+
+
+def ping(address: Address, timeout: float = 5.0) -> bool:
+    """ checks if a server responds to A2S_INFO """
+
+    return query_info(address, timeout=timeout) is not None
@@ -0,0 +1,339 @@
+import fcntl
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
+
+from gs_manager.utils import format_bytes
+
+__all__ = [
+    "BACKUP_FORMATS",
+    "BackupStats",
+    "ChunkRepository",
+    "iter_chunks",
+]
+
+BACKUP_FORMATS = ["tar", "chunks"]
+
+CHUNK_MIN_SIZE = 16 * 1024
+CHUNK_MAX_SIZE = 256 * 1024
+READ_SIZE = 4 * 1024 * 1024
+
+
+def _make_anchor(count: int = 2, seed: int = 0x6773) -> "re.Pattern":
+    """
+    chunk boundaries are placed after any of a fixed set of random byte
+    pairs, so they move with the content when data is inserted or removed.
+    With two pairs a boundary is found every 32 KB on average past the
+    minimum chunk size. Searching is done by the regex engine, which is
+    orders of magnitude faster than a rolling hash in Python. The seed must
+    never change or existing chunks will no longer match
+    """
+
+    rand = random.Random(seed)
+    pairs: Set[bytes] = set()
+    while len(pairs) < count:
+        pairs.add(bytes([rand.randrange(1, 255), rand.randrange(256)]))
+    return re.compile(b"|".join(re.escape(p) for p in sorted(pairs)))
+
+
+_ANCHOR = _make_anchor()
+
+
+def iter_chunks(
+    file_obj: BinaryIO,
+    min_size: int = CHUNK_MIN_SIZE,
+    max_size: int = CHUNK_MAX_SIZE,
+) -> Iterator[bytes]:
+    """ splits a file into content defined chunks """
+
+    buffer = bytearray()
+    start = 0
+    eof = False
+
+    while True:
+        if not eof and len(buffer) - start < max_size:
+            del buffer[:start]
+            start = 0
+            data = file_obj.read(READ_SIZE)
+            if data:
+                buffer += data
+            else:
+                eof = True
+            continue
+
+        if start >= len(buffer):
+            return
+
+        end = min(start + max_size, len(buffer))
+        match = _ANCHOR.search(buffer, start + min_size, end)
+        if match is not None:
+            end = match.end()
+
+        yield bytes(buffer[start:end])
+        start = end
+
+
+def _get_backup_name(snapshot_name: str) -> str:
+    return snapshot_name.rsplit("_", 1)[0]
+
+
+@dataclass
+class BackupStats:
+    files: int = 0
+    bytes: int = 0
+    # files that were unchanged since the last snapshot
+    unchanged: int = 0
+    chunks: int = 0
+    new_chunks: int = 0
+    # size of the new chunks after compression
+    bytes_written: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.files} file(s) ({format_bytes(self.bytes)}), "
+            f"{self.unchanged} unchanged, {self.new_chunks} of "
+            f"{self.chunks} chunk(s) new ({format_bytes(self.bytes_written)}"
+            " written)"
+        )
+
+
+class ChunkRepository:
+    """
+    deduplicated backup repository. Files are split into content defined
+    chunks, each chunk is stored once (compressed) under its sha256 and
+    every backup is a small JSON snapshot listing the chunks of its files.
+
+        <path>/chunks/ab/<sha256>
+        <path>/snapshots/<name>.json
+    """
+
+    def __init__(self, path: str, compress_level: int = 3):
+        self.path = os.path.abspath(path)
+        self.compress_level = compress_level
+        self.chunks_path = os.path.join(self.path, "chunks")
+        self.snapshots_path = os.path.join(self.path, "snapshots")
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        """ only one backup or prune may change the repository at once """
+
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _chunk_path(self, digest: str) -> str:
+        return os.path.join(self.chunks_path, digest[:2], digest[2:])
+
+    def has_chunk(self, digest: str) -> bool:
+        return os.path.isfile(self._chunk_path(digest))
+
+    def put_chunk(self, data: bytes) -> Tuple[str, int]:
+        """ stores a chunk, returns its digest and bytes written """
+
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._chunk_path(digest)
+        if os.path.isfile(path):
+            return digest, 0
+
+        compressed = zlib.compress(data, self.compress_level)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(compressed)
+        os.replace(f"{path}.tmp", path)
+        return digest, len(compressed)
+
+    def get_chunk(self, digest: str) -> bytes:
+        with open(self._chunk_path(digest), "rb") as f:
+            data = zlib.decompress(f.read())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"chunk {digest} is corrupt")
+        return data
+
+    @property
+    def snapshots(self) -> List[str]:
+        """ names of all snapshots, oldest first """
+
+        if not os.path.isdir(self.snapshots_path):
+            return []
+        return sorted(
+            name[:-5]
+            for name in os.listdir(self.snapshots_path)
+            if name.endswith(".json")
+        )
+
+    def _snapshot_path(self, name: str) -> str:
+        return os.path.join(self.snapshots_path, f"{name}.json")
+
+    def read_snapshot(self, name: str) -> dict:
+        with open(self._snapshot_path(name), "r") as f:
+            return json.load(f)
+
+    def _write_snapshot(self, name: str, snapshot: dict) -> None:
+        os.makedirs(self.snapshots_path, exist_ok=True)
+        path = self._snapshot_path(name)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(snapshot, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _add_file(
+        self,
+        path: str,
+        stat: os.stat_result,
+        previous: Optional[dict],
+        stats: BackupStats,
+    ) -> List[str]:
+        stats.files += 1
+        stats.bytes += stat.st_size
+
+        # unchanged files reuse the chunks of the last snapshot unread
+        if (
+            previous is not None
+            and previous["size"] == stat.st_size
+            and previous["mtime_ns"] == stat.st_mtime_ns
+            and all(self.has_chunk(d) for d in previous["chunks"])
+        ):
+            stats.unchanged += 1
+            stats.chunks += len(previous["chunks"])
+            return previous["chunks"]
+
+        chunks = []
+        with open(path, "rb") as f:
+            for data in iter_chunks(f):
+                digest, written = self.put_chunk(data)
+                chunks.append(digest)
+                stats.chunks += 1
+                if written > 0:
+                    stats.new_chunks += 1
+                    stats.bytes_written += written
+        return chunks
+
+    def backup(
+        self, name: str, paths: Dict[str, str], base: Optional[str] = None
+    ) -> BackupStats:
+        """
+        stores a snapshot of paths (archive name -> path on disk). Files
+        with the same size and mtime as in the base snapshot (the latest
+        one by default) are not read again
+        """
+
+        stats = BackupStats()
+        with self.lock():
+            if base is None and len(self.snapshots) > 0:
+                base = self.snapshots[-1]
+            previous_files = {}
+            if base is not None:
+                previous_files = self.read_snapshot(base)["files"]
+
+            files: Dict[str, dict] = {}
+            dirs: Dict[str, dict] = {}
+            links: Dict[str, str] = {}
+
+            def _add(arcname: str, path: str) -> None:
+                stat = os.lstat(path)
+                if os.path.islink(path):
+                    links[arcname] = os.readlink(path)
+                elif os.path.isdir(path):
+                    dirs[arcname] = {"mode": stat.st_mode & 0o7777}
+                    for child in sorted(os.listdir(path)):
+                        _add(f"{arcname}/{child}", os.path.join(path, child))
+                else:
+                    files[arcname] = {
+                        "size": stat.st_size,
+                        "mtime_ns": stat.st_mtime_ns,
+                        "mode": stat.st_mode & 0o7777,
+                        "chunks": self._add_file(
+                            path, stat, previous_files.get(arcname), stats
+                        ),
+                    }
+
+            for arcname, path in paths.items():
+                _add(arcname, path)
+
+            self._write_snapshot(
+                name,
+                {
+                    "version": 1,
+                    "created": time.time(),
+                    "files": files,
+                    "dirs": dirs,
+                    "links": links,
+                },
+            )
+        return stats
+
+    def restore(self, name: str, path: str) -> int:
+        """ rebuilds a snapshot in path, returns the number of files """
+
+        snapshot = self.read_snapshot(name)
+        for arcname in sorted(snapshot["dirs"]):
+            os.makedirs(os.path.join(path, arcname), exist_ok=True)
+        for arcname, target in snapshot["links"].items():
+            link_path = os.path.join(path, arcname)
+            os.makedirs(os.path.dirname(link_path), exist_ok=True)
+            os.symlink(target, link_path)
+
+        for arcname, info in snapshot["files"].items():
+            file_path = os.path.join(path, arcname)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "wb") as f:
+                for digest in info["chunks"]:
+                    f.write(self.get_chunk(digest))
+            os.chmod(file_path, info["mode"])
+            os.utime(file_path, ns=(info["mtime_ns"], info["mtime_ns"]))
+
+        for arcname, info in snapshot["dirs"].items():
+            os.chmod(os.path.join(path, arcname), info["mode"])
+        return len(snapshot["files"])
+
+    def prune(
+        self, max_age: float, backup_name: Optional[str] = None
+    ) -> List[str]:
+        """
+        deletes snapshots older than max_age seconds and the chunks no
+        remaining snapshot uses. Snapshots are named
+        <backup_name>_<timestamp>, only the snapshots of backup_name are
+        deleted if it is given and the latest snapshot of every backup is
+        always kept
+        """
+
+        removed = []
+        with self.lock():
+            now = time.time()
+            snapshots = self.snapshots
+            latest = {_get_backup_name(n): n for n in snapshots}
+            used: Set[str] = set()
+            for name in snapshots:
+                snapshot = self.read_snapshot(name)
+                snapshot_backup = _get_backup_name(name)
+                if (
+                    backup_name in (None, snapshot_backup)
+                    and latest[snapshot_backup] != name
+                    and snapshot["created"] < now - max_age
+                ):
+                    os.remove(self._snapshot_path(name))
+                    removed.append(name)
+                    continue
+                for info in snapshot["files"].values():
+                    used.update(info["chunks"])
+
+            if os.path.isdir(self.chunks_path):
+                for prefix in os.listdir(self.chunks_path):
+                    prefix_path = os.path.join(self.chunks_path, prefix)
+                    for name in os.listdir(prefix_path):
+                        if prefix + name not in used:
+                            os.remove(os.path.join(prefix_path, name))
+                    if len(os.listdir(prefix_path)) == 0:
+                        shutil.rmtree(prefix_path)
+        return removed
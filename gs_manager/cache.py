@@ -0,0 +1,165 @@
+import fcntl
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+__all__ = ["DEFAULT_CACHE_PATH", "ResultCache", "get_cache"]
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+    "gs_manager",
+    "cache.sqlite",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    updated REAL NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (namespace, key)
+)
+"""
+
+
+class ResultCache:
+    """
+    sqlite backed key/value store for query results that is shared between
+    gs_manager invocations. Entries are JSON and are only returned if they
+    are younger than the max_age given when reading them.
+
+    The cache is best effort, any database errors are treated as a miss.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            connection = sqlite3.connect(
+                self.path, timeout=1.0, isolation_level=None
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(_SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def get(self, namespace: str, key: str, max_age: float) -> Optional[Any]:
+        """ gets a cached value or None if missing or too old """
+
+        if max_age is None or max_age <= 0:
+            return None
+
+        try:
+            row = self.connection.execute(
+                "SELECT value FROM results "
+                "WHERE namespace = ? AND key = ? AND updated >= ?",
+                (namespace, key, time.time() - max_age),
+            ).fetchone()
+        except (OSError, sqlite3.Error):
+            return None
+
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def get_many(
+        self, namespace: str, keys: list, max_age: float
+    ) -> Dict[str, Any]:
+        """ gets all of the fresh cached values for a list of keys """
+
+        values = {}
+        for key in keys:
+            value = self.get(namespace, key, max_age)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def set(self, namespace: str, key: str, value: Any) -> None:
+        try:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results "
+                "(namespace, key, updated, value) VALUES (?, ?, ?, ?)",
+                (namespace, key, time.time(), json.dumps(value)),
+            )
+        except (OSError, sqlite3.Error):
+            pass
+
+    def delete(self, namespace: str, key: str) -> None:
+        try:
+            self.connection.execute(
+                "DELETE FROM results WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            )
+        except (OSError, sqlite3.Error):
+            pass
+
+    def purge(self, max_age: float) -> None:
+        """ removes every entry older than max_age """
+
+        try:
+            self.connection.execute(
+                "DELETE FROM results WHERE updated < ?",
+                (time.time() - max_age,),
+            )
+        except (OSError, sqlite3.Error):
+            pass
+
+    @contextmanager
+    def lock(self, namespace: str, key: str) -> Iterator[None]:
+        """
+        holds a host-wide lock for a key so only one process refreshes it
+        at a time while the others wait for its result
+        """
+
+        name = f"{namespace}-{key}".replace(os.sep, "_").replace(":", "_")
+        path = os.path.join(os.path.dirname(self.path), f"{name}.lock")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            lock_file = open(path, "a")
+        except OSError:
+            yield
+            return
+
+        with lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+_caches: Dict[str, ResultCache] = {}
+
+
+def get_cache(path: Optional[str] = None) -> ResultCache:
+    """ gets the shared cache for a path """
+
+    path = os.path.abspath(os.path.expanduser(path or DEFAULT_CACHE_PATH))
+    if path not in _caches:
+        _caches[path] = ResultCache(path)
+    return _caches[path]
+
+
+def _forget_caches() -> None:
+    # sqlite connections must not be used across a fork
+    _caches.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_caches)
@@ -142,6 +142,18 @@ class BaseConfig:
             context.params, ignore_unknown=True, ignore_bool=True
         )
 
+        # --option/--no-option flags are None unless they were passed, so
+        # False turns off an option that defaults to True
+        switches = {
+            param.name: context.params[param.name]
+            for param in context.command.params
+            if isinstance(param, click.Option)
+            and param.is_flag
+            and param.secondary_opts
+            and context.params.get(param.name) is not None
+        }
+        self._update_config_from_dict(switches, ignore_unknown=True)
+
     def update_config(self, data: Union[dict, click.Context]) -> None:
         if isinstance(data, click.Context):
             self._update_config_from_context(data)
@@ -0,0 +1,192 @@
+import gzip
+import lzma
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Callable, Deque, Optional
+
+import click
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+__all__ = [
+    "COMPRESSIONS",
+    "EXTENSIONS",
+    "CompressWriter",
+    "default_threads",
+    "detect_compression",
+    "get_compressor",
+    "open_decompressed",
+]
+
+COMPRESSIONS = ["zstd", "lz4", "gzip", "xz", "none"]
+EXTENSIONS = {
+    "zstd": ".zst",
+    "lz4": ".lz4",
+    "gzip": ".gz",
+    "xz": ".xz",
+    "none": "",
+}
+DEFAULT_LEVELS = {"zstd": 3, "lz4": 0, "gzip": 6, "xz": 6}
+
+BLOCK_SIZE = 4 * 1024 * 1024
+
+_MAGIC = [
+    (b"\x1f\x8b", "gzip"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"\x28\xb5\x2f\xfd", "zstd"),
+    (b"\x04\x22\x4d\x18", "lz4"),
+]
+
+
+def _require(compression: str) -> None:
+    if compression == "zstd" and zstandard is None:
+        raise click.ClickException(
+            "zstd compression requires the zstandard package"
+        )
+    if compression == "lz4" and lz4_frame is None:
+        raise click.ClickException("lz4 compression requires the lz4 package")
+
+
+def get_compressor(
+    compression: str, level: Optional[int] = None
+) -> Callable[[bytes], bytes]:
+    """
+    gets a function that compresses a block into a complete, standalone
+    frame. Frames can be concatenated and still decompress as one stream
+    """
+
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"invalid compression: {compression}")
+    _require(compression)
+    if level is None:
+        level = DEFAULT_LEVELS.get(compression)
+
+    if compression == "zstd":
+        return lambda data: zstandard.ZstdCompressor(level=level).compress(
+            data
+        )
+    elif compression == "lz4":
+        return lambda data: lz4_frame.compress(data, compression_level=level)
+    elif compression == "gzip":
+        return lambda data: gzip.compress(data, compresslevel=level, mtime=0)
+    elif compression == "xz":
+        return lambda data: lzma.compress(data, preset=level)
+    return bytes
+
+
+class CompressWriter:
+    """
+    file object that compresses everything written to it in blocks on a
+    thread pool (all of the compressors release the GIL) and writes the
+    compressed frames in order. At most two blocks per thread are held in
+    memory at once
+    """
+
+    def __init__(
+        self,
+        file_obj: BinaryIO,
+        compression: str = "gzip",
+        level: Optional[int] = None,
+        threads: Optional[int] = None,
+        block_size: int = BLOCK_SIZE,
+    ):
+        self.file_obj = file_obj
+        self.threads = threads or 1
+        self.block_size = block_size
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+        self._compress = get_compressor(compression, level)
+        self._buffer = bytearray()
+        self._pending: Deque[Future] = deque()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if self.threads > 1:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.threads, thread_name_prefix="compress"
+            )
+
+    def _write(self, data: bytes) -> None:
+        self.file_obj.write(data)
+        self.bytes_out += len(data)
+
+    def _submit(self, block: bytes) -> None:
+        self.bytes_in += len(block)
+        if self._executor is None:
+            self._write(self._compress(block))
+            return
+
+        if len(self._pending) >= self.threads * 2:
+            self._write(self._pending.popleft().result())
+        self._pending.append(self._executor.submit(self._compress, block))
+
+    def write(self, data: bytes) -> int:
+        size = self.block_size
+        self._buffer += data
+        while len(self._buffer) >= size:
+            self._submit(bytes(self._buffer[:size]))
+            del self._buffer[:size]
+        return len(data)
+
+    def close(self) -> None:
+        try:
+            if len(self._buffer) > 0:
+                self._submit(bytes(self._buffer))
+                self._buffer = bytearray()
+            while self._pending:
+                self._write(self._pending.popleft().result())
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def __enter__(self) -> "CompressWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def detect_compression(path: str) -> str:
+    """ detects the compression of a file from its magic bytes """
+
+    with open(path, "rb") as f:
+        magic = f.read(6)
+
+    for prefix, compression in _MAGIC:
+        if magic.startswith(prefix):
+            return compression
+    return "none"
+
+
+def open_decompressed(path: str) -> BinaryIO:
+    """ opens a file for reading, decompressing it if needed """
+
+    compression = detect_compression(path)
+    _require(compression)
+
+    if compression == "zstd":
+        return zstandard.ZstdDecompressor().stream_reader(
+            open(path, "rb"), read_across_frames=True, closefd=True
+        )
+    elif compression == "lz4":
+        return lz4_frame.open(path, "rb")
+    elif compression == "gzip":
+        return gzip.open(path, "rb")
+    elif compression == "xz":
+        return lzma.open(path, "rb")
+    return open(path, "rb")
+
+
+def default_threads() -> int:
+    """ leaves half of the CPUs for the game servers """
+
+    return max(1, (os.cpu_count() or 1) // 2)
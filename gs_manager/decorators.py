@@ -1,11 +1,10 @@
-import time
-from functools import update_wrapper
-from multiprocessing import Process
-from typing import Callable, List
+from functools import partial, update_wrapper
+from typing import Callable, List, Optional
 
 import click
 
-from gs_manager.utils import get_param_obj, surpress_stdout
+from gs_manager.executor import ParallelExecutor, SyncExecutor
+from gs_manager.utils import get_param_obj
 
 
 def require(param: str):
@@ -107,31 +106,6 @@ def _instance_wrapper(command: click.Command, multi_callback: Callable):
     return _wrapper
 
 
-def _run_sync(
-    callback: Callable, instance_names: List[str], *args, **kwargs
-) -> List[int]:
-    """ runs command for each instance synchronously """
-    from gs_manager.servers import BaseServer
-
-    context = click.get_current_context()
-    server: BaseServer = context.obj
-    results = []
-
-    for instance_name in instance_names:
-        server.logger.debug(
-            f"running {context.command.name} for instance: {instance_name}"
-        )
-
-        server.set_instance(instance_name, multi_instance=True)
-        server.logger.success(f"{server.server_name}:")
-        result = callback(*args, **kwargs)
-        results.append(result)
-
-    server.set_instance(None, multi_instance=False)
-
-    return results
-
-
 def _run_parallel(
     callback: Callable, instance_names: List[str], *args, **kwargs
 ) -> List[int]:
@@ -140,7 +114,7 @@ def _run_parallel(
 
     context = click.get_current_context()
     server: BaseServer = context.obj
-    processes = []
+    max_parallel = server.config.max_parallel
 
     if len(instance_names) == len(server.config.all_instance_names):
         instance_str = "@all"
@@ -152,45 +126,14 @@ def _run_parallel(
         f"{server.config.name} {instance_str}..."
     )
 
-    # create process for each instances
-    for instance_name in instance_names:
-        server.logger.debug(
-            f"spawning {context.command.name} for instance: {instance_name}"
-        )
-
-        def callback_wrapper(*args, **kwargs):
-            server.set_instance(instance_name)
-            return callback(*args, **kwargs)
-
-        p = Process(
-            target=surpress(callback_wrapper), args=args, kwargs=kwargs, daemon=True,
-        )
-        p.start()
-        processes.append(p)
-
-    bar = click.progressbar(
-        length=len(processes), show_eta=False, show_pos=True
-    )
-
-    completed = None
-    previous_completed = 0
-    not_done = True
-    while not_done:
-        server.logger.debug("processes: {}".format(processes))
-        alive_list = [p.is_alive() for p in processes]
-        server.logger.debug("processes alive: {}".format(alive_list))
-        not_done = any(alive_list)
-        completed = sum([int(not c) for c in alive_list])
-
-        bar.update(completed - previous_completed)
-        previous_completed = completed
-        time.sleep(1)
+    executor = ParallelExecutor(context.command.name, max_parallel)
+    results = executor.run(callback, instance_names, *args, **kwargs)
 
     server.logger.success(
-        f"\n{context.command.name} {server.config.name} "
+        f"{context.command.name} {server.config.name} "
         f"{instance_str} completed"
     )
-    return [p.exitcode for p in processes]
+    return results
 
 
 def single_instance(command: click.Command):
@@ -211,11 +154,21 @@ def single_instance(command: click.Command):
     return command
 
 
-def multi_instance(command: click.Command):
+def multi_instance(
+    command: Optional[click.Command] = None, gather: Optional[str] = None
+):
     """
     decorator for a click command to allow multiple instances to be passed in
+
+    gather is the name of a server method that runs the command for every
+    instance at once instead of one instance at a time. It is called with
+    the instance names and the command's arguments and returns a status
+    code for each instance
     """
 
+    if command is None:
+        return partial(multi_instance, gather=gather)
+
     original_command = command.callback
 
     def multi_callback(instance_names: List[str], *args, **kwargs):
@@ -234,12 +187,14 @@ def multi_instance(command: click.Command):
                 "cannot use @ options with the --foreground option"
             )
 
-        if context.params.get("parallel"):
+        if gather is not None:
+            results = getattr(server, gather)(instance_names, *args, **kwargs)
+        elif context.params.get("parallel"):
             results = _run_parallel(
                 original_command, instance_names, *args, **kwargs
             )
         else:
-            results = _run_sync(
+            results = SyncExecutor(context.command.name).run(
                 original_command, instance_names, *args, **kwargs
             )
 
@@ -265,16 +220,3 @@ def multi_instance(command: click.Command):
     wrapper_function = _instance_wrapper(original_command, multi_callback)
     command.callback = update_wrapper(wrapper_function, original_command)
     return command
-
-
-def surpress(function):
-    """
-    decorator to surpress all stdout for a method
-    """
-
-    def _wrapper(*args, **kwargs):
-        with surpress_stdout():
-            result = function(*args, **kwargs)
-        exit(result)
-
-    return _wrapper
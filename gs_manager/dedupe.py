@@ -0,0 +1,306 @@
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, Optional, Set, Tuple
+
+import click
+
+from gs_manager.cache import ResultCache
+from gs_manager.releases import reflink
+from gs_manager.utils import format_bytes, hash_file
+
+__all__ = [
+    "DEDUPE_MODES",
+    "DedupeReport",
+    "DedupeStore",
+    "get_default_store_path",
+]
+
+DEDUPE_MODES = ["reflink", "hardlink"]
+
+# hashes are cached by inode, size and mtime so they never expire
+HASH_MAX_AGE = 10 * 365 * 24 * 60 * 60
+TMP_SUFFIX = ".gs-dedupe"
+
+
+@dataclass
+class DedupeReport:
+    files: int = 0
+    bytes: int = 0
+    # files/bytes linked to the store by this run
+    linked: int = 0
+    bytes_saved: int = 0
+    # files/bytes that were already shared with the store
+    shared: int = 0
+    bytes_shared: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.files} file(s) ({format_bytes(self.bytes)}) checked, "
+            f"{self.linked} deduplicated saving "
+            f"{format_bytes(self.bytes_saved)}, {self.shared} already "
+            f"shared ({format_bytes(self.bytes_shared)})"
+        )
+
+
+class DedupeStore:
+    """
+    content addressed store of game files shared by every install on the
+    same filesystem. Identical files in installs are replaced by reflinks
+    (copy-on-write clones, so installs stay writable) or hardlinks of a
+    single store object.
+
+    A hardlinked file is the same file in every install and in the store,
+    so anything writing to it in place changes all of them. Hardlinked
+    files must be unshared before steamcmd patches them (see unshare_tree)
+    and paths the server itself writes to (saves, logs, configs) must be
+    excluded from add_tree.
+
+    The files of each named install are recorded in a manifest, so new
+    installs can be seeded from the store with seed_tree.
+    """
+
+    def __init__(
+        self, path: str, mode: str = "reflink", min_size: int = 64 * 1024
+    ):
+        if mode not in DEDUPE_MODES:
+            raise ValueError(f"invalid dedupe mode: {mode}")
+
+        self.path = os.path.abspath(path)
+        self.mode = mode
+        self.min_size = min_size
+        self.objects_path = os.path.join(self.path, "objects")
+        self.manifests_path = os.path.join(self.path, "manifests")
+        self.index = ResultCache(os.path.join(self.path, "index.sqlite"))
+
+    def object_path(self, digest: str, mode: int) -> str:
+        # the file mode is part of the key since hardlinks share it
+        return os.path.join(
+            self.objects_path, digest[:2], f"{digest[2:]}-{mode & 0o7777:o}"
+        )
+
+    def _file_hash(self, path: str, stat: os.stat_result) -> str:
+        key = f"{stat.st_dev}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+        digest = self.index.get("sha256", key, HASH_MAX_AGE)
+        if digest is None:
+            digest = hash_file(path)
+            self.index.set("sha256", key, digest)
+        return digest
+
+    def _clone(self, src: str, dst: str) -> None:
+        try:
+            if self.mode == "hardlink":
+                os.link(src, dst)
+            else:
+                reflink(src, dst)
+        except OSError as ex:
+            if os.path.lexists(dst):
+                os.remove(dst)
+            raise click.ClickException(
+                f"could not {self.mode} {src} to {dst}: {ex.strerror}. The "
+                "store must be on the same filesystem as the install"
+                + (
+                    " and the filesystem must support reflinks"
+                    if self.mode == "reflink"
+                    else ""
+                )
+            )
+
+    def _replace(self, object_path: str, path: str, stat: os.stat_result):
+        tmp_path = path + TMP_SUFFIX
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+
+        self._clone(object_path, tmp_path)
+        if self.mode == "reflink":
+            shutil.copystat(path, tmp_path)
+
+        # do not replace a file that was written while it was hashed
+        current = os.lstat(path)
+        if (current.st_size, current.st_mtime_ns) != (
+            stat.st_size,
+            stat.st_mtime_ns,
+        ):
+            os.remove(tmp_path)
+            return False
+
+        os.replace(tmp_path, path)
+        return True
+
+    def _files(
+        self, tree: str, exclude: Iterable[str] = ()
+    ) -> Iterator[Tuple[str, os.stat_result]]:
+        skip = set([self.path])
+        skip.update(os.path.abspath(os.path.join(tree, e)) for e in exclude)
+
+        for root, dirs, names in os.walk(tree):
+            if os.path.abspath(root) in skip:
+                dirs[:] = []
+                continue
+            for name in names:
+                path = os.path.join(root, name)
+                if name.endswith(TMP_SUFFIX) or os.path.islink(path):
+                    continue
+                stat = os.lstat(path)
+                if stat.st_size >= self.min_size:
+                    yield path, stat
+
+    def _manifest_path(self, name: str) -> str:
+        return os.path.join(self.manifests_path, f"{name}.json")
+
+    def _write_manifest(self, name: str, files: Dict[str, str]) -> None:
+        os.makedirs(self.manifests_path, exist_ok=True)
+        path = self._manifest_path(name)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"version": 1, "files": files}, f)
+        os.replace(f"{path}.tmp", path)
+
+    def read_manifest(self, name: str) -> Dict[str, str]:
+        """ files of a named install, relative path -> store object """
+
+        try:
+            with open(self._manifest_path(name), "r") as f:
+                return json.load(f)["files"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return {}
+
+    def add_tree(
+        self,
+        tree: str,
+        name: Optional[str] = None,
+        exclude: Iterable[str] = (),
+    ) -> DedupeReport:
+        """
+        deduplicates every file in a tree against the store. Paths in
+        exclude (relative to tree) are skipped. With a name, the files in
+        the store are recorded so seed_tree can rebuild the install
+        """
+
+        report = DedupeReport()
+        files: Dict[str, str] = {}
+        for path, stat in self._files(tree, exclude):
+            report.files += 1
+            report.bytes += stat.st_size
+
+            abs_path = os.path.abspath(path)
+            digest = self._file_hash(path, stat)
+            object_path = self.object_path(digest, stat.st_mode)
+            files[os.path.relpath(path, tree)] = os.path.relpath(
+                object_path, self.objects_path
+            )
+
+            try:
+                object_stat = os.lstat(object_path)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                self._clone(path, object_path)
+                if self.mode == "reflink":
+                    self.index.set("linked", abs_path, digest)
+                continue
+
+            if (object_stat.st_dev, object_stat.st_ino) == (
+                stat.st_dev,
+                stat.st_ino,
+            ) or self.index.get("linked", abs_path, HASH_MAX_AGE) == digest:
+                report.shared += 1
+                report.bytes_shared += stat.st_size
+                continue
+
+            if self._replace(object_path, path, stat):
+                report.linked += 1
+                report.bytes_saved += stat.st_size
+                if self.mode == "reflink":
+                    # reflinks do not share an inode, remember the link
+                    self.index.set("linked", abs_path, digest)
+
+        if name is not None:
+            self._write_manifest(name, files)
+        return report
+
+    def seed_tree(self, name: str, tree: str) -> DedupeReport:
+        """
+        links the files of a named install from the store into tree, so
+        steamcmd only has to download what the store does not have. Files
+        that already exist in tree are left alone
+        """
+
+        report = DedupeReport()
+        for rel_path, object_name in self.read_manifest(name).items():
+            path = os.path.join(tree, rel_path)
+            object_path = os.path.join(self.objects_path, object_name)
+            if os.path.lexists(path) or not os.path.isfile(object_path):
+                continue
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._clone(object_path, path)
+
+            size = os.lstat(path).st_size
+            report.files += 1
+            report.bytes += size
+            report.linked += 1
+            report.bytes_saved += size
+            if self.mode == "reflink":
+                prefix, rest = os.path.split(object_name)
+                digest = prefix + rest.rsplit("-", 1)[0]
+                self.index.set("linked", os.path.abspath(path), digest)
+        return report
+
+    def _object_inodes(self) -> Set[Tuple[int, int]]:
+        inodes = set()
+        for root, _, names in os.walk(self.objects_path):
+            for name in names:
+                stat = os.lstat(os.path.join(root, name))
+                inodes.add((stat.st_dev, stat.st_ino))
+        return inodes
+
+    def unshare_tree(self, tree: str) -> int:
+        """
+        gives every file in a tree that is hardlinked to a store object its
+        own copy again so it can be safely written to in place. Hardlinks
+        that did not come from the store (such as mod store links) are left
+        alone. Returns the number of files copied
+        """
+
+        copied = 0
+        inodes = self._object_inodes()
+        for path, stat in self._files(tree):
+            if (
+                stat.st_nlink < 2
+                or (stat.st_dev, stat.st_ino) not in inodes
+            ):
+                continue
+
+            tmp_path = path + TMP_SUFFIX
+            shutil.copy2(path, tmp_path)
+            os.replace(tmp_path, path)
+            copied += 1
+        return copied
+
+    def gc(self) -> int:
+        """
+        removes hardlinked objects no install uses anymore. Returns the
+        number of objects removed
+        """
+
+        removed = 0
+        if self.mode != "hardlink" or not os.path.isdir(self.objects_path):
+            return removed
+
+        for root, _, names in os.walk(self.objects_path):
+            for name in names:
+                path = os.path.join(root, name)
+                if os.lstat(path).st_nlink == 1:
+                    os.remove(path)
+                    removed += 1
+        return removed
+
+    def close(self) -> None:
+        self.index.close()
+
+
+def get_default_store_path(server_path: str) -> str:
+    """ store next to the install, so it is on the same filesystem """
+
+    parent = os.path.dirname(os.path.abspath(server_path).rstrip(os.sep))
+    return os.path.join(parent, ".gs_manager_store")
@@ -0,0 +1,248 @@
+import multiprocessing
+import os
+import queue
+import sys
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent import futures
+from multiprocessing.connection import wait
+from typing import Any, Callable, Dict, List, Optional
+
+import click
+
+__all__ = [
+    "InstanceExecutor",
+    "SyncExecutor",
+    "ParallelExecutor",
+    "run_jobs",
+]
+
+
+class InstanceExecutor(ABC):
+    """ runs a command callback for a list of instances """
+
+    def __init__(self, command_name: str):
+        self.command_name = command_name
+
+    @property
+    def server(self):
+        return click.get_current_context().obj
+
+    @abstractmethod
+    def run(
+        self, callback: Callable, instance_names: List[str], *args, **kwargs
+    ) -> List[int]:
+        """ runs callback for each instance, returns their status codes """
+
+
+class SyncExecutor(InstanceExecutor):
+    """ runs command for each instance synchronously """
+
+    def run(
+        self, callback: Callable, instance_names: List[str], *args, **kwargs
+    ) -> List[int]:
+        server = self.server
+        results = []
+
+        for instance_name in instance_names:
+            server.logger.debug(
+                f"running {self.command_name} for instance: {instance_name}"
+            )
+
+            server.set_instance(instance_name, multi_instance=True)
+            server.logger.success(f"{server.server_name}:")
+            result = callback(*args, **kwargs)
+            results.append(result)
+
+        server.set_instance(None, multi_instance=False)
+
+        return results
+
+
+class _Worker:
+    def __init__(self, index: int, instance_name: str):
+        self.index = index
+        self.instance_name = instance_name
+        self.process: Optional[multiprocessing.Process] = None
+        self.reader: Optional[int] = None
+        self.buffer = b""
+
+
+def _run_worker(
+    write_fd: int,
+    server,
+    instance_name: str,
+    callback: Callable,
+    args: tuple,
+    kwargs: dict,
+) -> None:
+    # point stdout/stderr (and anything spawned from here) at the pipe
+    os.dup2(write_fd, 1)
+    os.dup2(write_fd, 2)
+    os.close(write_fd)
+    sys.stdout = os.fdopen(1, "w", buffering=1, closefd=False)
+    sys.stderr = sys.stdout
+
+    server.set_instance(instance_name)
+    exit(callback(*args, **kwargs))
+
+
+class ParallelExecutor(InstanceExecutor):
+    """
+    runs command for instances in worker processes, at most max_parallel
+    at a time, and streams each worker's output prefixed with its instance
+    """
+
+    def __init__(self, command_name: str, max_parallel: Optional[int] = None):
+        super().__init__(command_name)
+        if max_parallel is not None and max_parallel < 1:
+            max_parallel = None
+        self.max_parallel = max_parallel
+
+        self._width = 0
+
+    def _echo(self, worker: _Worker, data: bytes) -> None:
+        line = data.decode(sys.getdefaultencoding(), errors="replace")
+        click.echo(f"{worker.instance_name:<{self._width}} | {line.rstrip()}")
+
+    def _read(self, worker: _Worker, drain: bool = False) -> None:
+        while worker.reader is not None:
+            try:
+                data = os.read(worker.reader, 65536)
+            except BlockingIOError:
+                data = None
+
+            if not data:
+                if data is not None or drain:
+                    if worker.buffer:
+                        self._echo(worker, worker.buffer)
+                        worker.buffer = b""
+                    os.close(worker.reader)
+                    worker.reader = None
+                return
+
+            lines = (worker.buffer + data).split(b"\n")
+            worker.buffer = lines.pop()
+            for line in lines:
+                self._echo(worker, line)
+
+            if not drain:
+                return
+
+    def _start(
+        self,
+        worker: _Worker,
+        callback: Callable,
+        args: tuple,
+        kwargs: dict,
+    ) -> None:
+        self.server.logger.debug(
+            f"spawning {self.command_name} for instance: "
+            f"{worker.instance_name}"
+        )
+
+        read_fd, write_fd = os.pipe()
+        # closures are passed to the worker, so fork is required
+        context = multiprocessing.get_context("fork")
+        worker.process = context.Process(
+            target=_run_worker,
+            args=(
+                write_fd,
+                self.server,
+                worker.instance_name,
+                callback,
+                args,
+                kwargs,
+            ),
+            daemon=True,
+        )
+        worker.process.start()
+
+        os.close(write_fd)
+        os.set_blocking(read_fd, False)
+        worker.reader = read_fd
+
+    def run(
+        self, callback: Callable, instance_names: List[str], *args, **kwargs
+    ) -> List[int]:
+        server = self.server
+        workers = [_Worker(i, n) for i, n in enumerate(instance_names)]
+        pending = deque(workers)
+        running: Dict[int, _Worker] = {}
+        results = [None] * len(workers)
+
+        self._width = max([len(n) for n in instance_names] + [0])
+        limit = self.max_parallel or len(workers)
+
+        while pending or running:
+            while pending and len(running) < limit:
+                worker = pending.popleft()
+                self._start(worker, callback, args, kwargs)
+                running[worker.process.sentinel] = worker
+
+            readers = {
+                w.reader: w for w in running.values() if w.reader is not None
+            }
+            ready = wait(list(running.keys()) + list(readers.keys()))
+
+            for item in ready:
+                if item in readers and readers[item].reader is not None:
+                    self._read(readers[item])
+
+            for item in ready:
+                if item not in running:
+                    continue
+
+                worker = running.pop(item)
+                worker.process.join()
+                self._read(worker, drain=True)
+
+                results[worker.index] = worker.process.exitcode
+                server.logger.debug(
+                    f"{worker.instance_name} exited with "
+                    f"{worker.process.exitcode}"
+                )
+
+        return results
+
+
+def run_jobs(
+    function: Callable[[Any, Callable[[int], None]], Any],
+    items: List[Any],
+    max_workers: Optional[int] = None,
+    on_progress: Optional[Callable[[int], None]] = None,
+) -> Dict[Any, Optional[BaseException]]:
+    """
+    runs function(item, report) for each item on a thread pool. Workers
+    call report(amount) as they make progress, on_progress gets those
+    amounts on the calling thread. A failed item does not stop the others,
+    returns the exception each item raised (None if it succeeded)
+    """
+
+    progress: queue.SimpleQueue = queue.SimpleQueue()
+    results: Dict[Any, Optional[BaseException]] = {}
+
+    def _drain():
+        while True:
+            try:
+                amount = progress.get_nowait()
+            except queue.Empty:
+                return
+            if on_progress is not None:
+                on_progress(amount)
+
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {
+            executor.submit(function, item, progress.put): item
+            for item in items
+        }
+        while pending:
+            done, _ = futures.wait(
+                pending, timeout=0.1, return_when=futures.FIRST_COMPLETED
+            )
+            _drain()
+            for future in done:
+                results[pending.pop(future)] = future.exception()
+    _drain()
+
+    return results
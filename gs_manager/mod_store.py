@@ -0,0 +1,146 @@
+import fcntl
+import os
+import shutil
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+
+from gs_manager.releases import clone_file, clone_tree
+from gs_manager.ue4 import unpack_tree
+
+__all__ = ["MOD_STORE_MODES", "ModStore"]
+
+MOD_STORE_MODES = ["symlink", "hardlink"]
+
+
+class ModStore:
+    """
+    host-wide store of extracted workshop items, keyed by mod ID and the
+    time the item was last updated. Each version is extracted once and
+    every server_path links to it, so servers running the same mods share
+    the files on disk and in the page cache.
+
+        <path>/<mod_id>/<time_updated>/      extracted mod
+        <path>/<mod_id>/<time_updated>.mod   .mod file, written last
+    """
+
+    def __init__(
+        self, path: str, mode: str = "symlink", clone_mode: str = "hardlink"
+    ):
+        if mode not in MOD_STORE_MODES:
+            raise ValueError(f"invalid mod store mode: {mode}")
+
+        self.path = os.path.abspath(path)
+        self.mode = mode
+        self.clone_mode = clone_mode
+
+    def get_path(self, mod_id: str, time_updated: int) -> str:
+        return os.path.join(self.path, str(mod_id), str(time_updated))
+
+    def get_mod_file(self, mod_id: str, time_updated: int) -> str:
+        return f"{self.get_path(mod_id, time_updated)}.mod"
+
+    def versions(self, mod_id: str) -> List[int]:
+        """ complete versions of a mod in the store, oldest first """
+
+        mod_store = os.path.join(self.path, str(mod_id))
+        if not os.path.isdir(mod_store):
+            return []
+
+        versions = []
+        for name in os.listdir(mod_store):
+            version = name[:-4]
+            if name.endswith(".mod") and version.isdigit():
+                versions.append(int(version))
+        return sorted(versions)
+
+    @contextmanager
+    def lock(self, mod_id: str) -> Iterator[None]:
+        """ holds a host-wide lock while a mod is added to the store """
+
+        mod_store = os.path.join(self.path, str(mod_id))
+        os.makedirs(mod_store, exist_ok=True)
+        with open(os.path.join(mod_store, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def add(
+        self,
+        mod_id: str,
+        time_updated: int,
+        src_dir: str,
+        create_mod_file: Callable[[str, str], bool],
+        threads: Optional[int] = None,
+        report: Optional[Callable[[int], None]] = None,
+    ) -> bool:
+        """
+        extracts a workshop item into the store unless that version is
+        already there. The newest older version is hardlinked in first so
+        only the files that changed are unpacked. Returns if the mod was
+        extracted
+        """
+
+        store_path = self.get_path(mod_id, time_updated)
+        mod_file = self.get_mod_file(mod_id, time_updated)
+
+        with self.lock(mod_id):
+            if os.path.isfile(mod_file):
+                return False
+
+            tmp_path = f"{store_path}.tmp"
+            tmp_mod_file = f"{mod_file}.tmp"
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+            previous = [v for v in self.versions(mod_id) if v < time_updated]
+            if len(previous) > 0:
+                clone_tree(
+                    self.get_path(mod_id, previous[-1]), tmp_path, "hardlink"
+                )
+
+            unpack_tree(
+                src_dir,
+                tmp_path,
+                mode=self.clone_mode,
+                threads=threads,
+                report=report,
+            )
+            if not create_mod_file(tmp_path, tmp_mod_file):
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                raise ValueError("could not create .mod file")
+
+            shutil.rmtree(store_path, ignore_errors=True)
+            os.rename(tmp_path, store_path)
+            os.rename(tmp_mod_file, mod_file)
+        return True
+
+    def link(
+        self, mod_id: str, time_updated: int, mod_dir: str, mod_file: str
+    ) -> None:
+        """ points a server's mod directory and .mod file at the store """
+
+        store_path = self.get_path(mod_id, time_updated)
+
+        if os.path.islink(mod_dir):
+            if self.mode == "hardlink":
+                os.remove(mod_dir)
+        elif os.path.isdir(mod_dir):
+            shutil.rmtree(mod_dir)
+
+        if self.mode == "symlink":
+            tmp_link = f"{mod_dir}.tmp-link"
+            if os.path.lexists(tmp_link):
+                os.remove(tmp_link)
+            os.symlink(store_path, tmp_link)
+            os.replace(tmp_link, mod_dir)
+        else:
+            clone_tree(store_path, mod_dir, "hardlink")
+
+        tmp_mod_file = f"{mod_file}.tmp"
+        if os.path.lexists(tmp_mod_file):
+            os.remove(tmp_mod_file)
+        clone_file(
+            self.get_mod_file(mod_id, time_updated), tmp_mod_file, "hardlink"
+        )
+        os.replace(tmp_mod_file, mod_file)
@@ -0,0 +1,138 @@
+import os
+import re
+import shlex
+import time
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+import psutil
+
+__all__ = ["ProcessEntry", "ProcessIndex", "get_process_index"]
+
+# `sh -c "<command>"`, `bash -ec "<command>"`, etc.
+_SHELL_FLAGS = re.compile(r"^-[a-z]*c$")
+
+
+@dataclass
+class ProcessEntry:
+    pid: int
+    ppid: int
+    cmdline: List[str]
+    create_time: float
+
+    @property
+    def command(self) -> str:
+        return " ".join(self.cmdline)
+
+
+def _normalize_command(command: str) -> str:
+    try:
+        args = shlex.split(command)
+    except ValueError:
+        args = command.split()
+    return " ".join(args).strip().lower()
+
+
+class ProcessIndex:
+    """ single snapshot of the process table that can be queried in memory """
+
+    created: float
+    _entries: List[ProcessEntry]
+
+    def __init__(self, entries: Iterable[ProcessEntry]):
+        self.created = time.monotonic()
+        self._entries = sorted(
+            entries, key=lambda e: (e.create_time, e.pid)
+        )
+
+    @classmethod
+    def snapshot(cls) -> "ProcessIndex":
+        own_pid = os.getpid()
+        entries = []
+        for process in psutil.process_iter(
+            ["pid", "ppid", "cmdline", "create_time"]
+        ):
+            info = process.info
+            if info["pid"] == own_pid or not info["cmdline"]:
+                continue
+            entries.append(
+                ProcessEntry(
+                    pid=info["pid"],
+                    ppid=info["ppid"] or 0,
+                    cmdline=info["cmdline"],
+                    create_time=info["create_time"] or 0.0,
+                )
+            )
+        return cls(entries)
+
+    @property
+    def entries(self) -> List[ProcessEntry]:
+        return self._entries
+
+    def get(self, pid: int) -> Optional[ProcessEntry]:
+        for entry in self._entries:
+            if entry.pid == pid:
+                return entry
+        return None
+
+    def children(self, pid: int) -> List[ProcessEntry]:
+        return [e for e in self._entries if e.ppid == pid]
+
+    def find_command(self, command: str) -> List[ProcessEntry]:
+        """
+        processes whose command line ends with command, oldest first.
+        Processes that are running command themselves come before wrappers
+        such as screen, and shells running it with -c are skipped
+        """
+
+        command = _normalize_command(command)
+        if command == "":
+            return []
+
+        own, wrappers = [], []
+        for entry in self._entries:
+            entry_command = entry.command.strip().lower()
+            if not entry_command.endswith(command):
+                continue
+
+            prefix = entry_command[: -len(command)]
+            if len(prefix) < len(entry.cmdline[0]):
+                # only the path to the executable differs
+                own.append(entry)
+            elif not _SHELL_FLAGS.match(prefix.split()[-1]):
+                wrappers.append(entry)
+        return own + wrappers
+
+    def find_screen_session(self, session_name: str) -> List[ProcessEntry]:
+        """ screen processes that own the session named session_name """
+
+        matches = []
+        for entry in self._entries:
+            if os.path.basename(entry.cmdline[0]).lower() != "screen":
+                continue
+
+            # only match the session creating process (-dmS), not short
+            # lived clients such as `screen -S name -X eval ...`
+            args = entry.cmdline[1:]
+            for index, arg in enumerate(args[:-1]):
+                if arg.startswith("-") and arg.endswith("S") and len(arg) > 2:
+                    if args[index + 1] == session_name:
+                        matches.append(entry)
+                    break
+        return matches
+
+
+_index: Optional[ProcessIndex] = None
+
+
+def get_process_index(refresh: bool = False) -> ProcessIndex:
+    """
+    returns the shared process index, only reading the process table again
+    if refresh is set or no snapshot has been taken yet
+    """
+
+    global _index
+
+    if refresh or _index is None:
+        _index = ProcessIndex.snapshot()
+    return _index
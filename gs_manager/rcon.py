@@ -0,0 +1,561 @@
+import asyncio
+import atexit
+import os
+import select
+import socket
+import struct
+import time
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+__all__ = [
+    "RCON_ERRORS",
+    "RconError",
+    "RconAuthenticationError",
+    "RconConnectionError",
+    "RconTimeoutError",
+    "AsyncRconClient",
+    "RconClient",
+    "execute_batches",
+    "RconPool",
+    "get_rcon_pool",
+    "close_rcon_pools",
+    "encode_packet",
+    "decode_packet",
+]
+
+SERVERDATA_AUTH = 3
+SERVERDATA_AUTH_RESPONSE = 2
+SERVERDATA_EXECCOMMAND = 2
+SERVERDATA_RESPONSE_VALUE = 0
+
+_MAX_ID = 2 ** 31 - 1
+
+
+class RconError(Exception):
+    pass
+
+
+class RconAuthenticationError(RconError):
+    pass
+
+
+class RconTimeoutError(RconError):
+    pass
+
+
+class RconConnectionError(RconError):
+    """ the connection was closed before the request was sent """
+
+
+RCON_ERRORS = (OSError, RconError)
+
+
+def encode_packet(request_id: int, packet_type: int, body: str) -> bytes:
+    payload = struct.pack("<ii", request_id, packet_type)
+    payload += body.encode("utf-8") + b"\x00\x00"
+    return struct.pack("<i", len(payload)) + payload
+
+
+def decode_packet(data: bytes) -> Tuple[int, int, str]:
+    """ decodes a packet without its leading size field """
+
+    request_id, packet_type = struct.unpack("<ii", data[:8])
+    body = data[8:].rstrip(b"\x00").decode("utf-8", errors="replace")
+    return request_id, packet_type, body
+
+
+class _Request:
+    def __init__(self, future: asyncio.Future, multi_part: bool):
+        self.future = future
+        self.multi_part = multi_part
+        self.parts: List[str] = []
+
+
+class AsyncRconClient:
+    """
+    asyncio Source RCON client. Requests are matched to responses by
+    packet ID so any number of commands can be in flight on one connection
+    and every request gets its own timeout.
+    """
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        password: str,
+        timeout: Optional[float] = None,
+        multi_part: bool = False,
+    ):
+        self.address = address
+        self.password = password
+        self.timeout = timeout
+        self.multi_part = multi_part
+
+        self.authenticated = False
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+        self._auth: Optional[Tuple[int, asyncio.Future]] = None
+        self._requests: Dict[int, _Request] = {}
+        self._end_ids: Dict[int, int] = {}
+        self._next_id = 0
+
+    @property
+    def closed(self) -> bool:
+        return self._writer is None
+
+    @property
+    def stale(self) -> bool:
+        """
+        checks if the server closed the connection while it was idle. An
+        idle connection should have nothing to read, so anything readable
+        is the server hanging up
+        """
+
+        if self.closed or self._reader.at_eof():
+            return True
+        if len(self._requests) > 0 or self._auth is not None:
+            return False
+
+        sock = self._writer.get_extra_info("socket")
+        if sock is None:
+            return False
+        try:
+            readable, _, _ = select.select([sock.fileno()], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return len(readable) > 0
+
+    def _new_id(self) -> int:
+        self._next_id = self._next_id % _MAX_ID + 1
+        return self._next_id
+
+    async def _wait(self, future, timeout: Optional[float]):
+        if timeout is None:
+            timeout = self.timeout
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise RconTimeoutError("timed out waiting for response")
+
+    @staticmethod
+    def _expire(future: asyncio.Future) -> None:
+        if not future.done():
+            future.set_exception(
+                RconTimeoutError("timed out waiting for response")
+            )
+
+    async def connect(self) -> None:
+        loop = asyncio.get_event_loop()
+        self._reader, self._writer = await self._wait(
+            asyncio.open_connection(*self.address), None
+        )
+        sock = self._writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._read_task = loop.create_task(self._read_packets())
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._read_task is not None:
+            self._read_task.cancel()
+            try:
+                await self._read_task
+            except (asyncio.CancelledError, RconError):
+                pass
+            self._read_task = None
+        self._fail_pending(RconError("connection closed"))
+        self.authenticated = False
+
+    def _fail_pending(self, error: Exception) -> None:
+        futures = [r.future for r in self._requests.values()]
+        if self._auth is not None:
+            futures.append(self._auth[1])
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
+        self._requests = {}
+        self._end_ids = {}
+        self._auth = None
+
+    async def _read_packets(self) -> None:
+        try:
+            while True:
+                size = struct.unpack("<i", await self._reader.readexactly(4))
+                data = await self._reader.readexactly(size[0])
+                self._dispatch(*decode_packet(data))
+        except (asyncio.IncompleteReadError, OSError) as ex:
+            self._writer = None
+            self.authenticated = False
+            self._fail_pending(RconError(f"connection lost: {ex}"))
+
+    def _finish(self, request_id: int) -> None:
+        request = self._requests.pop(request_id, None)
+        if request is not None and not request.future.done():
+            request.future.set_result("".join(request.parts))
+
+    def _dispatch(self, response_id: int, packet_type: int, body: str):
+        if self._auth is not None:
+            if packet_type == SERVERDATA_AUTH_RESPONSE:
+                request_id, future = self._auth
+                self._auth = None
+                if not future.done():
+                    future.set_result(response_id == request_id)
+            return
+
+        if response_id in self._end_ids:
+            self._finish(self._end_ids.pop(response_id))
+        elif response_id in self._requests:
+            request = self._requests[response_id]
+            request.parts.append(body)
+            if not request.multi_part:
+                self._finish(response_id)
+
+    def _send(self, data: bytes) -> None:
+        if self._writer is None:
+            raise RconConnectionError("not connected")
+        self._writer.write(data)
+
+    async def authenticate(self, timeout: Optional[float] = None) -> None:
+        request_id = self._new_id()
+        future = asyncio.get_event_loop().create_future()
+        self._auth = (request_id, future)
+        self._send(encode_packet(request_id, SERVERDATA_AUTH, self.password))
+
+        if not await self._wait(future, timeout):
+            await self.close()
+            raise RconAuthenticationError("invalid RCON password")
+        self.authenticated = True
+
+    def _submit(
+        self,
+        command: str,
+        timeout: Optional[float],
+        multi_part: Optional[bool],
+    ) -> Tuple[bytes, asyncio.Future]:
+        """
+        registers a request and returns the packets to send for it. With
+        multi_part, an empty packet follows the command; the server mirrors
+        it back once the full (multi packet) response has been sent
+        """
+
+        if self.closed:
+            raise RconConnectionError("not connected")
+        if not self.authenticated:
+            raise RconError("not authenticated")
+        if multi_part is None:
+            multi_part = self.multi_part
+        if timeout is None:
+            timeout = self.timeout
+
+        loop = asyncio.get_event_loop()
+        request_id = self._new_id()
+        future = loop.create_future()
+        self._requests[request_id] = _Request(future, multi_part)
+
+        data = encode_packet(request_id, SERVERDATA_EXECCOMMAND, command)
+        end_id = None
+        if multi_part:
+            end_id = self._new_id()
+            self._end_ids[end_id] = request_id
+            data += encode_packet(end_id, SERVERDATA_RESPONSE_VALUE, "")
+
+        # a timer per request is much cheaper than wait_for's extra task
+        timer = None
+        if timeout is not None:
+            timer = loop.call_later(timeout, self._expire, future)
+
+        def _cleanup(future):
+            if timer is not None:
+                timer.cancel()
+            self._requests.pop(request_id, None)
+            self._end_ids.pop(end_id, None)
+
+        future.add_done_callback(_cleanup)
+        return data, future
+
+    async def execute(
+        self,
+        command: str,
+        timeout: Optional[float] = None,
+        multi_part: Optional[bool] = None,
+    ) -> str:
+        """ runs a single command with its own timeout """
+
+        data, future = self._submit(command, timeout, multi_part)
+        self._send(data)
+        return await future
+
+    async def execute_many(
+        self, commands: List[str], timeout: Optional[float] = None
+    ) -> List[str]:
+        """
+        sends every command in one write before waiting on any response.
+        Each command still gets its own timeout.
+        """
+
+        data = b""
+        futures = []
+        try:
+            for command in commands:
+                command_data, future = self._submit(command, timeout, None)
+                data += command_data
+                futures.append(future)
+            self._send(data)
+
+            return await asyncio.gather(*futures)
+        except BaseException:
+            for future in futures:
+                if not future.done():
+                    future.cancel()
+                elif not future.cancelled():
+                    # mark the other failures as retrieved
+                    future.exception()
+            raise
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+    return _loop
+
+
+class RconClient:
+    """ blocking wrapper around AsyncRconClient for synchronous callers """
+
+    def __init__(self, *args, **kwargs):
+        self._client = AsyncRconClient(*args, **kwargs)
+
+    @property
+    def authenticated(self) -> bool:
+        return self._client.authenticated
+
+    @property
+    def closed(self) -> bool:
+        return self._client.closed
+
+    @property
+    def stale(self) -> bool:
+        return self._client.stale
+
+    def _run(self, coroutine):
+        return _get_loop().run_until_complete(coroutine)
+
+    def connect(self) -> None:
+        self._run(self._client.connect())
+
+    def authenticate(self) -> None:
+        self._run(self._client.authenticate())
+
+    def close(self) -> None:
+        self._run(self._client.close())
+
+    def execute(self, command: str, timeout: Optional[float] = None) -> str:
+        return self._run(self._client.execute(command, timeout=timeout))
+
+    def execute_many(
+        self, commands: List[str], timeout: Optional[float] = None
+    ) -> List[str]:
+        return self._run(self._client.execute_many(commands, timeout))
+
+
+async def _execute_batch(
+    client_args: Dict[str, Any],
+    commands: List[str],
+    timeout: Optional[float],
+) -> List[str]:
+    client = AsyncRconClient(**client_args)
+    try:
+        await client.connect()
+        await client.authenticate()
+        return await client.execute_many(commands, timeout=timeout)
+    finally:
+        await client.close()
+
+
+def execute_batches(
+    batches: List[Tuple[Dict[str, Any], List[str]]],
+    timeout: Optional[float] = None,
+) -> List[Union[List[str], Exception]]:
+    """
+    runs a list of commands against many servers concurrently on a single
+    event loop. batches is a list of (AsyncRconClient kwargs, commands);
+    failed servers return their exception instead of responses
+    """
+
+    async def _gather():
+        return await asyncio.gather(
+            *[_execute_batch(a, c, timeout) for a, c in batches],
+            return_exceptions=True,
+        )
+
+    return _get_loop().run_until_complete(_gather())
+
+
+class _PooledConnection:
+    def __init__(self, connection: Any):
+        self.connection = connection
+        self.last_used = time.monotonic()
+        self.reused = False
+
+
+class RconPool:
+    """
+    pool of connected and authenticated RCON connections for a single
+    server. Idle connections are evicted and failed ones are replaced.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        max_size: int = 2,
+        idle_timeout: float = 60.0,
+    ):
+        self.factory = factory
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+
+        self._idle: List[_PooledConnection] = []
+
+    @staticmethod
+    def _close(connection: Any) -> None:
+        try:
+            connection.close()
+        except RCON_ERRORS:
+            pass
+
+    def _is_healthy(self, pooled: _PooledConnection) -> bool:
+        connection = pooled.connection
+        if time.monotonic() - pooled.last_used > self.idle_timeout:
+            return False
+        if getattr(connection, "closed", False):
+            return False
+        if getattr(connection, "stale", False):
+            return False
+        return getattr(connection, "authenticated", True)
+
+    def _connect(self) -> _PooledConnection:
+        connection = self.factory()
+        try:
+            connection.connect()
+            connection.authenticate()
+        except BaseException:
+            self._close(connection)
+            raise
+        return _PooledConnection(connection)
+
+    def acquire(self) -> _PooledConnection:
+        while len(self._idle) > 0:
+            pooled = self._idle.pop()
+            if self._is_healthy(pooled):
+                pooled.reused = True
+                return pooled
+            self._close(pooled.connection)
+        return self._connect()
+
+    def release(self, pooled: _PooledConnection) -> None:
+        pooled.last_used = time.monotonic()
+        if len(self._idle) < self.max_size:
+            self._idle.append(pooled)
+        else:
+            self._close(pooled.connection)
+
+    def discard(self, pooled: _PooledConnection) -> None:
+        self._close(pooled.connection)
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        pooled = self.acquire()
+        try:
+            yield pooled.connection
+        except BaseException:
+            self.discard(pooled)
+            raise
+        else:
+            self.release(pooled)
+
+    def execute_many(
+        self, commands: List[str], retries: int = 1
+    ) -> List[str]:
+        """
+        runs commands on a pooled connection. If a reused connection turns
+        out to be dead before the commands were sent, they are retried on a
+        new one. Any other failure, including a timeout, is raised as the
+        server may have already run the commands
+        """
+
+        for attempt in range(retries + 1):
+            pooled = self.acquire()
+            try:
+                responses = pooled.connection.execute_many(commands)
+            except RconConnectionError:
+                self.discard(pooled)
+                if not pooled.reused or attempt >= retries:
+                    raise
+            except BaseException:
+                self.discard(pooled)
+                raise
+            else:
+                self.release(pooled)
+                return responses
+
+    def execute(self, command: str, retries: int = 1) -> str:
+        return self.execute_many([command], retries=retries)[0]
+
+    def check(self) -> bool:
+        """ checks a connection can be made and authenticated """
+
+        try:
+            self.release(self.acquire())
+        except RCON_ERRORS:
+            return False
+        return True
+
+    def close(self) -> None:
+        while len(self._idle) > 0:
+            self._close(self._idle.pop().connection)
+
+
+_pools: Dict[Hashable, RconPool] = {}
+
+
+def get_rcon_pool(key: Hashable, factory: Callable[[], Any]) -> RconPool:
+    if key not in _pools:
+        _pools[key] = RconPool(factory)
+    return _pools[key]
+
+
+def close_rcon_pools() -> None:
+    for pool in _pools.values():
+        pool.close()
+    _pools.clear()
+
+
+def _forget_rcon_pools() -> None:
+    global _loop
+
+    # sockets are shared with the parent after a fork, do not reuse them
+    _pools.clear()
+    _loop = None
+
+
+atexit.register(close_rcon_pools)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_rcon_pools)
@@ -0,0 +1,283 @@
+import errno
+import fcntl
+import os
+import shutil
+import time
+from typing import Dict, List, Optional, Tuple
+
+__all__ = [
+    "CLONE_MODES",
+    "STAGE_MODES",
+    "ReleaseManager",
+    "clone_file",
+    "clone_tree",
+    "reflink",
+    "scan_tree",
+]
+
+CLONE_MODES = ["reflink", "hardlink", "copy"]
+# a hardlinked stage would be patched in place by steamcmd, changing the
+# live release under the running servers
+STAGE_MODES = ["reflink", "copy"]
+
+# ioctl to share the extents of a file (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+_REFLINK_UNSUPPORTED = (
+    errno.EOPNOTSUPP,
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.ENOTTY,
+    errno.EBADF,
+)
+
+FileStat = Tuple[int, int]
+
+
+def reflink(src: str, dst: str) -> None:
+    """ clones a file with copy-on-write, raises OSError if unsupported """
+
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+    shutil.copystat(src, dst)
+
+
+def clone_file(src: str, dst: str, mode: str = "reflink") -> str:
+    """
+    clones a single file. reflink falls back to a copy if the filesystem
+    cannot share extents and hardlink if src and dst are on different
+    filesystems. Returns the mode that was actually used
+    """
+
+    if mode == "reflink":
+        try:
+            reflink(src, dst)
+            return mode
+        except OSError as ex:
+            if ex.errno not in _REFLINK_UNSUPPORTED:
+                raise
+            if os.path.lexists(dst):
+                os.remove(dst)
+            mode = "copy"
+    elif mode == "hardlink":
+        try:
+            os.link(src, dst)
+            return mode
+        except OSError as ex:
+            if ex.errno != errno.EXDEV:
+                raise
+            mode = "copy"
+
+    shutil.copy2(src, dst)
+    return mode
+
+
+def clone_tree(src: str, dst: str, mode: str = "reflink") -> str:
+    """
+    clones a directory tree. reflink falls back to a full copy if the
+    filesystem cannot share extents. hardlink is the fastest, but files the
+    game server writes in place change in both trees. Returns the mode
+    that was actually used
+    """
+
+    if mode not in CLONE_MODES:
+        raise ValueError(f"invalid clone mode: {mode}")
+
+    for root, dirs, files in os.walk(src):
+        rel_root = os.path.relpath(root, src)
+        dst_root = os.path.normpath(os.path.join(dst, rel_root))
+        os.makedirs(dst_root, exist_ok=True)
+
+        for name in dirs + files:
+            src_path = os.path.join(root, name)
+            dst_path = os.path.join(dst_root, name)
+
+            if os.path.islink(src_path):
+                os.symlink(os.readlink(src_path), dst_path)
+                if name in dirs:
+                    dirs.remove(name)
+                continue
+            if name in dirs:
+                continue
+
+            mode = clone_file(src_path, dst_path, mode)
+
+        shutil.copystat(root, dst_root)
+
+    return mode
+
+
+def _stat(path: str) -> Optional[FileStat]:
+    try:
+        stat = os.lstat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def scan_tree(path: str) -> Dict[str, FileStat]:
+    """ gets the size and mtime of every regular file in a tree """
+
+    files = {}
+    for root, _, names in os.walk(path):
+        for name in names:
+            full_path = os.path.join(root, name)
+            if os.path.islink(full_path):
+                continue
+            stat = _stat(full_path)
+            if stat is not None:
+                files[os.path.relpath(full_path, path)] = stat
+    return files
+
+
+class ReleaseManager:
+    """
+    manages blue/green copies of a server_path. Releases live next to it in
+    <server_path>.releases and server_path itself becomes a symlink to the
+    active release, so switching releases is a single atomic rename.
+    """
+
+    def __init__(self, server_path: str, keep: int = 1):
+        self.server_path = os.path.abspath(server_path).rstrip(os.sep)
+        self.releases_path = f"{self.server_path}.releases"
+        self.keep = keep
+
+    @property
+    def current(self) -> str:
+        return os.path.realpath(self.server_path)
+
+    @property
+    def releases(self) -> List[str]:
+        """ finished releases, oldest first """
+
+        if not os.path.isdir(self.releases_path):
+            return []
+        return [
+            os.path.join(self.releases_path, name)
+            for name in sorted(os.listdir(self.releases_path))
+            if not name.startswith("staging-")
+        ]
+
+    @property
+    def previous(self) -> Optional[str]:
+        current = self.current
+        releases = [r for r in self.releases if r != current]
+        if len(releases) == 0:
+            return None
+        return releases[-1]
+
+    def _new_name(self, prefix: str = "") -> str:
+        name = prefix + time.strftime("%Y%m%d%H%M%S")
+        path = os.path.join(self.releases_path, name)
+        index = 0
+        while os.path.exists(path):
+            index += 1
+            path = os.path.join(self.releases_path, f"{name}.{index}")
+        return path
+
+    def stage(self, mode: str = "reflink") -> Tuple[str, Dict[str, FileStat]]:
+        """
+        clones the active release into a staging directory. Returns the
+        staging path and a snapshot of the active tree at clone time
+        """
+
+        if mode not in STAGE_MODES:
+            raise ValueError(f"invalid stage mode: {mode}")
+
+        os.makedirs(self.releases_path, exist_ok=True)
+        stage_path = self._new_name("staging-")
+
+        snapshot = scan_tree(self.current)
+        clone_tree(self.current, stage_path, mode)
+        return stage_path, snapshot
+
+    def sync(self, stage_path: str, snapshot: Dict[str, FileStat]) -> int:
+        """
+        copies files the running servers changed since the stage was cloned
+        (saves, configs, logs) into the stage. Files the update changed in
+        the stage are kept. Returns the number of files synced
+        """
+
+        current = self.current
+        live = scan_tree(current)
+        synced = 0
+
+        for rel_path, stat in live.items():
+            if snapshot.get(rel_path) == stat:
+                continue
+
+            staged_path = os.path.join(stage_path, rel_path)
+            staged_stat = _stat(staged_path)
+            if staged_stat is not None and staged_stat != snapshot.get(
+                rel_path
+            ):
+                continue
+
+            os.makedirs(os.path.dirname(staged_path), exist_ok=True)
+            if staged_stat is not None:
+                os.remove(staged_path)
+            shutil.copy2(os.path.join(current, rel_path), staged_path)
+            synced += 1
+
+        for rel_path, stat in snapshot.items():
+            if rel_path in live:
+                continue
+            staged_path = os.path.join(stage_path, rel_path)
+            if _stat(staged_path) == stat:
+                os.remove(staged_path)
+                synced += 1
+
+        return synced
+
+    def discard(self, stage_path: str) -> None:
+        shutil.rmtree(stage_path, ignore_errors=True)
+
+    def _link(self, target: str, old_path: Optional[str] = None) -> None:
+        old_path = old_path or self.current
+        tmp_link = f"{self.server_path}.tmp-link"
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        os.symlink(target, tmp_link)
+        os.replace(tmp_link, self.server_path)
+
+        # relative server paths would still point into the old release
+        cwd = os.getcwd()
+        if cwd == old_path or cwd.startswith(old_path + os.sep):
+            os.chdir(
+                os.path.join(self.server_path, os.path.relpath(cwd, old_path))
+            )
+
+    def activate(self, stage_path: str) -> str:
+        """
+        makes a stage the active release. The first time, the existing
+        server_path directory is moved into the releases as well so it can
+        be rolled back to. Returns the path of the new release
+        """
+
+        release_path = self._new_name()
+        os.rename(stage_path, release_path)
+
+        old_path = self.current
+        if not os.path.islink(self.server_path):
+            old_path = self._new_name("0-")
+            os.rename(self.server_path, old_path)
+
+        self._link(release_path, old_path)
+        self.prune()
+        return release_path
+
+    def rollback(self) -> Optional[str]:
+        """ switches back to the previous release """
+
+        previous = self.previous
+        if previous is not None:
+            self._link(previous)
+        return previous
+
+    def prune(self) -> None:
+        """ removes all but the active and the last keep releases """
+
+        current = self.current
+        old = [r for r in self.releases if r != current]
+        for release in old[: max(0, len(old) - self.keep)]:
+            shutil.rmtree(release, ignore_errors=True)
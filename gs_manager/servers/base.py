@@ -2,18 +2,38 @@ import getpass
 import logging
 import os
 import signal
+import sys
 import tarfile
 import time
+from contextlib import contextmanager
 from datetime import datetime
 from distutils.dir_util import copy_tree
 from shutil import copyfile, rmtree
 from subprocess import DEVNULL, PIPE, STDOUT, CalledProcessError  # nosec
-from typing import Callable, Dict, Iterable, List, Optional, Type, Union
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Type,
+    Union,
+)
 
 import click
 import psutil
 from pygtail import Pygtail
 
+from gs_manager.backup import BACKUP_FORMATS, ChunkRepository
+from gs_manager.cache import ResultCache, get_cache
+from gs_manager.compression import (
+    COMPRESSIONS,
+    EXTENSIONS,
+    CompressWriter,
+    default_threads,
+    open_decompressed,
+)
 from gs_manager.command import DEFAULT_CONFIG, Config, ServerCommandClass
 from gs_manager.command.validators import (
     DirectoryConfigType,
@@ -23,7 +43,16 @@ from gs_manager.command.validators import (
 from gs_manager.decorators import multi_instance, require, single_instance
 from gs_manager.logger import get_logger
 from gs_manager.null import NullServer
-from gs_manager.utils import get_server_path, run_command
+from gs_manager.process import ProcessEntry, ProcessIndex, get_process_index
+from gs_manager.releases import CLONE_MODES, clone_file, clone_tree
+from gs_manager.utils import get_server_path, lower_priority, run_command
+from gs_manager.wait import (
+    LogLineProbe,
+    Probe,
+    TickCallback,
+    wait_for_exit,
+    wait_for_probes,
+)
 
 __all__ = [
     "EmptyServer",
@@ -57,6 +86,13 @@ class BaseServerConfig(Config):
     name: str = "game_server"
     user: str = getpass.getuser()
     server_log: Optional[str] = None
+    max_parallel: Optional[int] = None
+    # progress bars while waiting, never shown if stdout is not a TTY
+    progress: bool = True
+
+    # query result cache config
+    cache_path: Optional[str] = None
+    cache_ttl: int = 10
 
     # start command config
     wait_start: int = 3
@@ -72,6 +108,12 @@ class BaseServerConfig(Config):
 
     # save command config
     save_command: str = None
+    # line in server_log that is written once a save has completed
+    save_log_pattern: Optional[str] = None
+    max_save: int = 60
+    # commands to turn automatic saves off while backups are copied
+    save_off_command: Optional[str] = None
+    save_on_command: Optional[str] = None
 
     # say command config
     say_command: str = None
@@ -81,6 +123,12 @@ class BaseServerConfig(Config):
     backup_location: Optional[str] = None
     backup_days: int = 7
     backup_extra_paths: Optional[List[str]] = []
+    backup_format: str = "tar"
+    backup_compression: str = "gzip"
+    backup_compression_level: Optional[int] = None
+    backup_threads: Optional[int] = None
+    backup_snapshot: bool = False
+    backup_snapshot_mode: str = "reflink"
 
     @property
     def global_options(self):
@@ -105,6 +153,22 @@ class BaseServerConfig(Config):
                     "type": str,
                     "help": ("Path to server log"),
                 },
+                {
+                    "param_decls": ("--cache-ttl",),
+                    "type": int,
+                    "help": (
+                        "Default max age (in seconds) of cached query "
+                        "results status can use"
+                    ),
+                },
+                {
+                    "param_decls": ("--progress/--no-progress",),
+                    "default": None,
+                    "help": (
+                        "Show progress while waiting for the server. Off "
+                        "if output is not a terminal"
+                    ),
+                },
             ],
             "instance_enabled": [
                 {
@@ -118,6 +182,12 @@ class BaseServerConfig(Config):
                     "help": "Used in conjuntion with -ci @all to run all "
                     "subcommands in parallel",
                 },
+                {
+                    "param_decls": ("--max-parallel",),
+                    "type": int,
+                    "help": "Max number of instances to run at once with "
+                    "--parallel. Defaults to all of them",
+                },
             ],
         }
 
@@ -182,6 +252,15 @@ class BaseServer(EmptyServer):
             return self.config.name
         return self.config.parent.name
 
+    @property
+    def cache(self) -> ResultCache:
+        return get_cache(self.config.cache_path)
+
+    def _get_max_age(self, max_age: Optional[int] = None) -> int:
+        if max_age is None:
+            return self.config.cache_ttl
+        return max_age
+
     def _get_pid_filename(self) -> str:
         if self.config.parent is None:
             return ".pid_file"
@@ -214,58 +293,77 @@ class BaseServer(EmptyServer):
         if os.path.isfile(pid_file):
             os.remove(pid_file)
 
-    def _startup_check(self) -> int:
+    def _get_startup_probes(self) -> List[Probe]:
+        return [Probe(self.is_accessible, name="accessible")]
+
+    def _startup_check(self, probes: Optional[List[Probe]] = None) -> int:
         self.logger.info("")
 
-        def _wait_callback():
-            if self.is_running() and self.is_accessible():
-                return True
+        if probes is None:
+            probes = self._get_startup_probes()
 
-        self._wait(
-            self.config.max_start,
-            callback=_wait_callback,
-            label="timeout",
-            show_percent=False,
-        )
-        if self.is_running():
-            if self.is_accessible():
-                self.logger.success(f"\n{self.server_name} is running")
-                return STATUS_SUCCESS
-            else:
-                self.logger.error(
-                    f"{self.server_name} is running but not accesible"
-                )
-                return STATUS_PARTIAL_FAIL
+        with self._progress(self.config.max_start, label="timeout") as tick:
+            ready = wait_for_probes(
+                probes,
+                self.config.max_start,
+                abort=lambda: not self.is_running(),
+                on_tick=tick,
+            )
+
+        if ready:
+            self.logger.success(f"\n{self.server_name} is running")
+            return STATUS_SUCCESS
+        elif self.is_running():
+            failed = ", ".join([p.name for p in probes if not p.passed])
+            self.logger.debug(f"failed probes: {failed}")
+            self.logger.error(
+                f"{self.server_name} is running but not accesible"
+            )
+            return STATUS_PARTIAL_FAIL
         else:
             self.logger.error(f"could not start {self.server_name}")
             return STATUS_FAILED
 
-    def _find_pid(self, require: bool = True) -> None:
-        command = (
-            self.config.start_command.replace('"', '\\"')
-            .replace("?", "\\?")
-            .replace("+", "\\+")
-            .replace("|", ".")
-            .strip()
-        )
+    def _match_pids(self, index: ProcessIndex) -> List[ProcessEntry]:
+        return index.find_command(self.config.start_command)
 
-        pids = self.run_command(
-            "ps -ef --sort=start_time | "
-            f'grep -i -P "(?<!grep -i |-c ){command}$" | '
-            "awk '{{print $2}}'"
-        ).split("\n")
+    def _find_pid(
+        self, require: bool = True, refresh: bool = True
+    ) -> Optional[int]:
+        index = get_process_index(refresh=refresh)
+        matches = self._match_pids(index)
 
-        self.logger.debug(f"pids: {pids}")
+        for entry in matches:
+            self.logger.debug(f"pid {entry.pid}: {entry.command}")
 
-        for pid in pids:
-            if pid is not None and not pid == "":
-                self.run_command(f"ps -ef | grep {pid}")
-
-        if pids[0] is None or pids[0] == "":
+        if len(matches) == 0:
             if require:
                 raise click.ClickException("could not determine PID")
-        else:
-            self._write_pid_file(pids[0])
+            return None
+
+        self._write_pid_file(matches[0].pid)
+        return matches[0].pid
+
+    @contextmanager
+    def _progress(
+        self, seconds: int, label: Optional[str] = None
+    ) -> Iterator[Optional[TickCallback]]:
+        """ optional progress display for the event driven waits """
+
+        if not (self.config.progress and sys.stdout.isatty()):
+            yield None
+            return
+
+        with click.progressbar(
+            length=seconds, label=label, show_eta=True, show_percent=False,
+        ) as bar:
+
+            def _on_tick(elapsed: float) -> None:
+                steps = min(int(elapsed), seconds) - bar.pos
+                if steps > 0:
+                    bar.update(steps)
+
+            yield _on_tick
 
     def _wait(
         self,
@@ -287,6 +385,141 @@ class BaseServer(EmptyServer):
                         break
                 time.sleep(1)
 
+    def _wait_for_stop(self, pid: Optional[int], seconds: int) -> bool:
+        with self._progress(seconds, label="timeout") as tick:
+            if pid is not None:
+                return wait_for_exit(pid, seconds, on_tick=tick)
+
+            return wait_for_probes(
+                [Probe(lambda: not self.is_running(), name="stopped")],
+                seconds,
+                on_tick=tick,
+            )
+
+    def _get_save_probes(self) -> List[Probe]:
+        if self.config.save_log_pattern is None or not self.config.server_log:
+            return []
+
+        return [
+            LogLineProbe(
+                get_server_path(self.config.server_log),
+                self.config.save_log_pattern,
+                name="save log",
+            )
+        ]
+
+    def _get_save_kwargs(self) -> dict:
+        """ extra arguments for the command that sends save_command """
+
+        return {}
+
+    def _get_running_instances(self) -> Optional[List[str]]:
+        """ names of the running instances, None if there are no instances """
+
+        if len(self.config.all_instance_names) == 0:
+            return None
+
+        return [
+            name
+            for name, running in zip(
+                self.config.all_instance_names, self.is_running(check_all=True)
+            )
+            if running
+        ]
+
+    def _command_for(
+        self,
+        command_string: str,
+        instance_names: Optional[List[str]] = None,
+        **kwargs,
+    ) -> int:
+        """
+        runs a console command against instance_names in parallel or the
+        current instance if it is None
+        """
+
+        if instance_names is None:
+            return self.invoke(
+                self.command,
+                command_string=command_string,
+                do_print=False,
+                **kwargs,
+            )
+        elif len(instance_names) == 0:
+            return STATUS_SUCCESS
+
+        current_instance = self.config.instance_name
+        multi_instance = self.config.multi_instance
+        self.set_instance(None, False)
+        status = self.invoke(
+            self.command,
+            command_string=command_string,
+            do_print=False,
+            parallel=True,
+            current_instance=f"@each:{','.join(instance_names)}",
+            **kwargs,
+        )
+        self.set_instance(current_instance, multi_instance)
+        return status
+
+    def _save_servers(
+        self, instance_names: Optional[List[str]] = None
+    ) -> bool:
+        """
+        sends save_command and waits until the server log or the command's
+        response confirms every save. Returns if all saves were confirmed
+        """
+
+        if instance_names is not None and len(instance_names) == 0:
+            return True
+
+        if instance_names is None:
+            probes = self._get_save_probes()
+        else:
+            current_instance = self.config.instance_name
+            multi_instance = self.config.multi_instance
+            probes = []
+            for instance_name in instance_names:
+                self.set_instance(instance_name, True)
+                probes += self._get_save_probes()
+            self.set_instance(current_instance, multi_instance)
+
+        start = time.monotonic()
+        status = self._command_for(
+            self.config.save_command, instance_names, **self._get_save_kwargs()
+        )
+        saved = status == STATUS_SUCCESS and wait_for_probes(
+            probes, self.config.max_save
+        )
+
+        if saved:
+            self.logger.debug(f"saved in {time.monotonic() - start:.2f}s")
+        else:
+            self.logger.warning("could not confirm the save completed")
+        return saved
+
+    @contextmanager
+    def _hold_saves(
+        self, instance_names: Optional[List[str]] = None
+    ) -> Iterator[None]:
+        """
+        turns automatic saves off so the world does not change while it is
+        copied
+        """
+
+        if not (
+            self._command_exists("save_off_command")
+            and self._command_exists("save_on_command")
+        ):
+            yield
+            return
+
+        self._command_for(self.config.save_off_command, instance_names)
+        try:
+            yield
+        finally:
+            self._command_for(self.config.save_on_command, instance_names)
+
     def _prestop(
         self, seconds: int, verb: str = "shutting down", reason: str = ""
     ) -> bool:
@@ -315,11 +548,7 @@ class BaseServer(EmptyServer):
         stopped = False
         if self._command_exists("stop_command"):
             if self._command_exists("save_command"):
-                self.invoke(
-                    self.command,
-                    command_string=self.config.save_command,
-                    do_print=False,
-                )
+                self._save_servers()
 
             response = self.invoke(
                 self.command,
@@ -451,7 +680,7 @@ class BaseServer(EmptyServer):
         """ checks if gameserver is running or not """
 
         if not self.is_running():
-            self._find_pid(False)
+            self._find_pid(False, refresh=False)
 
         if self.is_running():
             if self.is_accessible():
@@ -535,6 +764,10 @@ class BaseServer(EmptyServer):
         self._delete_pid_file()
         self.logger.info(f"starting {self.server_name}...", nl=False)
 
+        # probes are created before the server starts so log based probes
+        # only see output from this run
+        probes = self._get_startup_probes()
+
         command = start_command or self.config.start_command
         popen_kwargs = {}
         if self.config.spawn_process and not foreground:
@@ -579,12 +812,16 @@ class BaseServer(EmptyServer):
             )
 
         if self.config.wait_start > 0:
-            time.sleep(self.config.wait_start)
+            # wait_start is now an upper bound for the process to show up
+            wait_for_probes(
+                [Probe(lambda: self._find_pid(False) is not None, "pid")],
+                self.config.wait_start,
+            )
 
         self._find_pid()
         if no_verify:
             return STATUS_SUCCESS
-        return self._startup_check()
+        return self._startup_check(probes)
 
     @multi_instance
     @click.command(cls=ServerCommandClass)
@@ -638,22 +875,14 @@ class BaseServer(EmptyServer):
 
             self.logger.info(f"{verb} {self.server_name}...")
 
+            pid = self.get_pid()
             if force:
                 self.kill_server()
-                time.sleep(1)
+                if pid is not None:
+                    wait_for_exit(pid, 5)
             else:
                 self._stop()
-
-                def _wait_callback():
-                    if not self.is_running():
-                        return True
-
-                self._wait(
-                    self.config.max_stop,
-                    callback=_wait_callback,
-                    label="timeout",
-                    show_percent=False,
-                )
+                self._wait_for_stop(pid, self.config.max_stop)
 
             if self.is_running():
                 self.logger.error(f"could not stop {self.server_name}")
@@ -778,52 +1007,176 @@ class BaseServer(EmptyServer):
         type=int,
         help="Number of days worth of backups to keep",
     )
+    @click.option(
+        "--backup-format",
+        type=click.Choice(BACKUP_FORMATS),
+        help=(
+            "tar writes a full archive each time, chunks only stores data "
+            "that changed since the last backup"
+        ),
+    )
+    @click.option(
+        "--backup-compression",
+        type=click.Choice(COMPRESSIONS),
+        help="Compression for tar backups, zstd and lz4 need extra packages",
+    )
+    @click.option(
+        "--backup-compression-level",
+        type=int,
+        help="Compression level, defaults to the compressor's default",
+    )
+    @click.option(
+        "--backup-threads",
+        type=int,
+        help="Threads to compress with, defaults to half of the CPUs",
+    )
+    @click.option(
+        "--backup-snapshot",
+        is_flag=True,
+        help=(
+            "Snapshot the files right after saving and compress the "
+            "snapshot in the background at low priority"
+        ),
+    )
+    @click.option(
+        "--backup-snapshot-mode",
+        type=click.Choice(CLONE_MODES),
+        help=(
+            "How to snapshot files, reflink falls back to a copy. hardlink "
+            "is only safe if the server replaces files instead of writing "
+            "to them in place"
+        ),
+    )
+    @click.option(
+        "--foreground",
+        is_flag=True,
+        help="Wait for the snapshot to be compressed before exiting",
+    )
     @click.pass_obj
-    def backup(self, *args, **kwargs) -> int:
+    def backup(self, foreground: bool = False, *args, **kwargs) -> int:
         """ edits a server file with your default editor """
 
         backup_folder = os.path.join(self.config.backup_location, "backups")
         timestamp = (
             datetime.now().isoformat(timespec="minutes").replace(":", "-")
         )
-        backup_file = f"{self.backup_name}_{timestamp}.tar.gz"
 
         os.makedirs(backup_folder, exist_ok=True)
 
-        if self._command_exists("save_command"):
-            self.logger.info(f"Saving servers...")
-            current_instance = self.config.instance_name
-            multi_instance = self.config.multi_instance
-            self.set_instance(None, False)
-            self.invoke(
-                self.command,
-                command_string=self.config.save_command,
-                do_print=False,
-                parallel=True,
-                current_instance="@all",
+        running = self._get_running_instances()
+        if running is None and not self.is_running():
+            running = []
+
+        with self._hold_saves(running):
+            if self._command_exists("save_command"):
+                self.logger.info("Saving servers...")
+                self._save_servers(running)
+
+            paths = self._get_backup_paths()
+            if not self.config.backup_snapshot:
+                return self._write_backup(timestamp, paths)
+
+            snapshot_path = self._snapshot_backup_paths(
+                f"{self.backup_name}_{timestamp}", paths
             )
-            self.set_instance(current_instance, multi_instance)
+            paths = {
+                arcname: os.path.join(snapshot_path, arcname)
+                for arcname in paths
+            }
+
+        if not foreground:
+            pid = os.fork()
+            if pid != 0:
+                self.logger.info(f"Compressing backup in background ({pid})")
+                return STATUS_SUCCESS
+
+            # the child compresses the snapshot without holding up the host
+            os.setsid()
+            lower_priority()
+            status = STATUS_FAILED
+            try:
+                status = self._write_backup(timestamp, paths)
+            finally:
+                rmtree(snapshot_path, ignore_errors=True)
+                os._exit(status)
+
+        try:
+            return self._write_backup(timestamp, paths)
+        finally:
+            rmtree(snapshot_path, ignore_errors=True)
+
+    def _get_backup_paths(self) -> Dict[str, str]:
+        """ gets the paths to back up by their name in the backup """
+
+        paths = {
+            self.config.backup_directory: get_server_path(
+                self.config.backup_directory
+            ),
+            DEFAULT_CONFIG: self.config.config_path,
+        }
+        for path in self.config.backup_extra_paths:
+            if os.path.exists(path):
+                paths[os.path.basename(path)] = path
+            else:
+                self.logger.warning(f"{path} does not exist")
+        return paths
+
+    def _snapshot_backup_paths(self, name: str, paths: Dict[str, str]) -> str:
+        """
+        clones the paths to back up next to server_path, so the servers
+        only have to hold still while the clone is taken. Returns the path
+        of the snapshot
+        """
+
+        snapshot_path = os.path.join(
+            f"{os.path.abspath(self.config.server_path).rstrip(os.sep)}"
+            ".backups",
+            name,
+        )
+        if os.path.exists(snapshot_path):
+            rmtree(snapshot_path)
+
+        start = time.monotonic()
+        mode = self.config.backup_snapshot_mode
+        for arcname, path in paths.items():
+            target = os.path.join(snapshot_path, arcname)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.isdir(path):
+                mode = clone_tree(path, target, mode)
+            else:
+                mode = clone_file(path, target, mode)
+
+        self.logger.info(
+            f"Took snapshot ({mode}) in {time.monotonic() - start:.2f}s"
+        )
+        return snapshot_path
+
+    def _write_backup(self, timestamp: str, paths: Dict[str, str]) -> int:
+        if self.config.backup_format == "chunks":
+            name = f"{self.backup_name}_{timestamp}"
+            return self._backup_chunks(name, paths)
+
+        backup_folder = os.path.join(self.config.backup_location, "backups")
+        extension = EXTENSIONS[self.config.backup_compression]
+        backup_file = f"{self.backup_name}_{timestamp}.tar{extension}"
 
         self.logger.info(f"Making server backup ({backup_file})...")
-        with tarfile.open(
-            os.path.join(backup_folder, backup_file), "w:gz"
-        ) as tar:
-            tar.add(
-                get_server_path(self.config.backup_directory),
-                arcname=self.config.backup_directory,
-            )
-            tar.add(self.config.config_path, arcname=DEFAULT_CONFIG)
-            for path in self.config.backup_extra_paths:
-                if os.path.exists(path):
-                    tar.add(path, os.path.basename(path))
-                else:
-                    self.logger.warning(f"{path} does not exist")
+        with open(os.path.join(backup_folder, backup_file), "wb") as f:
+            with CompressWriter(
+                f,
+                self.config.backup_compression,
+                level=self.config.backup_compression_level,
+                threads=self.config.backup_threads or default_threads(),
+            ) as writer:
+                with tarfile.open(fileobj=writer, mode="w|") as tar:
+                    for arcname, path in paths.items():
+                        tar.add(path, arcname=arcname)
 
         old_backups = []
-        now = time.time()
+        max_mtime = time.time() - self.config.backup_days * 86400
         for backup in os.listdir(backup_folder):
             abs_path = os.path.join(backup_folder, backup)
-            if os.stat(abs_path).st_mtime < now - 7 * 86400:
+            if os.stat(abs_path).st_mtime < max_mtime:
                 old_backups.append(abs_path)
 
         if len(old_backups) > 0:
@@ -834,6 +1187,35 @@ class BaseServer(EmptyServer):
 
         return STATUS_SUCCESS
 
+    @property
+    def backup_repository(self) -> ChunkRepository:
+        return ChunkRepository(
+            os.path.join(self.config.backup_location, "repository")
+        )
+
+    def _get_snapshots(self) -> List[str]:
+        return [
+            s
+            for s in self.backup_repository.snapshots
+            if s.startswith(f"{self.backup_name}_")
+        ]
+
+    def _backup_chunks(self, name: str, paths: Dict[str, str]) -> int:
+        repository = self.backup_repository
+        snapshots = self._get_snapshots()
+        base = snapshots[-1] if len(snapshots) > 0 else None
+
+        self.logger.info(f"Making server backup ({name})...")
+        stats = repository.backup(name, paths, base=base)
+        self.logger.info(str(stats))
+
+        removed = repository.prune(
+            self.config.backup_days * 86400, backup_name=self.backup_name
+        )
+        if len(removed) > 0:
+            self.logger.info(f"Deleted {len(removed)} old backups")
+        return STATUS_SUCCESS
+
     @require("backup_directory")
     @require("backup_location")
     @single_instance
@@ -870,7 +1252,8 @@ class BaseServer(EmptyServer):
             for backup in os.listdir(backup_folder):
                 if backup.startswith(self.backup_name):
                     backups.append(backup)
-            backups = sorted(backups)
+        snapshots = self._get_snapshots()
+        backups = sorted(backups + snapshots)
 
         if list_backups:
             if num >= 0:
@@ -880,7 +1263,7 @@ class BaseServer(EmptyServer):
                 self.logger.info(f"{index:2}: {backup}")
             return STATUS_SUCCESS
 
-        if backup_num > len(backups):
+        if backup_num >= len(backups):
             self.logger.error(f"Backup {backup_num} does not exist")
             return STATUS_FAILED
 
@@ -890,7 +1273,9 @@ class BaseServer(EmptyServer):
 
         self.logger.info("Cleaning up previous restore...")
         for old_backup in os.listdir(self.config.backup_location):
-            if old_backup.endswith(".tar.gz"):
+            if ".tar" in old_backup and os.path.isfile(
+                os.path.join(self.config.backup_location, old_backup)
+            ):
                 os.remove(
                     os.path.join(self.config.backup_location, old_backup)
                 )
@@ -900,13 +1285,21 @@ class BaseServer(EmptyServer):
         os.mkdir(restore_folder)
 
         self.logger.info("Extacting backup...")
-        backup_file = os.path.join(
-            self.config.backup_location, backups[backup_num]
-        )
-        copyfile(os.path.join(backup_folder, backups[backup_num]), backup_file)
+        if backups[backup_num] in snapshots:
+            self.backup_repository.restore(
+                backups[backup_num], restore_folder
+            )
+        else:
+            backup_file = os.path.join(
+                self.config.backup_location, backups[backup_num]
+            )
+            copyfile(
+                os.path.join(backup_folder, backups[backup_num]), backup_file
+            )
 
-        with tarfile.open(backup_file) as tar:
-            tar.extractall(path=restore_folder)
+            with open_decompressed(backup_file) as f:
+                with tarfile.open(fileobj=f, mode="r|") as tar:
+                    tar.extractall(path=restore_folder)
 
         config_file = os.path.join(restore_folder, DEFAULT_CONFIG)
         if os.path.isfile(config_file):
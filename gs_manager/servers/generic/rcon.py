@@ -1,29 +1,55 @@
-from typing import Dict, Optional, Type
+import re
+from typing import List, Optional, Type, Union
 
 import click
 
 from gs_manager.command import Config, ServerCommandClass
 from gs_manager.decorators import multi_instance, require, single_instance
+from gs_manager.rcon import (
+    RCON_ERRORS,
+    RconClient,
+    RconPool,
+    execute_batches,
+    get_rcon_pool,
+)
 from gs_manager.servers.base import (
     STATUS_FAILED,
     STATUS_PARTIAL_FAIL,
     STATUS_SUCCESS,
 )
 from gs_manager.servers.generic.steam import SteamServer, SteamServerConfig
-from valve.rcon import RCON, shell
-from valve.source.a2s import ServerQuerier
+from gs_manager.wait import Probe
+from valve.rcon import shell
 
 __all__ = ["RconServer", "RconServerConfig"]
 
 STEAM_PUBLISHED_FILES_API = "https://api.steampowered.com/ISteamRemoteStorage/GetPublishedFileDetails/v1"  # noqa
 
 
+def read_batch_file(context, param, value) -> Optional[List[str]]:
+    """ reads batch commands once, before any instances are run """
+
+    if value is None:
+        return None
+
+    commands = []
+    for line in value:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            commands.append(line)
+    return commands
+
+
 class RconServerConfig(SteamServerConfig):
-    rcon_multi_part: bool = False
+    # Source servers mirror an empty packet once a response is complete,
+    # set to False for servers that do not
+    rcon_multi_part: bool = True
     rcon_password: Optional[str] = None
     rcon_ip: str = "127.0.0.1"
     rcon_port: Optional[int] = None
     rcon_timeout: int = 10
+    # RCON response to save_command that confirms the save completed
+    save_response: Optional[str] = None
 
     @property
     def global_options(self):
@@ -45,14 +71,17 @@ class RconServerConfig(SteamServerConfig):
                 "help": "Password for RCON service",
             },
             {
-                "param_decls": ("--rcon-multi-part",),
-                "is_flag": True,
-                "help": "Flag for if server support Multiple Part Packets",
+                "param_decls": ("--rcon-multi-part/--no-rcon-multi-part",),
+                "default": None,
+                "help": (
+                    "If server supports Multiple Part Packets (mirrors an "
+                    "empty packet after each response). Defaults to on"
+                ),
             },
             {
                 "param_decls": ("--rcon-timeout",),
                 "type": int,
-                "help": "Timeout for RCON connection",
+                "help": "Timeout (in seconds) for each RCON request",
             },
         ]
         global_options["all"] += all_options
@@ -65,8 +94,6 @@ class RconServer(SteamServer):
     config_class: Optional[Type[Config]] = RconServerConfig
     _config: RconServerConfig
 
-    _servers: Dict[str, ServerQuerier] = {}
-
     @property
     def config(self) -> RconServerConfig:
         return super().config
@@ -89,47 +116,167 @@ class RconServer(SteamServer):
         self.logger.debug(f"rcon args: {args}")
         return args
 
+    @property
+    def rcon_pool(self) -> RconPool:
+        args = self._get_rcon_args()
+        key = (args["address"], args["password"])
+        return get_rcon_pool(key, lambda: RconClient(**args))
+
+    def _rcon_ping(self) -> bool:
+        if not self.rcon_pool.check():
+            self.logger.debug("RCON connect failed")
+            return False
+        return True
+
+    def _stop(self, pid: Optional[int] = None) -> None:
+        super()._stop(pid=pid)
+        # the server closes its RCON connections as it shuts down
+        if self.is_rcon_enabled():
+            self.rcon_pool.close()
+
+    def _get_startup_probes(self) -> List[Probe]:
+        probes = super()._get_startup_probes()
+        if self.is_rcon_enabled():
+            probes.append(Probe(self._rcon_ping, name="rcon connect"))
+        return probes
+
     def is_accessible(self):
         is_accessible = super().is_accessible()
         if is_accessible and self.is_rcon_enabled():
-            rcon = RCON(**self._get_rcon_args())
-            try:
-                rcon.connect()
-            except ConnectionRefusedError:
-                self.logger.debug("RCON connect failed")
-                is_accessible = False
+            is_accessible = self._rcon_ping()
         return is_accessible
 
     def _command_exists(self, command: str) -> bool:
         return super()._command_exists(command) and self.is_rcon_enabled()
 
-    @multi_instance
+    def _get_save_kwargs(self) -> dict:
+        if self.config.save_response is None:
+            return {}
+        return {"expect": self.config.save_response}
+
+    def _get_commands(
+        self, command_string: Optional[str], batch: Optional[List[str]]
+    ) -> List[str]:
+        commands = list(batch or [])
+        if command_string is not None:
+            commands.insert(0, command_string)
+        if len(commands) == 0:
+            raise click.UsageError("must provide command_string or --batch")
+        return commands
+
+    def _handle_outputs(
+        self,
+        commands: List[str],
+        outputs: Union[List[str], Exception],
+        do_print: bool,
+        expect: Optional[str],
+    ) -> int:
+        """ prints the responses to commands and checks them for expect """
+
+        if isinstance(outputs, RCON_ERRORS):
+            self.logger.debug(f"RCON command failed: {outputs}")
+            if do_print:
+                self.logger.warning("could not connect to RCON")
+            return STATUS_FAILED
+        elif isinstance(outputs, Exception):
+            raise outputs
+
+        if do_print:
+            for command, output in zip(commands, outputs):
+                if len(commands) > 1:
+                    self.logger.info(f"> {command}")
+                if output:
+                    self.logger.info(output)
+
+        if expect is not None and not any(
+            re.search(expect, output or "") for output in outputs
+        ):
+            self.logger.debug(f"RCON response did not match {expect}")
+            return STATUS_PARTIAL_FAIL
+        return STATUS_SUCCESS
+
+    def _command_instances(
+        self,
+        instance_names: List[str],
+        command_string: Optional[str] = None,
+        batch: Optional[List[str]] = None,
+        do_print: bool = True,
+        expect: Optional[str] = None,
+        *args,
+        **kwargs,
+    ) -> List[int]:
+        """
+        runs console command(s) against many instances at once, the RCON
+        connections to every instance are driven from a single event loop
+        """
+
+        commands = self._get_commands(command_string, batch)
+        instance_names = list(instance_names)
+        current_instance = self.config.instance_name
+        multi_instance = self.config.multi_instance
+
+        results = [STATUS_PARTIAL_FAIL] * len(instance_names)
+        batches = []
+        for index, instance_name in enumerate(instance_names):
+            self.set_instance(instance_name, True)
+            if not self.is_running():
+                self.logger.warning(f"{self.server_name} is not running")
+            elif not self.is_rcon_enabled():
+                if do_print:
+                    self.logger.warning(
+                        f"{self.server_name} does not have RCON enabled"
+                    )
+            else:
+                batches.append((index, self._get_rcon_args()))
+
+        responses = execute_batches([(a, commands) for _, a in batches])
+        for (index, _), outputs in zip(batches, responses):
+            self.set_instance(instance_names[index], True)
+            if do_print:
+                self.logger.success(f"{self.server_name}:")
+            results[index] = self._handle_outputs(
+                commands, outputs, do_print, expect
+            )
+
+        self.set_instance(current_instance, multi_instance)
+        return results
+
+    @multi_instance(gather="_command_instances")
     @click.command(cls=ServerCommandClass)
-    @click.argument("command_string")
+    @click.argument("command_string", required=False)
+    @click.option(
+        "-b",
+        "--batch",
+        type=click.File("r"),
+        callback=read_batch_file,
+        help=(
+            "File of commands to run, one per line, sent down a single "
+            "RCON connection. Use - to read from stdin"
+        ),
+    )
     @click.pass_obj
     def command(
-        self, command_string: str, do_print: bool = True, *args, **kwargs
+        self,
+        command_string: Optional[str] = None,
+        batch: Optional[List[str]] = None,
+        do_print: bool = True,
+        expect: Optional[str] = None,
+        *args,
+        **kwargs,
     ):
-        """ runs console command using RCON """
+        """ runs console command(s) using RCON """
+
+        commands = self._get_commands(command_string, batch)
 
         if self.is_running():
             if self.is_rcon_enabled():
-                output = None
-                rcon = RCON(**self._get_rcon_args())
                 try:
-                    rcon.connect()
-                except ConnectionRefusedError:
-                    if do_print:
-                        self.logger.warning("could not connect to RCON")
-                    return STATUS_FAILED
-                else:
-                    rcon.authenticate()
-                    output = rcon.execute(command_string).text
-                    rcon.close()
-
-                    if do_print and output is not None:
-                        self.logger.info(output)
-                    return STATUS_SUCCESS
+                    outputs = self.rcon_pool.execute_many(commands)
+                except RCON_ERRORS as ex:
+                    outputs = ex
+                return self._handle_outputs(
+                    commands, outputs, do_print, expect
+                )
 
             if do_print:
                 self.logger.warning(
@@ -1,11 +1,12 @@
 from subprocess import CalledProcessError  # nosec
-from typing import Optional, Type
+from typing import List, Optional, Type
 
 import click
 import psutil
 
 from gs_manager.command import Config, ServerCommandClass
 from gs_manager.decorators import multi_instance, require, single_instance
+from gs_manager.process import ProcessEntry, ProcessIndex
 from gs_manager.servers.base import (
     STATUS_FAILED,
     STATUS_SUCCESS,
@@ -36,6 +37,12 @@ class ScreenServer(BaseServer):
         except CalledProcessError:
             pass
 
+    def _match_pids(self, index: ProcessIndex) -> List[ProcessEntry]:
+        matches = index.find_screen_session(self.server_name)
+        if len(matches) == 0:
+            matches = super()._match_pids(index)
+        return matches
+
     def _stop(self, pid: Optional[int] = None) -> None:
         if pid is None:
             pid = self._get_child_pid()
@@ -1,19 +1,31 @@
 import os
-import re
 import time
-from queue import Empty, Queue
-from threading import Thread
-from typing import List, Optional, Type, Dict
-from subprocess import CalledProcessError  # nosec
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
 
 import click
-import click_spinner
 import requests
 from steamfiles import acf
 
+from gs_manager.a2s import A2S_INFO, Address, ping, query_info, query_servers
 from gs_manager.command import Config, ServerCommandClass
 from gs_manager.command.validators import GenericConfigType, ListFlatten
 from gs_manager.decorators import multi_instance, require, single_instance
+from gs_manager.dedupe import (
+    DEDUPE_MODES,
+    DedupeStore,
+    get_default_store_path,
+)
+from gs_manager.releases import STAGE_MODES, ReleaseManager
 from gs_manager.servers.base import (
     STATUS_FAILED,
     STATUS_PARTIAL_FAIL,
@@ -21,25 +33,40 @@ from gs_manager.servers.base import (
     BaseServer,
     BaseServerConfig,
 )
-from gs_manager.utils import get_server_path
-from valve.source import NoResponseError
-from valve.source.a2s import ServerQuerier
+from gs_manager.steamcmd import (
+    EventCallback,
+    SteamCmdError,
+    SteamCmdProgress,
+    SteamCmdSession,
+    get_steamcmd_session,
+)
+from gs_manager.utils import format_bytes, get_param_obj, get_server_path
+from gs_manager.wait import Probe
+from gs_manager.workshop import PublishedFileResolver
 
 __all__ = ["SteamServer", "SteamServerConfig"]
 
-STEAM_PUBLISHED_FILES_API = "https://api.steampowered.com/ISteamRemoteStorage/GetPublishedFileDetails/v1"  # noqa
 
+QUERY_CACHE_NAMESPACE = "a2s_info"
+BUILD_ID_CACHE_NAMESPACE = "steam_build_id"
 
-def _enqueue_output(out, queue):
-    for line in iter(out.readline, b""):
-        queue.put(line)
-    out.close()
+
+def _address_key(address: Address) -> str:
+    return f"{address[0]}:{address[1]}"
 
 
 class SteamServerConfig(BaseServerConfig):
     steamcmd_path: str = "steamcmd"
     steam_query_ip: str = "127.0.0.1"
     steam_query_port: Optional[int] = None
+    steam_query_timeout: int = 5
+    build_id_ttl: int = 300
+    workshop_ttl: int = 300
+    stage_clone_mode: str = "reflink"
+    keep_releases: int = 1
+    dedupe_store_path: Optional[str] = None
+    dedupe_mode: str = "reflink"
+    dedupe_after_install: bool = False
     workshop_id: int = None
     workshop_items: List[str] = []
     steam_username: str = None
@@ -78,6 +105,55 @@ class SteamServerConfig(BaseServerConfig):
                 "type": int,
                 "help": "IP to query to check if server is accessible",
             },
+            {
+                "param_decls": ("--steam-query-timeout",),
+                "type": int,
+                "help": "Timeout (in seconds) for querying servers",
+            },
+            {
+                "param_decls": ("--build-id-ttl",),
+                "type": int,
+                "help": (
+                    "Max age (in seconds) of a cached build ID to use when "
+                    "checking for updates"
+                ),
+            },
+            {
+                "param_decls": ("--workshop-ttl",),
+                "type": int,
+                "help": (
+                    "Max age (in seconds) of cached workshop item update "
+                    "times to use when checking for updates"
+                ),
+            },
+            {
+                "param_decls": ("--stage-clone-mode",),
+                "type": click.Choice(STAGE_MODES),
+                "help": (
+                    "How to clone server_path for staged installs. reflink "
+                    "falls back to copy if the filesystem does not support "
+                    "it. hardlink is not allowed, steamcmd would patch the "
+                    "live release in place"
+                ),
+            },
+            {
+                "param_decls": ("--dedupe-store-path",),
+                "type": click.Path(),
+                "help": (
+                    "Path to the store identical files are shared from. Must "
+                    "be on the same filesystem as server_path"
+                ),
+            },
+            {
+                "param_decls": ("--dedupe-mode",),
+                "type": click.Choice(DEDUPE_MODES),
+                "help": (
+                    "How to share identical files with the store. hardlink "
+                    "works on any filesystem, but a file written in place "
+                    "changes in every install. Links are broken again "
+                    "before every update and saves/logs are never linked"
+                ),
+            },
             {
                 "param_decls": ("--steam-username",),
                 "type": str,
@@ -99,98 +175,115 @@ class SteamServer(BaseServer):
     config_class: Optional[Type[Config]] = SteamServerConfig
     _config: SteamServerConfig
 
-    _servers: Dict[str, ServerQuerier] = {}
+    # A2S_INFO results for instances queried together by status
+    _query_results: Dict[str, Tuple[float, Optional[Dict[str, Any]]]] = {}
 
     @property
     def config(self) -> SteamServerConfig:
         return super().config
 
     @property
-    def server(self) -> Optional[ServerQuerier]:
+    def query_address(self) -> Optional[Address]:
         if self.is_query_enabled():
-            if self._servers.get(self.server_name) is None:
-                self._servers[self.server_name] = ServerQuerier(
-                    (
-                        self.config.steam_query_ip,
-                        int(self.config.steam_query_port),
-                    ),
-                )
-            return self._servers[self.server_name]
+            return (
+                self.config.steam_query_ip,
+                int(self.config.steam_query_port),
+            )
         return None
 
-    def is_accessible(self) -> bool:
-        if self.is_query_enabled():
-            try:
-                self.server.ping()
-            except NoResponseError:
-                return False
-        return True
+    def _query_ping(self) -> bool:
+        return ping(
+            self.query_address, timeout=self.config.steam_query_timeout
+        )
 
-    def is_query_enabled(self) -> bool:
-        return self.config.steam_query_port is not None
+    def _prefetch_query_info(self, max_age: int) -> None:
+        """ queries every running instance at once """
 
-    def _parse_line(self, bar, line):
-        step_name = line.group("step_name")
-        current = int(line.group("current"))
-        total = int(line.group("total"))
-        self.logger.debug(
-            "processed: {}: {} / {}".format(step_name, current, total)
-        )
-        if bar is None and current < total:
-            bar = click.progressbar(
-                length=total,
-                show_eta=False,
-                show_percent=True,
-                label=step_name,
-            )
-        if bar is not None:
-            bar.update(current)
+        current_instance = self.config.instance_name
+        multi_instance = self.config.multi_instance
 
-    def _wait_until_validated(
-        self, app_id, process, detailed_status=False, force=False
-    ):
-        update_verb = "updating"
-        if force:
-            update_verb = "valdiating"
+        addresses = {}
+        for instance_name in self.config.all_instance_names:
+            self.set_instance(instance_name, True)
+            if self.is_query_enabled() and self.is_running(delete_pid=False):
+                addresses[self.server_name] = self.query_address
 
-        if detailed_status:
-            # this does not work as expected because of a steamcmd bug
-            # https://github.com/ValveSoftware/Source-1-Games/issues/1684
-            # https://github.com/ValveSoftware/Source-1-Games/issues/1929
-            buffer = Queue()
-            thread = Thread(
-                target=_enqueue_output,
-                args=(process.stdout, buffer),
-                daemon=True,
-            )
-            thread.start()
+        self.set_instance(current_instance, multi_instance)
 
-            bar = None
-            line_re = re.compile(
-                r"Update state \(0x\d+\) (?P<step_name>\w+), progress: "
-                r"\d+\.\d+ \((?P<current>\d+) \/ (?P<total>\d+)\)"
+        now = time.monotonic()
+        self._query_results.clear()
+        stale = {}
+        for server_name, address in addresses.items():
+            info = self.cache.get(
+                QUERY_CACHE_NAMESPACE, _address_key(address), max_age
             )
+            if info is None:
+                stale[server_name] = address
+            else:
+                self._query_results[server_name] = (now, info)
 
-            self.logger.debug("start processing output...")
-            while True:
-                try:
-                    line = buffer.get_nowait().decode("utf-8").strip()
-                except Empty:
-                    time.sleep(0.1)
-                else:
-                    self.logger.debug("line: {}".format(line))
-                    self._parse_line(bar, line_re.match(line))
-
-                if process.poll() is not None and buffer.empty():
-                    break
-        else:
-            self.logger.info(
-                f"{update_verb} {app_id}...", nl=False,
-            )
+        if len(stale) == 0:
+            return
+
+        self.logger.debug(f"querying {len(stale)} instance(s)")
+        results = query_servers(
+            stale.values(), timeout=self.config.steam_query_timeout
+        )
+        for server_name, address in stale.items():
+            info = results[address].get(A2S_INFO)
+            if info is not None:
+                self.cache.set(
+                    QUERY_CACHE_NAMESPACE, _address_key(address), info
+                )
+            self._query_results[server_name] = (now, info)
+
+    def _query_info(
+        self, max_age: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        gets A2S_INFO for the current instance, from the cache if there is a
+        result younger than max_age. When running for multiple instances,
+        all of them are queried together on the first call so the instances
+        that are down only cost a single timeout
+        """
+
+        max_age = self._get_max_age(max_age)
+        address = self.query_address
+        info = self.cache.get(
+            QUERY_CACHE_NAMESPACE, _address_key(address), max_age
+        )
+        if info is not None:
+            self.logger.debug(f"using cached query result for {address}")
+            return info
+
+        if self.config.multi_instance and self.config.instance_name:
+            cached = self._query_results.get(self.server_name)
+            timeout = self.config.steam_query_timeout
+            if cached is None or time.monotonic() - cached[0] > timeout:
+                self._prefetch_query_info(max_age)
+            cached = self._query_results.pop(self.server_name, None)
+            if cached is not None:
+                return cached[1]
+
+        info = query_info(address, timeout=self.config.steam_query_timeout)
+        if info is not None:
+            self.cache.set(QUERY_CACHE_NAMESPACE, _address_key(address), info)
+        return info
+
+    def _get_startup_probes(self) -> List[Probe]:
+        if self.is_query_enabled():
+            return [Probe(self._query_ping, name="a2s ping")]
+        return [
+            Probe(lambda: self.is_running(delete_pid=False), name="running")
+        ]
+
+    def is_accessible(self) -> bool:
+        if self.is_query_enabled():
+            return self._query_ping()
+        return True
 
-            with click_spinner.spinner():
-                while process.poll() is None:
-                    time.sleep(1)
+    def is_query_enabled(self) -> bool:
+        return self.config.steam_query_port is not None
 
     def _check_steam_for_update(self, app_id: str, branch: str):
         manifest_file = get_server_path(
@@ -205,40 +298,78 @@ class SteamServer(BaseServer):
         with open(manifest_file, "r") as f:
             manifest = acf.load(f)
 
-        stdout = self.run_command(
-            (
-                f"{self.config.steamcmd_path} +app_info_update 1 "
-                f"+app_info_print {app_id} +quit"
-            ),
-            redirect_output=True,
-        )
-        index = stdout.find(f'"{app_id}"')
-        app_info = acf.loads(stdout[index:])
-
-        try:
-            current_buildid = app_info[app_id]["depots"]["branches"][branch][
-                "buildid"
-            ]
-        except KeyError:
-            self.logger.debug("Failed to parse remote manifest")
+        current_buildid = self._get_latest_build_id(app_id, branch)
+        if current_buildid is None:
             return True
 
         self.logger.debug(f"current: {manifest['AppState']['buildid']}")
         self.logger.debug(f"latest: {current_buildid}")
         return manifest["AppState"]["buildid"] != current_buildid
 
-    def _get_published_file(self, file_id):
-        s = requests.Session()
-        adapter = requests.adapters.HTTPAdapter(max_retries=5)
-        s.mount("http://", adapter)
+    def _get_latest_build_id(self, app_id: str, branch: str) -> Optional[str]:
+        """
+        gets the latest build ID for an app branch. Build IDs are cached
+        for every server on the host, so servers sharing an app only run
+        steamcmd once per build_id_ttl
+        """
+
+        key = f"{app_id}:{branch}"
+        ttl = self.config.build_id_ttl
+
+        build_id = self.cache.get(BUILD_ID_CACHE_NAMESPACE, key, ttl)
+        if build_id is not None:
+            self.logger.debug(f"using cached build ID for {key}")
+            return build_id
 
-        r = s.post(
-            STEAM_PUBLISHED_FILES_API,
-            {"itemcount": 1, "publishedfileids[0]": file_id},
+        # other servers may be checking the same app right now
+        with self.cache.lock(BUILD_ID_CACHE_NAMESPACE, key):
+            build_id = self.cache.get(BUILD_ID_CACHE_NAMESPACE, key, ttl)
+            if build_id is not None:
+                self.logger.debug(f"using cached build ID for {key}")
+                return build_id
+
+            try:
+                stdout = self.steamcmd.app_info(app_id)
+            except SteamCmdError as ex:
+                self.logger.debug(f"Failed to get remote manifest: {ex}")
+                return None
+            index = stdout.find(f'"{app_id}"')
+
+            try:
+                app_info = acf.loads(stdout[index:])
+                build_id = app_info[app_id]["depots"]["branches"][branch][
+                    "buildid"
+                ]
+            except (KeyError, ValueError):
+                self.logger.debug("Failed to parse remote manifest")
+                return None
+
+            self.cache.set(BUILD_ID_CACHE_NAMESPACE, key, build_id)
+        return build_id
+
+    @property
+    def published_files(self) -> PublishedFileResolver:
+        return PublishedFileResolver(
+            cache=self.cache, max_age=self.config.workshop_ttl
         )
-        r.raise_for_status()
 
-        return r.json()
+    def _get_was_running(self) -> Union[bool, List[str]]:
+        """ running instance names, or a bool if there are no instances """
+
+        running = self._get_running_instances()
+        if running is None:
+            return self.is_running()
+        return running
+
+    def _get_instance_kwargs(self, was_running) -> dict:
+        """ arguments to run a command against the instances in was_running """
+
+        if isinstance(was_running, bool) or was_running == ["default"]:
+            return {}
+        return {
+            "parallel": True,
+            "current_instance": f"@each:{','.join(was_running)}",
+        }
 
     def _stop_servers(self, was_running, reason: Optional[str] = None):
         current_instance = self.config.instance_name
@@ -252,23 +383,19 @@ class SteamServer(BaseServer):
             self.set_instance(None, False)
             self.invoke(
                 self.say,
-                command_string=f"{reason}. Server restarting in 5 minutes",
+                message=f"{reason}. Server restarting in 5 minutes",
                 do_print=False,
-                parallel=True,
-                current_instances=f"@each:{','.join(was_running)}",
+                **self._get_instance_kwargs(was_running),
             )
             self._wait(300 - self.config.pre_stop)
 
         if self._command_exists("save_command"):
             self.logger.info("saving servers...")
             self.set_instance(None, False)
-            self.invoke(
-                self.command,
-                command_string=self.config.save_command,
-                do_print=False,
-                parallel=True,
-                current_instances=f"@each:{','.join(was_running)}",
-            )
+            if isinstance(was_running, bool):
+                self._save_servers()
+            else:
+                self._save_servers(was_running)
 
         self.set_instance(None, False)
         self.invoke(
@@ -276,8 +403,7 @@ class SteamServer(BaseServer):
             force=False,
             reason="New updates found.",
             verb="restarting",
-            parallel=True,
-            current_instances=f"@each:{','.join(was_running)}",
+            **self._get_instance_kwargs(was_running),
         )
 
         self.set_instance(current_instance, multi_instance)
@@ -302,16 +428,12 @@ class SteamServer(BaseServer):
         multi_instance = self.config.multi_instance
 
         self.set_instance(None, False)
-        if len(was_running) == 1 and was_running[0] == "default":
-            self.invoke(self.start, no_verify=False, foreground=False)
-        else:
-            self.invoke(
-                self.start,
-                no_verify=False,
-                foreground=False,
-                parallel=True,
-                current_instances=f"@each:{','.join(was_running)}",
-            )
+        self.invoke(
+            self.start,
+            no_verify=False,
+            foreground=False,
+            **self._get_instance_kwargs(was_running),
+        )
 
         self.set_instance(current_instance, multi_instance)
 
@@ -326,11 +448,128 @@ class SteamServer(BaseServer):
 
         return was_running
 
+    @property
+    def releases(self) -> ReleaseManager:
+        return ReleaseManager(
+            self.config.server_path, keep=self.config.keep_releases
+        )
+
+    @property
+    def dedupe_store(self) -> DedupeStore:
+        return DedupeStore(
+            self.config.dedupe_store_path
+            or get_default_store_path(self.config.server_path),
+            mode=self.config.dedupe_mode,
+        )
+
+    def _get_writable_paths(self) -> List[str]:
+        """
+        paths relative to server_path the server writes to while running.
+        They are never shared with the dedupe store
+        """
+
+        paths = []
+        if self.config.backup_directory:
+            paths.append(self.config.backup_directory)
+        if self.config.server_log:
+            paths.append(os.path.dirname(self.config.server_log))
+        return paths
+
+    def _dedupe(self, path: str) -> None:
+        store = self.dedupe_store
+        try:
+            self.logger.info(f"deduplicating {path} against {store.path}...")
+            report = store.add_tree(
+                path,
+                name=f"app_{self.config.app_id}",
+                exclude=self._get_writable_paths(),
+            )
+        finally:
+            store.close()
+        self.logger.success(str(report))
+
+    def _seed(self, path: str) -> None:
+        """ links files from the dedupe store into a new install """
+
+        store = self.dedupe_store
+        try:
+            report = store.seed_tree(f"app_{self.config.app_id}", path)
+        finally:
+            store.close()
+        if report.files > 0:
+            self.logger.info(
+                f"seeded {report.files} file(s) "
+                f"({format_bytes(report.bytes)}) from {store.path}"
+            )
+
+    def _unshare(self, path: str) -> None:
+        """ breaks hardlinks to the store before steamcmd patches files """
+
+        if self.config.dedupe_mode != "hardlink":
+            return
+
+        store = self.dedupe_store
+        try:
+            copied = store.unshare_tree(path)
+        finally:
+            store.close()
+        if copied > 0:
+            self.logger.debug(f"unshared {copied} hardlinked file(s)")
+
+    def _staged_install(self, app_id: str, restart: bool, was_running) -> int:
+        """
+        updates a clone of server_path while the servers keep running. The
+        servers are only down for the switch over to the new release
+        """
+
+        if self.config.stage_clone_mode not in STAGE_MODES:
+            raise click.BadParameter(
+                f"must be one of {', '.join(STAGE_MODES)}",
+                self.context,
+                get_param_obj(self.context, "stage_clone_mode"),
+            )
+
+        releases = self.releases
+        self.logger.info("cloning server for staged update...")
+        stage_path, snapshot = releases.stage(self.config.stage_clone_mode)
+        self._unshare(stage_path)
+
+        self.logger.info(f"updating {app_id} in {stage_path}...")
+        try:
+            with self._steamcmd_progress() as on_event:
+                result = self.steamcmd.app_update(
+                    app_id, stage_path, validate=True, on_event=on_event
+                )
+        except SteamCmdError as ex:
+            releases.discard(stage_path)
+            self.logger.error(f"\n{ex.message}")
+            return STATUS_FAILED
+        self.logger.debug(result.output)
+
+        if not result.success:
+            releases.discard(stage_path)
+            self.logger.error(f"\nfailed to validate {self.server_name}")
+            return STATUS_FAILED
+
+        if was_running:
+            self._stop_servers(was_running, reason="Updates found for game")
+
+        synced = releases.sync(stage_path, snapshot)
+        self.logger.debug(f"synced {synced} file(s) changed while updating")
+        release_path = releases.activate(stage_path)
+
+        self.logger.success(f"\nvalidated {app_id}, now using {release_path}")
+        self._start_servers(restart, was_running)
+        if self.config.dedupe_after_install:
+            self._dedupe(release_path)
+        return STATUS_SUCCESS
+
     def _steam_login(self) -> str:
+        """ credentials for steamcmd's login command """
+
         if self.config.steam_username and self.config.steam_password:
             return (
-                f"+login {self.config.steam_username} "
-                f"{self.config.steam_password}"
+                f"{self.config.steam_username} {self.config.steam_password}"
             )
         elif self.config.steam_requires_login:
             raise click.BadParameter(
@@ -341,7 +580,62 @@ class SteamServer(BaseServer):
                 self.context,
             )
 
-        return "+login anonymous"
+        return "anonymous"
+
+    @property
+    def steamcmd(self) -> SteamCmdSession:
+        """ shared, logged in steamcmd session """
+
+        return get_steamcmd_session(
+            self.config.steamcmd_path, self._steam_login()
+        )
+
+    @contextmanager
+    def _steamcmd_progress(self) -> Iterator[EventCallback]:
+        """ progress bar for steamcmd updates, with one bar per phase """
+
+        bars = []
+
+        def _show_item(event: Optional[SteamCmdProgress]) -> Optional[str]:
+            if event is None:
+                return None
+            return str(event)
+
+        def _on_event(event: SteamCmdProgress) -> None:
+            self.logger.debug(
+                f"{event.phase}: {event.current}/{event.total} "
+                f"rate: {event.rate} eta: {event.eta}"
+            )
+            if event.total == 0:
+                return
+
+            bar = bars[-1] if len(bars) > 0 else None
+            if (
+                bar is None
+                or bar.label != event.phase
+                or bar.length != event.total
+                or event.current < bar.pos
+            ):
+                if bar is not None:
+                    bar.render_finish()
+                bar = click.progressbar(
+                    length=event.total,
+                    label=event.phase,
+                    show_eta=False,
+                    show_percent=True,
+                    item_show_func=_show_item,
+                )
+                bar.render_progress()
+                bars.append(bar)
+
+            bar.current_item = event
+            bar.update(event.current - bar.pos)
+
+        try:
+            yield _on_event
+        finally:
+            if len(bars) > 0:
+                bars[-1].render_finish()
 
     def str_mods(self, mods):
         mods = [str(mod) for mod in mods]
@@ -349,45 +643,49 @@ class SteamServer(BaseServer):
 
     @multi_instance
     @click.command(cls=ServerCommandClass)
+    @click.option(
+        "--max-age",
+        type=int,
+        help=(
+            "Max age (in seconds) of a cached query result to use, 0 to "
+            "always query the server. Defaults to --cache-ttl"
+        ),
+    )
     @click.pass_obj
-    def status(self, *args, **kwargs):
+    def status(self, max_age: Optional[int] = None, *args, **kwargs):
         """ checks if Steam server is running or not """
 
         if not self.is_running():
-            self._find_pid(False)
+            self._find_pid(False, refresh=False)
 
         if self.is_running():
-            try:
-                if self.is_query_enabled():
-                    server_info = self.server.info()
-                    self.logger.success(f"{self.server_name} is running")
-                    self.logger.info(
-                        f"server name: {server_info['server_name']}"
-                    )
-                    self.logger.info(f"map: {server_info['map']}")
-                    self.logger.info(f"game: {server_info['game']}")
-                    self.logger.info(
-                        f"players: {server_info['player_count']}/"
-                        f"{server_info['max_players']} "
-                        f"({server_info['bot_count']} bots)"
+            if self.is_query_enabled():
+                server_info = self._query_info(max_age)
+                if server_info is None:
+                    self.logger.error(
+                        f"{self.server_name} is running but not accesible"
                     )
-                    self.logger.info(
-                        f"server type: {server_info['server_type']}"
-                    )
-                    self.logger.info(
-                        "password protected: "
-                        f"{server_info['password_protected']}"
-                    )
-                    self.logger.info(f"VAC: {server_info['vac_enabled']}")
-                    self.logger.info(f"version: {server_info['version']}")
-                else:
-                    self.logger.success(f"{self.server_name} is running")
-                return STATUS_SUCCESS
-            except NoResponseError:
-                self.logger.error(
-                    f"{self.server_name} is running but not accesible"
+                    return STATUS_PARTIAL_FAIL
+
+                self.logger.success(f"{self.server_name} is running")
+                self.logger.info(f"server name: {server_info['server_name']}")
+                self.logger.info(f"map: {server_info['map']}")
+                self.logger.info(f"game: {server_info['game']}")
+                self.logger.info(
+                    f"players: {server_info['player_count']}/"
+                    f"{server_info['max_players']} "
+                    f"({server_info['bot_count']} bots)"
                 )
-                return STATUS_PARTIAL_FAIL
+                self.logger.info(f"server type: {server_info['server_type']}")
+                self.logger.info(
+                    "password protected: "
+                    f"{server_info['password_protected']}"
+                )
+                self.logger.info(f"VAC: {server_info['vac_enabled']}")
+                self.logger.info(f"version: {server_info['version']}")
+            else:
+                self.logger.success(f"{self.server_name} is running")
+            return STATUS_SUCCESS
 
         self.logger.warning(f"{self.server_name} is not running")
         return STATUS_FAILED
@@ -416,6 +714,14 @@ class SteamServer(BaseServer):
         is_flag=True,
         help="Do a restart if instances are running",
     )
+    @click.option(
+        "--staged",
+        is_flag=True,
+        help=(
+            "Update a clone of the server while instances keep running and "
+            "only stop them to switch over to it"
+        ),
+    )
     @click.command(cls=ServerCommandClass)
     @click.pass_obj
     def install(
@@ -424,6 +730,7 @@ class SteamServer(BaseServer):
         force: bool,
         stop: bool,
         restart: bool,
+        staged: bool = False,
         app_id: Optional[int] = None,
         *args,
         **kwargs,
@@ -444,7 +751,7 @@ class SteamServer(BaseServer):
 
         was_running = False
         if not allow_run:
-            was_running = self.is_running(check_all=True)
+            was_running = self._get_was_running()
             if was_running:
                 if not (restart or stop):
                     self.logger.warning(
@@ -452,26 +759,50 @@ class SteamServer(BaseServer):
                         "is still running"
                     )
                     return STATUS_PARTIAL_FAIL
-                self._stop_servers(
-                    was_running, reason="Updates found for game"
-                )
+                if not staged:
+                    self._stop_servers(
+                        was_running, reason="Updates found for game"
+                    )
+
+        if staged:
+            return self._staged_install(app_id, restart, was_running)
+
+        update_verb = "updating"
+        if force:
+            update_verb = "valdiating"
 
-        process = self.run_command(
-            (
-                f"{self.config.steamcmd_path} {self._steam_login()} "
-                f"+force_install_dir {self.config.server_path} +app_update "
-                f"{app_id} validate +quit"
-            ),
-            redirect_output=True,
-            return_process=True,
+        self._unshare(self.config.server_path)
+        manifest_file = get_server_path(
+            ["steamapps", f"appmanifest_{app_id}.acf"]
         )
+        if self.config.dedupe_after_install and not os.path.isfile(
+            manifest_file
+        ):
+            self._seed(self.config.server_path)
+
+        self.logger.info(f"{update_verb} {app_id}...")
+        try:
+            with self._steamcmd_progress() as on_event:
+                result = self.steamcmd.app_update(
+                    app_id,
+                    self.config.server_path,
+                    validate=True,
+                    on_event=on_event,
+                )
+        except SteamCmdError as ex:
+            self.logger.error(f"\n{ex.message}")
+            return STATUS_FAILED
+        self.logger.debug(result.output)
 
-        self._wait_until_validated(app_id, process, force=force)
+        for summary in result.phases.values():
+            self.logger.info(str(summary))
 
-        if process.returncode == 0:
+        if result.success:
             self.logger.success("\nvalidated {}".format(app_id))
 
             self._start_servers(restart, was_running)
+            if self.config.dedupe_after_install:
+                self._dedupe(self.config.server_path)
             return STATUS_SUCCESS
         else:
             self.logger.error(
@@ -479,6 +810,164 @@ class SteamServer(BaseServer):
             )
             return STATUS_FAILED
 
+    @single_instance
+    @click.command(cls=ServerCommandClass)
+    @click.option(
+        "-s",
+        "--stop",
+        is_flag=True,
+        help="Do a shutdown if instances are running",
+    )
+    @click.option(
+        "-r",
+        "--restart",
+        is_flag=True,
+        help="Do a restart if instances are running",
+    )
+    @click.pass_obj
+    def rollback(self, stop: bool, restart: bool, *args, **kwargs) -> int:
+        """ switches back to the release before the last staged install """
+
+        releases = self.releases
+        if releases.previous is None:
+            self.logger.error("no previous release to roll back to")
+            return STATUS_FAILED
+
+        was_running = self._get_was_running()
+        if was_running:
+            if not (restart or stop):
+                self.logger.warning(
+                    f"at least once instance of {self.config.app_id} "
+                    "is still running"
+                )
+                return STATUS_PARTIAL_FAIL
+            self._stop_servers(was_running, reason="Rolling back update")
+
+        start_servers = os.path.join(releases.current, ".start_servers")
+        previous = releases.rollback()
+        if os.path.exists(start_servers):
+            os.replace(
+                start_servers, os.path.join(previous, ".start_servers")
+            )
+
+        self.logger.success(f"rolled back to {previous}")
+        self._start_servers(restart, was_running)
+        return STATUS_SUCCESS
+
+    @single_instance
+    @click.command(cls=ServerCommandClass)
+    @click.option(
+        "--gc",
+        is_flag=True,
+        help="Remove hardlinked store files no install uses anymore",
+    )
+    @click.pass_obj
+    def dedupe(self, gc: bool, *args, **kwargs) -> int:
+        """ shares identical files with other installs on this host """
+
+        self._dedupe(self.config.server_path)
+        if gc:
+            store = self.dedupe_store
+            try:
+                removed = store.gc()
+            finally:
+                store.close()
+            self.logger.info(f"removed {removed} unused store file(s)")
+        return STATUS_SUCCESS
+
+    def _download_workshop_items(self, force: bool) -> int:
+        """ installs the workshop app and downloads outdated items """
+
+        status = self.invoke(
+            self.install,
+            app_id=self.config.workshop_id,
+            allow_run=True,
+            force=force,
+        )
+
+        if not status == STATUS_SUCCESS:
+            return status
+
+        if len(self.config.workshop_items) == 0:
+            self.logger.warning("\nno workshop items selected for install")
+            return STATUS_PARTIAL_FAIL
+
+        mods_to_update = []
+        manifest_file = get_server_path(
+            [
+                "steamapps",
+                "workshop",
+                f"appworkshop_{self.config.workshop_id}.acf",
+            ],
+        )
+
+        if not force and os.path.isfile(manifest_file):
+            manifest = None
+            with open(manifest_file, "r") as f:
+                manifest = acf.load(f)
+
+            self.logger.info("checking for updates for workshop items...")
+            installed = manifest["AppWorkshop"]["WorkshopItemsInstalled"]
+            workshop_items = [str(i) for i in self.config.workshop_items]
+            try:
+                latest_updates = self.published_files.get_time_updated(
+                    [i for i in workshop_items if i in installed]
+                )
+            except (requests.RequestException, KeyError, ValueError):
+                self.logger.error("\ncould not query Steam for updates")
+                return STATUS_FAILED
+
+            for workshop_item in workshop_items:
+                if workshop_item not in installed:
+                    mods_to_update.append(workshop_item)
+                    continue
+
+                last_update_time = int(
+                    installed[workshop_item]["timeupdated"]
+                )
+                newest_update_time = latest_updates[workshop_item]
+                if (
+                    newest_update_time is None
+                    or last_update_time < newest_update_time
+                ):
+                    mods_to_update.append(workshop_item)
+        else:
+            mods_to_update = self.config.workshop_items
+
+        if len(mods_to_update) == 0:
+            self.logger.success("all workshop items already up to date")
+            return STATUS_SUCCESS
+
+        mods_to_update = self.str_mods(mods_to_update)
+        failed = {}
+        self.logger.info("downloading workshop items...")
+        try:
+            # every item is downloaded through the same logged in steamcmd
+            session = self.steamcmd
+            session.force_install_dir(self.config.server_path)
+            with click.progressbar(mods_to_update) as bar:
+                for workshop_item in bar:
+                    reason = session.workshop_download_item(
+                        self.config.workshop_id, workshop_item
+                    )
+                    if reason is not None:
+                        failed[workshop_item] = reason
+        except SteamCmdError as ex:
+            self.logger.error(f"\n{ex.message}")
+            return STATUS_FAILED
+
+        if len(failed) > 0:
+            for item, reason in failed.items():
+                self.logger.error(
+                    f"\nfailed to download workshop item {item}: {reason}"
+                )
+            if len(failed) == len(mods_to_update):
+                return STATUS_FAILED
+            return STATUS_PARTIAL_FAIL
+
+        self.logger.success("\nvalidated workshop items")
+        return STATUS_SUCCESS
+
     @require("app_id")
     @require("workshop_id")
     @single_instance
@@ -542,7 +1031,7 @@ class SteamServer(BaseServer):
                 return STATUS_SUCCESS
 
         if not allow_run:
-            was_running = self.is_running(check_all=True)
+            was_running = self._get_was_running()
             if was_running:
                 if not (restart or stop):
                     self.logger.warning(
@@ -554,96 +1043,9 @@ class SteamServer(BaseServer):
                     was_running, reason="Updates found for workshop app"
                 )
 
-        status = self.invoke(
-            self.install,
-            app_id=self.config.workshop_id,
-            allow_run=True,
-            force=force,
-        )
-
-        if not status == STATUS_SUCCESS:
-            return status
-
-        if len(self.config.workshop_items) == 0:
-            self.logger.warning("\nno workshop items selected for install")
-            return STATUS_PARTIAL_FAIL
-
-        mods_to_update = []
-        manifest_file = get_server_path(
-            [
-                "steamapps",
-                "workshop",
-                f"appworkshop_{self.config.workshop_id}.acf",
-            ],
-        )
-
-        if not force and os.path.isfile(manifest_file):
-            manifest = None
-            with open(manifest_file, "r") as f:
-                manifest = acf.load(f)
-
-            self.logger.info("checking for updates for workshop items...")
-            with click.progressbar(self.config.workshop_items) as bar:
-                for workshop_item in bar:
-                    workshop_item = str(workshop_item)
-                    if (
-                        workshop_item
-                        not in manifest["AppWorkshop"][
-                            "WorkshopItemsInstalled"
-                        ]
-                    ):
-                        mods_to_update.append(workshop_item)
-                        continue
-
-                    last_update_time = int(
-                        manifest["AppWorkshop"]["WorkshopItemsInstalled"][
-                            workshop_item
-                        ]["timeupdated"]
-                    )
-
-                    try:
-                        latest_metadata = self._get_published_file(
-                            workshop_item
-                        )
-                    except requests.HTTPError:
-                        self.logger.error(
-                            "\ncould not query Steam for updates"
-                        )
-                        return STATUS_FAILED
-
-                    newest_update_time = int(
-                        latest_metadata["response"]["publishedfiledetails"][0][
-                            "time_updated"
-                        ]
-                    )
-
-                    if last_update_time < newest_update_time:
-                        mods_to_update.append(workshop_item)
-        else:
-            mods_to_update = self.config.workshop_items
-
-        if len(mods_to_update) == 0:
-            self.logger.success("all workshop items already up to date")
+        # servers stopped for the update come back even if downloads fail
+        try:
+            status = self._download_workshop_items(force)
+        finally:
             self._start_servers(restart, was_running)
-            return STATUS_SUCCESS
-
-        self.logger.info("downloading workshop items...")
-        with click.progressbar(mods_to_update) as bar:
-            for workshop_item in bar:
-                try:
-                    self.run_command(
-                        (
-                            f"{self.config.steamcmd_path} "
-                            f"{self._steam_login()} +force_install_dir "
-                            f"{self.config.server_path} "
-                            "+workshop_download_item "
-                            f"{self.config.workshop_id} {workshop_item} +quit"
-                        )
-                    )
-                except CalledProcessError:
-                    self.logger.error("\nfailed to validate workshop items")
-                    return STATUS_FAILED
-
-        self.logger.success("\nvalidated workshop items")
-        self._start_servers(restart, was_running)
-        return STATUS_SUCCESS
+        return status
@@ -1,7 +1,8 @@
+import logging
 import os
 import struct
-import zlib
-from typing import Any, Dict, List, Optional, Type
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, Union
 from steamfiles import acf
 import shutil
 
@@ -10,13 +11,17 @@ import click
 from gs_manager.command import Config, ServerCommandClass
 from gs_manager.servers.generic.rcon import RconServer, RconServerConfig
 from gs_manager.decorators import multi_instance, require, single_instance
+from gs_manager.executor import run_jobs
+from gs_manager.mod_store import MOD_STORE_MODES, ModStore
 from gs_manager.command.types import KeyValuePairs
 from gs_manager.servers import (
     STATUS_FAILED,
     STATUS_PARTIAL_FAIL,
     STATUS_SUCCESS,
 )
-from gs_manager.utils import get_server_path, download_file
+from gs_manager.releases import CLONE_MODES
+from gs_manager.ue4 import read_manifest, unpack_tree
+from gs_manager.utils import format_bytes, get_server_path, download_file
 
 __all__ = ["ArkServerConfig", "ArkServer"]
 
@@ -43,6 +48,15 @@ def _make_arg_string(args: dict, prefix: str) -> str:
     return arg_string
 
 
+def _tree_size(path: str) -> int:
+    size = 0
+    for root, _, files in os.walk(path):
+        for filename in files:
+            if not filename.endswith(".uncompressed_size"):
+                size += os.path.getsize(os.path.join(root, filename))
+    return size
+
+
 def _make_command_args(ark_config: Dict[str, dict]) -> str:
     command_args = ark_config["map"]
     command_args += _make_arg_string(ark_config["params"], "?")
@@ -64,9 +78,15 @@ class ArkServerConfig(RconServerConfig):
     stop_command: str = "DoExit"
     say_command: str = "Broadcast {}"
     save_command: str = "SaveWorld"
+    save_response: str = "World Saved"
     max_start: int = 120
     max_stop: int = 120
     rcon_multi_part: bool = False
+    unpack_threads: Optional[int] = None
+    mod_clone_mode: str = "hardlink"
+    mod_store_path: Optional[str] = None
+    mod_store_mode: str = "symlink"
+    mod_workers: Optional[int] = None
 
     workshop_branch: bool = True
     ark_map: str = "TheIsland"
@@ -84,6 +104,7 @@ class ArkServerConfig(RconServerConfig):
         "say_command",
         "stop_command",
         "save_command",
+        "save_response",
         "rcon_multi_part",
         "start_directory",
     ]
@@ -172,31 +193,6 @@ class ArkServer(RconServer):
     def config(self) -> ArkServerConfig:
         return super().config
 
-    def _z_unpack(self, from_path, to_path):
-        """
-        unpacks .z files downloaded from Steam workshop
-
-        adapted from https://github.com/TheCherry/ark-server-manager/blob/master/src/z_unpack.py
-        """  # noqa
-        with open(from_path, "rb") as f_from:
-            with open(to_path, "wb") as f_to:
-                f_from.read(8)
-                size1 = struct.unpack("q", f_from.read(8))[0]
-                f_from.read(8)
-                size2 = struct.unpack("q", f_from.read(8))[0]
-                if size1 == -1641380927:
-                    size1 = 131072
-                runs = (size2 + size1 - 1) / size1
-                array = []
-                for i in range(int(runs)):
-                    array.append(f_from.read(8))
-                    f_from.read(8)
-                for i in range(int(runs)):
-                    to_read = array[i]
-                    compressed = f_from.read(struct.unpack("q", to_read)[0])
-                    decompressed = zlib.decompress(compressed)
-                    f_to.write(decompressed)
-
     def _read_ue4_string(self, file_obj):
         """
         reads a UE4 string from a file object
@@ -314,38 +310,159 @@ class ArkServer(RconServer):
 
         return False
 
-    def _extract_files(self, mod_dir):
-        for root, dirs, files in os.walk(mod_dir):
-            for filename in files:
-                if not filename.endswith(".z"):
-                    continue
-
-                file_path = os.path.join(root, filename)
-                to_extract_path = file_path[:-2]
-                size_file = "{}.uncompressed_size".format(file_path)
-                size = None
-
-                if os.path.isfile(size_file):
-                    with open(size_file, "r") as f:
-                        size = int(f.read().strip())
-                else:
-                    self.logger.debug("{} does not exist".format(size_file))
-                    return False
-
-                self.logger.debug(to_extract_path)
-                self.logger.debug("extracting {}...".format(filename))
-                self._z_unpack(file_path, to_extract_path)
-                u_size = os.stat(to_extract_path).st_size
-                self.logger.debug("{}: {} {}".format(filename, u_size, size))
-                if u_size == size:
-                    os.remove(file_path)
-                    os.remove(size_file)
-                else:
-                    self.logger.error(
-                        "could not validate {}".format(to_extract_path)
-                    )
-                    return False
-        return True
+    @property
+    def mod_store(self) -> Optional[ModStore]:
+        if not self.config.mod_store_path:
+            return None
+        return ModStore(
+            self.config.mod_store_path,
+            mode=self.config.mod_store_mode,
+            clone_mode=self.config.mod_clone_mode,
+        )
+
+    def _get_workshop_times(self, manifest_file: str) -> Dict[str, int]:
+        """ gets when each downloaded workshop item was last updated """
+
+        if not os.path.isfile(manifest_file):
+            return {}
+
+        with open(manifest_file, "r") as f:
+            manifest = acf.load(f)
+
+        installed = manifest["AppWorkshop"].get("WorkshopItemsInstalled", {})
+        return {
+            str(item): int(info["timeupdated"])
+            for item, info in installed.items()
+        }
+
+    def _get_writable_paths(self) -> List[str]:
+        # saves and configs, and mods which are managed by workshop_download
+        return super()._get_writable_paths() + [
+            os.path.join("ShooterGame", "Saved"),
+            os.path.join("ShooterGame", "Content", "Mods"),
+        ]
+
+    def _get_mod_instances(self) -> Dict[str, List[str]]:
+        """ maps each mod ID to the instances that load it """
+
+        current_instance = self.config.instance_name
+        multi_instance = self.config.multi_instance
+
+        mod_instances: Dict[str, List[str]] = {}
+        for instance_name in self.config.all_instance_names:
+            self.set_instance(instance_name, True)
+            mod_ids = self.config.ark_config["params"].get("GameModIds")
+            for mod_id in str(mod_ids or "").split(","):
+                if mod_id:
+                    mod_instances.setdefault(mod_id, []).append(instance_name)
+
+        self.set_instance(current_instance, multi_instance)
+        return mod_instances
+
+    def _get_affected_instances(
+        self, mods: List[str]
+    ) -> Union[bool, List[str]]:
+        """
+        gets the running instances that load any of mods, instances using
+        other mods can keep running while they are updated. Without
+        instances, returns if the server is running
+        """
+
+        if len(self.config.all_instance_names) == 0:
+            return self.is_running()
+
+        mod_instances = self._get_mod_instances()
+        uses_mods = set()
+        for mod in mods:
+            uses_mods.update(mod_instances.get(str(mod), []))
+
+        affected = []
+        for instance_name, running in zip(
+            self.config.all_instance_names, self.is_running(check_all=True)
+        ):
+            if not running:
+                continue
+            if instance_name in uses_mods:
+                affected.append(instance_name)
+            else:
+                self.logger.info(
+                    f"{instance_name} does not use any updated mods, "
+                    "leaving it running"
+                )
+        return affected
+
+    def _install_mod(
+        self,
+        mod: Tuple[str, str, Optional[int]],
+        report: Callable[[int], None],
+        mod_path: str,
+        clone_mode: str,
+        logger: logging.Logger,
+        store: Optional[ModStore] = None,
+        threads: Optional[int] = None,
+        full: bool = False,
+    ) -> None:
+        """
+        updates an installed mod from the workshop. Only files that changed
+        since the last update are extracted unless full is set. Runs on
+        worker threads without a click context, so everything read from
+        self.config is passed in
+        """
+
+        workshop_item, src_dir, time_updated = mod
+        mod_dir = os.path.join(mod_path, str(workshop_item))
+        mod_file = os.path.join(mod_path, "{}.mod".format(workshop_item))
+
+        if store is not None and time_updated is not None:
+            logger.debug("extracting {}...".format(workshop_item))
+            if not store.add(
+                workshop_item,
+                time_updated,
+                src_dir,
+                lambda d, f: self._create_mod_file(d, f, workshop_item),
+                threads=threads,
+                report=report,
+            ):
+                logger.debug(f"{workshop_item} found in mod store")
+                report(_tree_size(src_dir))
+            store.link(workshop_item, time_updated, mod_dir, mod_file)
+            return
+
+        # do not write through links into the mod store
+        if os.path.islink(mod_dir):
+            os.remove(mod_dir)
+            if os.path.isfile(mod_file):
+                os.remove(mod_file)
+
+        # mods from before manifests were kept cannot be updated in place
+        if os.path.isdir(mod_dir) and (full or not read_manifest(mod_dir)):
+            logger.debug(
+                "removing old mod_dir of {}...".format(workshop_item)
+            )
+            shutil.rmtree(mod_dir)
+
+        logger.debug("extracting {}...".format(workshop_item))
+        changed, removed = unpack_tree(
+            src_dir,
+            mod_dir,
+            mode=clone_mode,
+            threads=threads,
+            report=report,
+        )
+        logger.debug(
+            f"{workshop_item}: {len(changed)} file(s) extracted, "
+            f"{len(removed)} removed"
+        )
+
+        if os.path.isfile(mod_file) and not (
+            set(changed) & {"mod.info", "modmeta.info"}
+        ):
+            # mark the mod as up to date for the next update check
+            os.utime(mod_file)
+            return
+
+        if not self._create_mod_file(mod_dir, mod_file, workshop_item):
+            raise click.ClickException("could not create .mod file")
 
     @require("ark_map")
     @multi_instance
@@ -463,6 +580,14 @@ class ArkServer(RconServer):
         is_flag=True,
         help="Do a restart if instances are running",
     )
+    @click.option(
+        "--staged",
+        is_flag=True,
+        help=(
+            "Update a clone of the server while instances keep running and "
+            "only stop them to switch over to it"
+        ),
+    )
     @click.command(cls=ServerCommandClass)
     @click.pass_obj
     def install(
@@ -471,6 +596,7 @@ class ArkServer(RconServer):
         force: bool,
         stop: bool,
         restart: bool,
+        staged: bool = False,
         app_id: Optional[int] = None,
         *args,
         **kwargs,
@@ -484,6 +610,7 @@ class ArkServer(RconServer):
             force=force,
             stop=stop,
             restart=restart,
+            staged=staged,
         )
 
         self.logger.debug("super status: {}".format(status))
@@ -510,6 +637,79 @@ class ArkServer(RconServer):
 
         return status
 
+    def _extract_mods(
+        self,
+        mods_to_update: List[str],
+        base_src_dir: str,
+        workshop_times: Dict[str, int],
+        mod_path: str,
+        force: bool,
+    ) -> int:
+        failed = []
+        src_dirs = []
+        for workshop_item in mods_to_update:
+            src_dir = os.path.join(base_src_dir, str(workshop_item))
+            branch_dir = os.path.join(
+                src_dir, "{}NoEditor".format(self.config.workshop_branch),
+            )
+
+            if not os.path.isdir(src_dir):
+                self.logger.error(
+                    f"could not find workshop item: {workshop_item}"
+                )
+                failed.append(workshop_item)
+                continue
+            elif os.path.isdir(branch_dir):
+                src_dir = branch_dir
+            time_updated = workshop_times.get(str(workshop_item))
+            src_dirs.append((workshop_item, src_dir, time_updated))
+
+        cpu_count = os.cpu_count() or 1
+        workers = min(
+            self.config.mod_workers or cpu_count, max(len(src_dirs), 1)
+        )
+        threads = self.config.unpack_threads or max(1, cpu_count // workers)
+        total_size = sum(_tree_size(m[1]) for m in src_dirs)
+
+        self.logger.info(
+            f"extracting mods ({format_bytes(total_size)}, "
+            f"{workers} at a time)..."
+        )
+        with click.progressbar(length=total_size) as bar:
+            results = run_jobs(
+                partial(
+                    self._install_mod,
+                    mod_path=mod_path,
+                    clone_mode=self.config.mod_clone_mode,
+                    logger=self.logger,
+                    store=self.mod_store,
+                    threads=threads,
+                    full=force,
+                ),
+                src_dirs,
+                max_workers=workers,
+                on_progress=bar.update,
+            )
+
+        for (workshop_item, _, _), error in results.items():
+            if error is not None:
+                failed.append(workshop_item)
+                self.logger.error(
+                    f"could not install {workshop_item}: "
+                    f"{getattr(error, 'message', error)}"
+                )
+
+        if len(failed) > 0:
+            if len(failed) == len(mods_to_update):
+                return STATUS_FAILED
+            self.logger.warning(
+                f"{len(mods_to_update) - len(failed)} of "
+                f"{len(mods_to_update)} workshop items installed"
+            )
+            return STATUS_PARTIAL_FAIL
+        self.logger.success("workshop items successfully installed")
+        return STATUS_SUCCESS
+
     @require("workshop_id")
     @single_instance
     @click.command(cls=ServerCommandClass)
@@ -555,6 +755,33 @@ class ArkServer(RconServer):
         is_flag=True,
         help="Do a restart if instances are running",
     )
+    @click.option(
+        "-j",
+        "--mod-workers",
+        type=int,
+        help="Number of mods to extract at once, defaults to CPU count",
+    )
+    @click.option(
+        "--mod-clone-mode",
+        type=click.Choice(CLONE_MODES),
+        help=(
+            "How to install uncompressed mod files from the workshop "
+            "download. Falls back to copy if not possible"
+        ),
+    )
+    @click.option(
+        "--mod-store-path",
+        type=click.Path(),
+        help=(
+            "Host-wide directory to extract mods into once and link them "
+            "from for every server"
+        ),
+    )
+    @click.option(
+        "--mod-store-mode",
+        type=click.Choice(MOD_STORE_MODES),
+        help="How to link mods from the mod store into the server",
+    )
     @click.pass_obj
     def workshop_download(
         self,
@@ -597,36 +824,26 @@ class ArkServer(RconServer):
                 ]
             )
 
+            workshop_times = self._get_workshop_times(manifest_file)
             if not force and os.path.isfile(manifest_file):
-                manifest = None
-                with open(manifest_file, "r") as f:
-                    manifest = acf.load(f)
-
-                    for workshop_item in self.config.workshop_items:
-                        workshop_item = str(workshop_item)
-                        mod_dir = os.path.join(mod_path, str(workshop_item))
-                        mod_file = os.path.join(
-                            mod_path, "{}.mod".format(workshop_item)
-                        )
+                for workshop_item in self.config.workshop_items:
+                    workshop_item = str(workshop_item)
+                    mod_file = os.path.join(
+                        mod_path, "{}.mod".format(workshop_item)
+                    )
 
-                        if not os.path.isfile(mod_file) or (
-                            workshop_item
-                            not in manifest["AppWorkshop"][
-                                "WorkshopItemsInstalled"
-                            ]
-                        ):
-                            mods_to_update.append(workshop_item)
-                            continue
-
-                        last_update_time = int(
-                            manifest["AppWorkshop"]["WorkshopItemsInstalled"][
-                                workshop_item
-                            ]["timeupdated"]
-                        )
-                        last_extract_time = os.path.getctime(mod_file)
+                    if (
+                        not os.path.isfile(mod_file)
+                        or workshop_item not in workshop_times
+                    ):
+                        mods_to_update.append(workshop_item)
+                        continue
+
+                    last_update_time = workshop_times[workshop_item]
+                    last_extract_time = os.path.getctime(mod_file)
 
-                        if last_update_time > last_extract_time:
-                            mods_to_update.append(workshop_item)
+                    if last_update_time > last_extract_time:
+                        mods_to_update.append(workshop_item)
             else:
                 mods_to_update = self.config.workshop_items
 
@@ -643,7 +860,7 @@ class ArkServer(RconServer):
                 f"{','.join(mods_to_update)}"
             )
 
-            was_running = self.is_running("@any")
+            was_running = self._get_affected_instances(mods_to_update)
             if was_running:
                 if not (restart or stop):
                     self.logger.warning(
@@ -661,61 +878,15 @@ class ArkServer(RconServer):
                     ),
                 )
 
-            self.logger.info("extracting mods...")
-            with click.progressbar(mods_to_update) as bar:
-                for workshop_item in bar:
-                    src_dir = os.path.join(base_src_dir, str(workshop_item))
-                    branch_dir = os.path.join(
-                        src_dir,
-                        "{}NoEditor".format(self.config.workshop_branch),
-                    )
-                    mod_dir = os.path.join(mod_path, str(workshop_item))
-                    mod_file = os.path.join(
-                        mod_path, "{}.mod".format(workshop_item)
-                    )
-
-                    if not os.path.isdir(src_dir):
-                        self.logger.error(
-                            "could not find workshop item: {}".format(
-                                self.config.workshop_id
-                            )
-                        )
-                        return STATUS_FAILED
-                    elif os.path.isdir(branch_dir):
-                        src_dir = branch_dir
-
-                    if os.path.isdir(mod_dir):
-                        self.logger.debug(
-                            "removing old mod_dir of {}...".format(
-                                workshop_item
-                            )
-                        )
-                        shutil.rmtree(mod_dir)
-                    if os.path.isfile(mod_file):
-                        self.logger.debug(
-                            "removing old mod_file of {}...".format(
-                                workshop_item
-                            )
-                        )
-                        os.remove(mod_file)
-
-                    self.logger.debug("copying {}...".format(workshop_item))
-                    shutil.copytree(src_dir, mod_dir)
-
-                    if not self._create_mod_file(
-                        mod_dir, mod_file, workshop_item
-                    ):
-                        self.logger.error(
-                            "could not create .mod file for {}".format(
-                                workshop_item
-                            )
-                        )
-                        return STATUS_FAILED
-
-                    if not self._extract_files(mod_dir):
-                        return STATUS_FAILED
-            self.logger.success("workshop items successfully installed")
-
-        if status == STATUS_SUCCESS:
-            self._start_servers(restart, was_running)
+            # servers stopped for the update come back even if mods fail
+            try:
+                status = self._extract_mods(
+                    mods_to_update,
+                    base_src_dir,
+                    workshop_times,
+                    mod_path,
+                    force,
+                )
+            finally:
+                self._start_servers(restart, was_running)
         return status
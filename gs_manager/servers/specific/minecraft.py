@@ -1,10 +1,9 @@
 import os
 import re
 import time
-from typing import Dict, List, Optional, Tuple, Type
+from typing import Any, Dict, List, Optional, Tuple, Type
 
 import click
-import click_spinner
 from mcstatus import MinecraftServer as MCServer
 
 from gs_manager.command import Config, ServerCommandClass
@@ -23,6 +22,7 @@ from gs_manager.utils import (
     get_param_obj,
     get_server_path,
 )
+from gs_manager.wait import LogLineProbe, Probe
 
 __all__ = ["MinecraftServerConfig", "MinecraftServer"]
 
@@ -33,7 +33,10 @@ EULA_URL = "https://account.mojang.com/documents/minecraft_eula"
 class MinecraftServerConfig(JavaServerConfig):
     stop_command: str = "stop"
     say_command: str = "say {}"
-    save_command: str = "save-all"
+    save_command: str = "save-all flush"
+    save_log_pattern: str = r"\]: Saved the game"
+    save_off_command: str = "save-off"
+    save_on_command: str = "save-on"
     server_log: str = os.path.join("logs", "latest.log")
 
     start_memory: int = 1204
@@ -108,20 +111,71 @@ class MinecraftServer(JavaServer):
         return super().config
 
     @property
-    def server(self):
-        if self._server is None:
-            ip = self.config.mc.get("server-ip")
-            port = self.config.mc.get("server-port")
+    def server_address(self) -> Tuple[str, int]:
+        ip = self.config.mc.get("server-ip")
+        port = self.config.mc.get("server-port")
 
-            if ip == "" or ip is None:
-                ip = "127.0.0.1"
-            if port == "" or port is None:
-                port = "25565"
+        if ip == "" or ip is None:
+            ip = "127.0.0.1"
+        if port == "" or port is None:
+            port = "25565"
+        return ip, int(port)
 
+    @property
+    def server(self):
+        if self._server is None:
+            ip, port = self.server_address
             self.logger.debug(f"Minecraft server: {ip}:{port}")
-            self._server = MCServer(ip, int(port))
+            self._server = MCServer(ip, port)
         return self._server
 
+    def _query_status(
+        self, detailed: bool, max_age: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        gets the server status (and query if detailed), from the cache if
+        there is a result younger than max_age
+        """
+
+        namespace = "minecraft_query" if detailed else "minecraft_status"
+        key = "{}:{}".format(*self.server_address)
+        max_age = self._get_max_age(max_age)
+
+        result = self.cache.get(namespace, key, max_age)
+        if result is not None:
+            self.logger.debug(f"using cached {namespace} result for {key}")
+            return result
+
+        try:
+            query = None
+            if detailed:
+                query = self.server.query()
+            status = self.server.status()
+        except ConnectionRefusedError:
+            return None
+
+        result = {
+            "version": status.version.name,
+            "protocol": status.version.protocol,
+            "description": str(status.description),
+            "players_online": status.players.online,
+            "players_max": status.players.max,
+        }
+        if query is not None:
+            result.update(
+                {
+                    "host": f"{query.raw['hostip']}:{query.raw['hostport']}",
+                    "software_version": query.software.version,
+                    "software_brand": query.software.brand,
+                    "plugins": query.software.plugins,
+                    "motd": query.motd,
+                    "players": query.players.names,
+                }
+            )
+
+        self.cache.set(namespace, key, result)
+        return result
+
     def _get_minecraft_versions(
         self, beta: bool = False, old: bool = False
     ) -> Tuple[str, Dict[str, str]]:
@@ -145,70 +199,22 @@ class MinecraftServer(JavaServer):
 
         return latest, versions
 
-    def _process_log_file(self) -> bool:
-        tail = self.tail_file()
-
-        loops_since_check = 0
-        processing = True
-        done_match = False
-        with click_spinner.spinner():
-            while processing:
-                for line in tail.readlines():
-                    self.logger.debug(f"log: {line}")
-                    done_match = (
-                        re.search(r"Done \((\d+\.\d+)s\)! For help,", line)
-                        is not None
+    def _get_startup_probes(self) -> List[Probe]:
+        return [
+            LogLineProbe(
+                get_server_path(self.config.server_log),
+                r"Done \((\d+\.\d+)s\)! For help,",
+                errors={
+                    "agree to the EULA": (
+                        "You must agree to Mojang's EULA. "
+                        f"Please read {EULA_URL} and restart server "
+                        "with --accept_eula"
                     )
-                    if done_match:
-                        processing = False
-                    elif "agree to the EULA" in line:
-                        self.logger.info("")
-                        raise click.ClickException(
-                            f"You must agree to Mojang's EULA. "
-                            "Please read {EULA_URL} and restart server "
-                            "with --accept_eula"
-                        )
-
-                if loops_since_check < 5:
-                    loops_since_check += 1
-                elif self.is_running():
-                    loops_since_check = 0
-                else:
-                    self.logger.error(f"{self.server_name} failed to start")
-                    processing = False
-                time.sleep(1)
-
-        self.delete_offset()
-        return done_match
-
-    def _startup_check(self) -> int:
-        self.logger.debug("wait for server to start initalizing...")
-
-        mtime = 0
-        try:
-            mtime = os.stat(self.config.server_log).st_mtime
-        except FileNotFoundError:
-            pass
-
-        new_mtime = mtime
-        wait_left = 5
-        while new_mtime == mtime and wait_left > 0:
-            try:
-                mtime = os.stat(self.config.server_log).st_mtime
-            except FileNotFoundError:
-                pass
-            wait_left -= 0.1
-            time.sleep(0.1)
-
-        if os.path.isfile(self.config.server_log):
-            if self._process_log_file():
-                self.logger.info(
-                    "\nverifying Minecraft server is up...", nl=False,
-                )
-                return super()._startup_check()
-        raise click.ClickException(
-            f"could not find log file: {self.config.server_log}"
-        )
+                },
+                name="startup log",
+            ),
+            Probe(self.is_accessible, name="minecraft ping"),
+        ]
 
     def is_accessible(self) -> bool:
         try:
@@ -226,8 +232,18 @@ class MinecraftServer(JavaServer):
         is_flag=True,
         help="returns more detatiled infomation about the server",
     )
+    @click.option(
+        "--max-age",
+        type=int,
+        help=(
+            "Max age (in seconds) of a cached result to use, 0 to always "
+            "query the server. Defaults to --cache-ttl"
+        ),
+    )
     @click.pass_obj
-    def status(self, detailed: bool, *args, **kwargs) -> int:
+    def status(
+        self, detailed: bool, max_age: Optional[int] = None, *args, **kwargs
+    ) -> int:
         """ checks if Minecraft server is running or not """
 
         if self.is_running():
@@ -236,42 +252,36 @@ class MinecraftServer(JavaServer):
                     "query is not enabled in server.properties"
                 )
 
-            query = None
-            try:
-                if detailed:
-                    query = self.server.query()
-                status = self.server.status()
-            except ConnectionRefusedError:
+            status = self._query_status(detailed, max_age)
+            if status is None:
                 self.logger.error(
                     f"{self.server_name} is running, but not accessible"
                 )
                 return STATUS_FAILED
-            else:
-                self.logger.success(f"{self.server_name} is running")
-                if query is not None:
-                    self.logger.info(
-                        f"host: {query.raw['hostip']}:{query.raw['hostport']}"
-                    )
-                    self.logger.info(
-                        f"software: v{query.software.version} "
-                        f"{query.software.brand}"
-                    )
-                self.logger.info(
-                    f"version: v{status.version.name} (protocol "
-                    f"{status.version.protocol})"
-                )
-                self.logger.info(f'description: "{status.description}"')
-                if query is not None:
-                    self.logger.info(f"plugins: {query.software.plugins}")
-                    self.logger.info(f'motd: "{query.motd}"')
 
+            self.logger.success(f"{self.server_name} is running")
+            if detailed:
+                self.logger.info(f"host: {status['host']}")
                 self.logger.info(
-                    f"players: {status.players.online}/{status.players.max}"
+                    f"software: v{status['software_version']} "
+                    f"{status['software_brand']}"
                 )
+            self.logger.info(
+                f"version: v{status['version']} (protocol "
+                f"{status['protocol']})"
+            )
+            self.logger.info(f'description: "{status["description"]}"')
+            if detailed:
+                self.logger.info(f"plugins: {status['plugins']}")
+                self.logger.info(f'motd: "{status["motd"]}"')
+
+            self.logger.info(
+                f"players: {status['players_online']}/{status['players_max']}"
+            )
 
-                if query is not None:
-                    self.logger.info(query.players.names)
-                return STATUS_SUCCESS
+            if detailed:
+                self.logger.info(status["players"])
+            return STATUS_SUCCESS
 
         self.logger.warning(f"{self.server_name} is not running")
         return STATUS_PARTIAL_FAIL
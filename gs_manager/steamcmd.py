@@ -0,0 +1,528 @@
+import atexit
+import os
+import pty
+import re
+import selectors
+import shlex
+import subprocess  # nosec
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import click
+
+from gs_manager.utils import format_bytes
+
+__all__ = [
+    "EventCallback",
+    "SteamCmdError",
+    "SteamCmdProgress",
+    "SteamCmdResult",
+    "SteamCmdSession",
+    "PhaseSummary",
+    "ProgressParser",
+    "add_progress_hook",
+    "remove_progress_hook",
+    "get_steamcmd_session",
+    "close_steamcmd_sessions",
+    "parse_workshop_download",
+]
+
+PROMPT = "Steam>"
+# steamcmd waits for input if a login needs a password or Steam Guard code
+LOGIN_TIMEOUT = 60
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+ERROR_LINE = re.compile(r"ERROR!|Error!|\.\.\.FAILED|^FAILED")
+PROGRESS_LINE = re.compile(
+    r"Update state \(0x(?P<state>[0-9a-fA-F]+)\) (?P<phase>[\w ]+?), "
+    r"progress: \d+\.\d+ \((?P<current>\d+) / (?P<total>\d+)\)"
+)
+
+WORKSHOP_SUCCESS = re.compile(r"Success\. Downloaded item (?P<item>\d+)")
+WORKSHOP_ERROR = re.compile(
+    r"ERROR! (?:Download item (?P<item>\d+) failed \((?P<reason>[^)]*)\)"
+    r"|Timeout downloading item (?P<timeout_item>\d+))"
+)
+
+
+class SteamCmdError(click.ClickException):
+    pass
+
+
+@dataclass
+class SteamCmdProgress:
+    """ progress of an app update phase, in bytes """
+
+    phase: str
+    state: int
+    current: int
+    total: int
+    # bytes per second and seconds left, once there are two samples
+    rate: Optional[float] = None
+    eta: Optional[float] = None
+    elapsed: float = 0.0
+
+    @property
+    def percent(self) -> float:
+        if self.total == 0:
+            return 100.0
+        return self.current * 100 / self.total
+
+    def __str__(self) -> str:
+        progress = f"{format_bytes(self.current)}/{format_bytes(self.total)}"
+        if self.rate is not None:
+            progress += f" {format_bytes(self.rate)}/s"
+        if self.eta is not None:
+            progress += f" ETA {int(self.eta // 60)}:{int(self.eta % 60):02}"
+        return progress
+
+
+@dataclass
+class PhaseSummary:
+    phase: str
+    bytes: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rate(self) -> Optional[float]:
+        if self.seconds <= 0:
+            return None
+        return self.bytes / self.seconds
+
+    def __str__(self) -> str:
+        summary = f"{self.phase}: {format_bytes(self.bytes)}"
+        summary += f" in {self.seconds:.1f}s"
+        if self.rate is not None:
+            summary += f" ({format_bytes(self.rate)}/s)"
+        return summary
+
+
+class ProgressParser:
+    """
+    turns steamcmd "Update state" lines into progress events as they
+    arrive. Rates are smoothed with an exponential moving average and reset
+    whenever steamcmd moves on to another phase. Keeps a summary for every
+    phase seen, which shows where an update spent its time (downloading vs
+    verifying or committing to disk).
+    """
+
+    def __init__(
+        self,
+        clock: Callable[[], float] = time.monotonic,
+        smoothing: float = 0.3,
+    ):
+        self.clock = clock
+        self.smoothing = smoothing
+        self.phases: Dict[str, PhaseSummary] = {}
+
+        self._phase: Optional[str] = None
+        self._phase_start = (0.0, 0)
+        self._last = (0.0, 0)
+        self._rate: Optional[float] = None
+
+    def feed(self, line: str) -> Optional[SteamCmdProgress]:
+        match = PROGRESS_LINE.search(line)
+        if match is None:
+            return None
+
+        now = self.clock()
+        phase = match.group("phase")
+        current = int(match.group("current"))
+        total = int(match.group("total"))
+
+        if phase != self._phase or current < self._last[1]:
+            self._phase = phase
+            self._phase_start = (now, current)
+            self._last = (now, current)
+            self._rate = None
+
+        last_time, last_current = self._last
+        if now > last_time:
+            rate = (current - last_current) / (now - last_time)
+            if self._rate is None:
+                self._rate = rate
+            else:
+                self._rate = (
+                    self.smoothing * rate + (1 - self.smoothing) * self._rate
+                )
+            self._last = (now, current)
+
+        eta = None
+        if self._rate:
+            eta = max(0.0, (total - current) / self._rate)
+
+        start_time, start_current = self._phase_start
+        summary = self.phases.setdefault(phase, PhaseSummary(phase))
+        summary.bytes = max(summary.bytes, current - start_current)
+        summary.seconds = max(summary.seconds, now - start_time)
+
+        return SteamCmdProgress(
+            phase=phase,
+            state=int(match.group("state"), 16),
+            current=current,
+            total=total,
+            rate=self._rate,
+            eta=eta,
+            elapsed=now - start_time,
+        )
+
+
+@dataclass
+class SteamCmdResult:
+    command: str
+    lines: List[str] = field(default_factory=list)
+    phases: Dict[str, PhaseSummary] = field(default_factory=dict)
+
+    @property
+    def output(self) -> str:
+        return "\n".join(self.lines)
+
+    @property
+    def error(self) -> Optional[str]:
+        for line in self.lines:
+            if ERROR_LINE.search(line) is not None:
+                return line
+        return None
+
+    @property
+    def success(self) -> bool:
+        return self.error is None
+
+
+EventCallback = Callable[[SteamCmdProgress], None]
+
+_progress_hooks: List[EventCallback] = []
+
+
+def add_progress_hook(hook: EventCallback) -> None:
+    """
+    registers a callback that gets every steamcmd progress event, e.g. to
+    export download and disk rates as metrics
+    """
+
+    _progress_hooks.append(hook)
+
+
+def remove_progress_hook(hook: EventCallback) -> None:
+    if hook in _progress_hooks:
+        _progress_hooks.remove(hook)
+
+
+def parse_workshop_download(
+    output: str, items: Iterable[str]
+) -> Dict[str, Optional[str]]:
+    """
+    gets the result for each workshop item from steamcmd output. Items map
+    to None if they downloaded or to the reason they failed
+    """
+
+    results: Dict[str, Optional[str]] = {
+        str(item): "no result from steamcmd" for item in items
+    }
+    for line in output.splitlines():
+        item, result = None, None
+        match = WORKSHOP_SUCCESS.search(line)
+        if match is not None:
+            item = match.group("item")
+        else:
+            match = WORKSHOP_ERROR.search(line)
+            if match is None:
+                continue
+            if match.group("timeout_item") is not None:
+                item, result = match.group("timeout_item"), "timed out"
+            else:
+                item, result = match.group("item"), match.group("reason")
+
+        if item in results:
+            results[item] = result
+    return results
+
+
+class SteamCmdSession:
+    """
+    keeps a single steamcmd process running and logged in and drives it
+    over stdin, one command at a time. steamcmd only flushes its output
+    properly to a terminal, so output is read from a pty. A command is
+    finished once steamcmd prints its prompt again.
+    """
+
+    def __init__(
+        self,
+        steamcmd_path: str = "steamcmd",
+        login: Optional[str] = None,
+        timeout: Optional[float] = None,
+        login_timeout: float = LOGIN_TIMEOUT,
+    ):
+        self.steamcmd_path = steamcmd_path
+        self.login_args = login
+        self.timeout = timeout
+        self.login_timeout = login_timeout
+
+        self.logged_in = False
+        self._process: Optional[subprocess.Popen] = None
+        self._fd: Optional[int] = None
+        self._buffer = ""
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self) -> None:
+        if self.running:
+            return
+
+        self.close()
+        master, slave = pty.openpty()
+        try:
+            self._process = subprocess.Popen(  # nosec
+                shlex.split(self.steamcmd_path),
+                stdin=subprocess.PIPE,
+                stdout=slave,
+                stderr=slave,
+                start_new_session=True,
+            )
+        except OSError as ex:
+            os.close(master)
+            raise SteamCmdError(f"could not start steamcmd: {ex}")
+        finally:
+            os.close(slave)
+
+        os.set_blocking(master, False)
+        self._fd = master
+        self._buffer = ""
+        self.logged_in = False
+
+        # steamcmd updates itself before showing the first prompt
+        self._read_until_prompt(SteamCmdResult("start"), None, self.timeout)
+
+    def _handle_line(
+        self,
+        line: str,
+        result: SteamCmdResult,
+        parser: ProgressParser,
+        on_event: Optional[EventCallback],
+    ) -> None:
+        result.lines.append(line)
+
+        event = parser.feed(line)
+        if event is None:
+            return
+
+        for hook in _progress_hooks + [on_event]:
+            if hook is not None:
+                hook(event)
+
+    def _read_until_prompt(
+        self,
+        result: SteamCmdResult,
+        on_event: Optional[EventCallback],
+        timeout: Optional[float],
+    ) -> SteamCmdResult:
+        parser = ProgressParser()
+        result.phases = parser.phases
+
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+
+        with selectors.DefaultSelector() as selector:
+            selector.register(self._fd, selectors.EVENT_READ)
+            while True:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.close(timeout=0)
+                        raise SteamCmdError(
+                            f"steamcmd timed out running: {result.command}"
+                        )
+
+                if not selector.select(remaining):
+                    continue
+
+                try:
+                    data = os.read(self._fd, 65536)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    # EIO once steamcmd has exited and the pty is closed
+                    data = b""
+
+                if not data:
+                    if self._buffer.strip():
+                        result.lines.append(self._buffer.strip())
+                    self.close()
+                    raise SteamCmdError(
+                        f"steamcmd exited while running: {result.command}"
+                    )
+
+                text = ANSI_ESCAPE.sub("", data.decode("utf8", "replace"))
+                text = text.replace("\r\n", "\n").replace("\r", "\n")
+                lines = (self._buffer + text).split("\n")
+                self._buffer = lines.pop()
+
+                for line in lines:
+                    line = line.strip()
+                    if line == PROMPT:
+                        self._buffer = ""
+                        return result
+                    if line:
+                        self._handle_line(line, result, parser, on_event)
+
+                if self._buffer.strip() == PROMPT:
+                    self._buffer = ""
+                    return result
+
+    def run(
+        self,
+        command: str,
+        on_event: Optional[EventCallback] = None,
+        timeout: Optional[float] = None,
+    ) -> SteamCmdResult:
+        """ runs a steamcmd command and waits for it to finish """
+
+        self.start()
+        if self.login_args is not None and not self.logged_in:
+            self.login()
+
+        return self._run(command, on_event, timeout)
+
+    def _run(
+        self,
+        command: str,
+        on_event: Optional[EventCallback] = None,
+        timeout: Optional[float] = None,
+    ) -> SteamCmdResult:
+        try:
+            self._process.stdin.write(f"{command}\n".encode("utf8"))
+            self._process.stdin.flush()
+        except OSError:
+            self.close()
+            raise SteamCmdError("could not send command to steamcmd")
+
+        return self._read_until_prompt(
+            SteamCmdResult(command), on_event, timeout or self.timeout
+        )
+
+    def login(self) -> None:
+        """
+        logs in with login_args, "anonymous" or "<username> <password>".
+        Gives up after login_timeout
+        """
+
+        self.start()
+        try:
+            result = self._run(
+                f"login {self.login_args}", timeout=self.login_timeout
+            )
+        except SteamCmdError:
+            # the error has the command in it, which includes the password
+            raise SteamCmdError(
+                "steamcmd login did not finish, check the Steam username "
+                "and password"
+            ) from None
+        # do not keep the password around in the result
+        result.command = "login"
+        if not result.success:
+            raise SteamCmdError(f"steamcmd login failed: {result.error}")
+        self.logged_in = True
+
+    def force_install_dir(self, path: str) -> SteamCmdResult:
+        return self.run(f'force_install_dir "{os.path.abspath(path)}"')
+
+    def app_info(self, app_id: str) -> str:
+        """ gets the app_info_print output for an app """
+
+        self.run("app_info_update 1")
+        return self.run(f"app_info_print {app_id}").output
+
+    def app_update(
+        self,
+        app_id: str,
+        install_dir: str,
+        validate: bool = True,
+        on_event: Optional[EventCallback] = None,
+    ) -> SteamCmdResult:
+        self.force_install_dir(install_dir)
+        command = f"app_update {app_id}"
+        if validate:
+            command += " validate"
+        return self.run(command, on_event=on_event)
+
+    def workshop_download_item(
+        self,
+        workshop_id: str,
+        item: str,
+        on_event: Optional[EventCallback] = None,
+    ) -> Optional[str]:
+        """
+        downloads a workshop item into the current install dir. Returns
+        None on success or the reason it failed
+        """
+
+        result = self.run(
+            f"workshop_download_item {workshop_id} {item}", on_event=on_event
+        )
+        return parse_workshop_download(result.output, [item])[str(item)]
+
+    def close(self, timeout: float = 30) -> None:
+        process, self._process = self._process, None
+        if process is not None:
+            if process.poll() is None:
+                try:
+                    process.stdin.write(b"quit\n")
+                    process.stdin.flush()
+                except OSError:
+                    pass
+                try:
+                    process.wait(timeout)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+            if process.stdin is not None:
+                try:
+                    process.stdin.close()
+                except OSError:
+                    pass
+
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self.logged_in = False
+
+
+_sessions: Dict[Tuple[str, Optional[str]], SteamCmdSession] = {}
+
+
+def get_steamcmd_session(
+    steamcmd_path: str, login: Optional[str] = None
+) -> SteamCmdSession:
+    """ gets the shared steamcmd session for a steamcmd path and login """
+
+    key = (steamcmd_path, login)
+    if key not in _sessions:
+        _sessions[key] = SteamCmdSession(steamcmd_path, login=login)
+    return _sessions[key]
+
+
+def close_steamcmd_sessions() -> None:
+    while len(_sessions) > 0:
+        _, session = _sessions.popitem()
+        session.close()
+
+
+def _forget_steamcmd_sessions() -> None:
+    # the steamcmd process belongs to the parent after a fork
+    _sessions.clear()
+
+
+atexit.register(close_steamcmd_sessions)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_steamcmd_sessions)
@@ -0,0 +1,274 @@
+import json
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Callable, Deque, Dict, List, Optional, Tuple
+
+from gs_manager.releases import clone_file
+from gs_manager.utils import hash_file
+
+__all__ = [
+    "MANIFEST_NAME",
+    "Z_CHUNK_SIZE",
+    "ZChunk",
+    "read_manifest",
+    "read_z_header",
+    "unpack_tree",
+    "z_unpack",
+]
+
+# records what every source file of an unpacked tree was unpacked to
+MANIFEST_NAME = ".gs_manager_manifest.json"
+
+Z_SIGNATURE = 0x9E2A83C1
+# default chunk size, also used if a file has the signature in its place
+Z_CHUNK_SIZE = 131072
+
+# (offset, compressed size, output offset, uncompressed size)
+ZChunk = Tuple[int, int, int, int]
+
+_HEADER = struct.Struct("<qqqq")
+_CHUNK = struct.Struct("<qq")
+
+
+def read_z_header(file_obj: BinaryIO) -> Tuple[int, List[ZChunk]]:
+    """
+    reads the header and chunk table of a UE4 .z file. Returns the
+    uncompressed size of the file and the location of every chunk
+    """
+
+    _, chunk_size, _, total_size = _HEADER.unpack(
+        file_obj.read(_HEADER.size)
+    )
+    if chunk_size in (Z_SIGNATURE, -1641380927):
+        chunk_size = Z_CHUNK_SIZE
+    if chunk_size <= 0 or total_size < 0:
+        raise ValueError(f"invalid .z header in {file_obj.name}")
+
+    count = (total_size + chunk_size - 1) // chunk_size
+    table = file_obj.read(_CHUNK.size * count)
+    if len(table) != _CHUNK.size * count:
+        raise ValueError(f"truncated .z chunk table in {file_obj.name}")
+
+    chunks = []
+    offset = _HEADER.size + len(table)
+    out_offset = 0
+    for compressed_size, size in _CHUNK.iter_unpack(table):
+        chunks.append((offset, compressed_size, out_offset, size))
+        offset += compressed_size
+        out_offset += size
+
+    if out_offset != total_size:
+        raise ValueError(f"chunk sizes do not add up in {file_obj.name}")
+    return total_size, chunks
+
+
+def _read_chunk(file_obj: BinaryIO, chunk: ZChunk) -> bytes:
+    compressed = file_obj.read(chunk[1])
+    if len(compressed) != chunk[1]:
+        raise ValueError(f"truncated .z file {file_obj.name}")
+    return compressed
+
+
+def _inflate(fd: int, compressed: bytes, chunk: ZChunk) -> int:
+    _, _, out_offset, size = chunk
+    data = zlib.decompress(compressed)
+    if len(data) != size:
+        raise zlib.error(
+            f"chunk at {out_offset} inflated to {len(data)} bytes, "
+            f"expected {size}"
+        )
+
+    written = 0
+    view = memoryview(data)
+    while written < size:
+        written += os.pwrite(fd, view[written:], out_offset + written)
+    return size
+
+
+def z_unpack(
+    from_path: str,
+    to_path: str,
+    threads: Optional[int] = None,
+    readahead: Optional[int] = None,
+) -> int:
+    """
+    unpacks a .z file from the Steam workshop. Chunks are read in order and
+    inflated on a thread pool (zlib releases the GIL), each one written
+    straight to its offset in the output file. At most readahead chunks
+    are held in memory at once. Returns the uncompressed size
+
+    adapted from https://github.com/TheCherry/ark-server-manager/blob/master/src/z_unpack.py
+    """  # noqa
+
+    threads = threads or os.cpu_count() or 1
+    readahead = readahead or threads * 4
+
+    with open(from_path, "rb") as f_from, open(to_path, "wb") as f_to:
+        total_size, chunks = read_z_header(f_from)
+        fd = f_to.fileno()
+        os.ftruncate(fd, total_size)
+
+        if threads == 1 or len(chunks) < 2:
+            for chunk in chunks:
+                _inflate(fd, _read_chunk(f_from, chunk), chunk)
+            return total_size
+
+        pending: Deque[Future] = deque()
+        with ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="z_unpack"
+        ) as executor:
+            try:
+                for chunk in chunks:
+                    if len(pending) >= readahead:
+                        pending.popleft().result()
+
+                    compressed = _read_chunk(f_from, chunk)
+                    pending.append(
+                        executor.submit(_inflate, fd, compressed, chunk)
+                    )
+
+                while pending:
+                    pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    return total_size
+
+
+def _read_uncompressed_size(z_path: str) -> int:
+    size_file = f"{z_path}.uncompressed_size"
+    if not os.path.isfile(size_file):
+        raise ValueError(f"{size_file} does not exist")
+
+    with open(size_file, "r") as f:
+        return int(f.read().strip())
+
+
+def read_manifest(dst_dir: str) -> Dict[str, dict]:
+    """ reads the manifest of an unpacked tree, empty if there is none """
+
+    try:
+        with open(os.path.join(dst_dir, MANIFEST_NAME), "r") as f:
+            return json.load(f)["files"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+
+
+def _write_manifest(dst_dir: str, files: Dict[str, dict]) -> None:
+    path = os.path.join(dst_dir, MANIFEST_NAME)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump({"version": 1, "files": files}, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def _is_current(entry: dict, src_path: str, dst_path: str) -> bool:
+    try:
+        src_stat = os.stat(src_path)
+        dst_stat = os.stat(dst_path)
+    except FileNotFoundError:
+        return False
+
+    if (dst_stat.st_size, dst_stat.st_mtime_ns) != (
+        entry["output_size"],
+        entry["output_mtime_ns"],
+    ):
+        return False
+    if (src_stat.st_size, src_stat.st_mtime_ns) == (
+        entry["size"],
+        entry["mtime_ns"],
+    ):
+        return True
+
+    # steamcmd rewrites files it validates even if they did not change
+    if src_stat.st_size == entry["size"] and (
+        hash_file(src_path) == entry["sha256"]
+    ):
+        entry["mtime_ns"] = src_stat.st_mtime_ns
+        return True
+    return False
+
+
+def unpack_tree(
+    src_dir: str,
+    dst_dir: str,
+    mode: str = "hardlink",
+    threads: Optional[int] = None,
+    report: Optional[Callable[[int], None]] = None,
+) -> Tuple[List[str], List[str]]:
+    """
+    installs a workshop item from src_dir into dst_dir. .z files are
+    unpacked straight from the source and checked against their
+    .uncompressed_size, all other files are cloned with clone_file. report
+    is called with the source size of each file when it is done.
+
+    What each source file was unpacked to is kept in a manifest in dst_dir,
+    so on later runs only new or changed files are unpacked again and
+    outputs of files removed from the source are deleted. Returns the
+    source paths (relative to src_dir) that were unpacked and removed
+    """
+
+    old_files = read_manifest(dst_dir)
+    files: Dict[str, dict] = {}
+    changed = []
+
+    for root, _, names in os.walk(src_dir):
+        rel_root = os.path.relpath(root, src_dir)
+        dst_root = os.path.normpath(os.path.join(dst_dir, rel_root))
+        os.makedirs(dst_root, exist_ok=True)
+
+        for filename in names:
+            if filename.endswith(".uncompressed_size"):
+                continue
+
+            src_path = os.path.join(root, filename)
+            rel_path = os.path.normpath(os.path.join(rel_root, filename))
+            output = rel_path[:-2] if filename.endswith(".z") else rel_path
+            dst_path = os.path.join(dst_dir, output)
+            size = os.path.getsize(src_path)
+
+            entry = old_files.get(rel_path)
+            if entry is not None and _is_current(entry, src_path, dst_path):
+                files[rel_path] = entry
+                if report is not None:
+                    report(size)
+                continue
+
+            if os.path.lexists(dst_path):
+                os.remove(dst_path)
+            if filename.endswith(".z"):
+                expected = _read_uncompressed_size(src_path)
+                if z_unpack(src_path, dst_path, threads) != expected:
+                    raise ValueError(f"could not validate {dst_path}")
+            else:
+                mode = clone_file(src_path, dst_path, mode)
+
+            src_stat = os.stat(src_path)
+            dst_stat = os.stat(dst_path)
+            files[rel_path] = {
+                "size": src_stat.st_size,
+                "mtime_ns": src_stat.st_mtime_ns,
+                "sha256": hash_file(src_path),
+                "output": output,
+                "output_size": dst_stat.st_size,
+                "output_mtime_ns": dst_stat.st_mtime_ns,
+            }
+            changed.append(rel_path)
+            if report is not None:
+                report(size)
+
+    outputs = set(e["output"] for e in files.values())
+    removed = []
+    for rel_path, entry in old_files.items():
+        if rel_path in files or entry["output"] in outputs:
+            continue
+        dst_path = os.path.join(dst_dir, entry["output"])
+        if os.path.lexists(dst_path):
+            os.remove(dst_path)
+        removed.append(rel_path)
+
+    _write_manifest(dst_dir, files)
+    return changed, removed
@@ -9,6 +9,7 @@ import sys
 from typing import List, Union
 
 import click
+import psutil
 import requests
 
 __all__ = [
@@ -17,6 +18,9 @@ __all__ = [
     "get_server_path",
     "get_param_obj",
     "run_command",
+    "format_bytes",
+    "hash_file",
+    "lower_priority",
 ]
 
 
@@ -41,6 +45,31 @@ def get_server_path(path: Union[str, List[str]]) -> str:
     return os.path.join(server_path, *path)
 
 
+def format_bytes(size: float) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def hash_file(path: str, hash_type: str = "sha256") -> str:
+    file_hash = hashlib.new(hash_type)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def lower_priority() -> None:
+    """ runs the current process at the lowest CPU and IO priority """
+
+    os.nice(19)
+    process = psutil.Process()
+    if hasattr(psutil, "IOPRIO_CLASS_IDLE"):
+        process.ionice(psutil.IOPRIO_CLASS_IDLE)
+
+
 def get_json(url: str) -> dict:
     response = requests.get(url)
     response.raise_for_status()
@@ -0,0 +1,234 @@
+import os
+import re
+import select
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+import click
+import psutil
+
+__all__ = [
+    "Probe",
+    "LogLineProbe",
+    "TickCallback",
+    "wait_for_exit",
+    "wait_for_probes",
+]
+
+TickCallback = Callable[[float], None]
+
+
+class Probe:
+    """
+    readiness check that is retried with an adaptive backoff until it
+    passes or its own deadline expires
+    """
+
+    name: str
+    timeout: Optional[float]
+
+    def __init__(
+        self,
+        check: Callable[[], bool],
+        name: Optional[str] = None,
+        timeout: Optional[float] = None,
+        min_interval: float = 0.1,
+        max_interval: float = 2.0,
+        backoff: float = 1.5,
+    ):
+        self._check = check
+        self.name = name or getattr(check, "__name__", "probe")
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+
+        self.interval = min_interval
+        self.next_check = 0.0
+        self.passed = False
+
+    def check(self) -> bool:
+        return bool(self._check())
+
+    def poll(self, now: float) -> bool:
+        """ checks the probe unless its next check is not due yet """
+
+        if self.passed:
+            return True
+        if now < self.next_check:
+            return False
+
+        if self.check():
+            self.passed = True
+        else:
+            self.next_check = now + self.interval
+            self.interval = min(
+                self.interval * self.backoff, self.max_interval
+            )
+        return self.passed
+
+
+class LogLineProbe(Probe):
+    """
+    passes once a line matching pattern is appended to a log file after
+    the probe was created. Handles the log being rotated or truncated.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        pattern: str,
+        errors: Optional[Dict[str, str]] = None,
+        name: Optional[str] = None,
+        **kwargs,
+    ):
+        super().__init__(self._read_lines, name=name or "log", **kwargs)
+        self.path = path
+        self.pattern = re.compile(pattern)
+        self.errors = errors or {}
+
+        self._inode, self._position = self._stat()
+        self._remainder = ""
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None, 0
+        return stat.st_ino, stat.st_size
+
+    def _new_lines(self) -> List[str]:
+        inode, size = self._stat()
+        if inode is None:
+            return []
+
+        if inode != self._inode or size < self._position:
+            self._inode = inode
+            self._position = 0
+            self._remainder = ""
+
+        if size == self._position:
+            return []
+
+        with open(self.path, "r", errors="replace") as f:
+            f.seek(self._position)
+            data = f.read()
+            self._position = f.tell()
+
+        lines = (self._remainder + data).split("\n")
+        self._remainder = lines.pop()
+        return lines
+
+    def _read_lines(self) -> bool:
+        for line in self._new_lines():
+            for error, message in self.errors.items():
+                if error in line:
+                    raise click.ClickException(message)
+            if self.pattern.search(line) is not None:
+                return True
+        return False
+
+
+def wait_for_probes(
+    probes: Iterable[Probe],
+    timeout: float,
+    abort: Optional[Callable[[], bool]] = None,
+    on_tick: Optional[TickCallback] = None,
+) -> bool:
+    """
+    waits until every probe passes. Returns False if the timeout, a probe's
+    own timeout expires or abort returns True first
+    """
+
+    probes = list(probes)
+    start = time.monotonic()
+    deadline = start + timeout
+
+    while True:
+        now = time.monotonic()
+        pending = [p for p in probes if not p.poll(now)]
+        if len(pending) == 0:
+            return True
+
+        now = time.monotonic()
+        for probe in pending:
+            if probe.timeout is not None and now > start + probe.timeout:
+                return False
+        if now >= deadline or (abort is not None and abort()):
+            return False
+
+        if on_tick is not None:
+            on_tick(now - start)
+
+        # wake for the next probe that is due or whose own timeout expires
+        wake = min(
+            [p.next_check for p in pending]
+            + [start + p.timeout for p in pending if p.timeout is not None]
+            + [deadline]
+        )
+        time.sleep(max(0.0, wake - time.monotonic()))
+
+
+def _wait_for_pidfd(
+    pidfd: int, timeout: float, on_tick: Optional[TickCallback], tick: float
+) -> bool:
+    poller = select.poll()
+    poller.register(pidfd, select.POLLIN)
+
+    start = time.monotonic()
+    deadline = start + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+
+        if poller.poll(min(remaining, tick) * 1000):
+            return True
+
+        if on_tick is not None:
+            on_tick(time.monotonic() - start)
+
+
+def wait_for_exit(
+    pid: int,
+    timeout: float,
+    on_tick: Optional[TickCallback] = None,
+    tick: float = 1.0,
+) -> bool:
+    """
+    waits for a (not necessarily child) process to exit. Uses a pidfd to be
+    notified as soon as the process exits where the platform supports it.
+    """
+
+    pidfd_open = getattr(os, "pidfd_open", None)
+    if pidfd_open is not None:
+        try:
+            pidfd = pidfd_open(pid)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            pass
+        else:
+            try:
+                return _wait_for_pidfd(pidfd, timeout, on_tick, tick)
+            finally:
+                os.close(pidfd)
+
+    try:
+        process = psutil.Process(pid)
+    except psutil.NoSuchProcess:
+        return True
+
+    start = time.monotonic()
+    deadline = start + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        try:
+            process.wait(min(remaining, tick))
+        except psutil.TimeoutExpired:
+            if on_tick is not None:
+                on_tick(time.monotonic() - start)
+        else:
+            return True
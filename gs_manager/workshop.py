@@ -0,0 +1,108 @@
+from typing import Dict, Iterable, List, Optional
+
+import requests
+
+from gs_manager.cache import ResultCache
+
+__all__ = [
+    "STEAM_PUBLISHED_FILES_API",
+    "PublishedFileResolver",
+    "get_session",
+]
+
+STEAM_PUBLISHED_FILES_API = "https://api.steampowered.com/ISteamRemoteStorage/GetPublishedFileDetails/v1"  # noqa
+
+CACHE_NAMESPACE = "workshop_time_updated"
+
+_session: Optional[requests.Session] = None
+
+
+def get_session() -> requests.Session:
+    """ gets a shared HTTP session that keeps connections alive """
+
+    global _session
+
+    if _session is None:
+        _session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(max_retries=5)
+        _session.mount("http://", adapter)
+        _session.mount("https://", adapter)
+    return _session
+
+
+class PublishedFileResolver:
+    """
+    looks up the last update time for workshop items, packing up to
+    batch_size items into each GetPublishedFileDetails request. Results are
+    cached so only items without a result younger than max_age are
+    requested again.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[ResultCache] = None,
+        max_age: int = 0,
+        url: str = STEAM_PUBLISHED_FILES_API,
+        batch_size: int = 100,
+        session: Optional[requests.Session] = None,
+    ):
+        self.cache = cache
+        self.max_age = max_age
+        self.url = url
+        self.batch_size = batch_size
+        self.session = session or get_session()
+
+    def get_details(self, file_ids: Iterable[str]) -> Dict[str, dict]:
+        """ gets the published file details for each item from Steam """
+
+        file_ids = [str(f) for f in file_ids]
+        details = {}
+        for start in range(0, len(file_ids), self.batch_size):
+            batch = file_ids[start : start + self.batch_size]  # noqa
+            data = {"itemcount": len(batch)}
+            for index, file_id in enumerate(batch):
+                data[f"publishedfileids[{index}]"] = file_id
+
+            response = self.session.post(self.url, data)
+            response.raise_for_status()
+
+            for item in response.json()["response"].get(
+                "publishedfiledetails", []
+            ):
+                details[str(item.get("publishedfileid"))] = item
+        return details
+
+    def get_time_updated(
+        self, file_ids: Iterable[str]
+    ) -> Dict[str, Optional[int]]:
+        """
+        gets the last update time for each item. Items Steam does not
+        return a time for map to None.
+        """
+
+        file_ids = [str(f) for f in file_ids]
+        times: Dict[str, Optional[int]] = {}
+        stale: List[str] = []
+
+        for file_id in file_ids:
+            time_updated = None
+            if self.cache is not None:
+                time_updated = self.cache.get(
+                    CACHE_NAMESPACE, file_id, self.max_age
+                )
+            if time_updated is None:
+                stale.append(file_id)
+            else:
+                times[file_id] = time_updated
+
+        if len(stale) > 0:
+            details = self.get_details(stale)
+            for file_id in stale:
+                time_updated = details.get(file_id, {}).get("time_updated")
+                if time_updated is not None:
+                    time_updated = int(time_updated)
+                    if self.cache is not None:
+                        self.cache.set(CACHE_NAMESPACE, file_id, time_updated)
+                times[file_id] = time_updated
+
+        return {file_id: times[file_id] for file_id in file_ids}
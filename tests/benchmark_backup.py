@@ -0,0 +1,95 @@
+"""
+benchmarks the backup compressors on a synthetic world directory
+
+    python -m tests.benchmark_backup [size in MB] [threads]
+"""
+
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+
+from gs_manager.compression import (
+    COMPRESSIONS,
+    CompressWriter,
+    get_compressor,
+)
+
+from .mock_z import make_data
+
+
+def _make_world(path, size):
+    """ region files are mostly compressible, some are noise """
+
+    region_path = os.path.join(path, "world", "region")
+    os.makedirs(region_path)
+    region_size = 4 * 1024 * 1024
+    for index in range(max(1, size // region_size)):
+        if index % 4 == 3:
+            data = os.urandom(region_size)
+        else:
+            data = make_data(region_size, index)
+        with open(os.path.join(region_path, f"r.{index}.0.mca"), "wb") as f:
+            f.write(data)
+    return os.path.join(path, "world")
+
+
+def _timed(name, compression, level, threads, world, temp_dir):
+    path = os.path.join(temp_dir, "backup.tar")
+    start = time.perf_counter()
+    with open(path, "wb") as f:
+        with CompressWriter(
+            f, compression, level=level, threads=threads
+        ) as writer:
+            with tarfile.open(fileobj=writer, mode="w|") as tar:
+                tar.add(world, arcname="world")
+    elapsed = time.perf_counter() - start
+
+    rate = writer.bytes_in / elapsed / 1024 / 1024
+    ratio = writer.bytes_out / writer.bytes_in
+    print(f"{name:<30} {elapsed * 1000:8.1f} ms {rate:8.1f} MB/s {ratio:6.3f}")
+    os.remove(path)
+
+
+def _tarfile_gz(world, temp_dir):
+    path = os.path.join(temp_dir, "backup.tar.gz")
+    start = time.perf_counter()
+    with tarfile.open(path, "w:gz") as tar:
+        tar.add(world, arcname="world")
+    elapsed = time.perf_counter() - start
+    print(f"{'tarfile w:gz':<30} {elapsed * 1000:8.1f} ms")
+    os.remove(path)
+
+
+def main(size=64, threads=None):
+    threads = threads or os.cpu_count() or 1
+    temp_dir = tempfile.mkdtemp()
+    try:
+        world = _make_world(temp_dir, size * 1024 * 1024)
+        print(f"{size} MB world, {threads} thread(s)")
+        _tarfile_gz(world, temp_dir)
+
+        for compression in COMPRESSIONS:
+            try:
+                get_compressor(compression)
+            except Exception as ex:
+                print(f"{compression:<30} skipped: {ex}")
+                continue
+
+            for count in sorted({1, threads}):
+                _timed(
+                    f"{compression}, {count} thread(s)",
+                    compression,
+                    None,
+                    count,
+                    world,
+                    temp_dir,
+                )
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
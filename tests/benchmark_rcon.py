@@ -0,0 +1,87 @@
+"""
+benchmarks the RCON clients against a local mock RCON server
+
+    python -m tests.benchmark_rcon [commands] [servers]
+"""
+
+import sys
+import time
+
+from gs_manager.rcon import RconClient, RconPool, execute_batches
+from valve.rcon import RCON
+
+from .mock_rcon import MockRconServer
+
+
+def _timed(name, function):
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<40} {elapsed * 1000:8.1f} ms")
+
+
+def main(commands=200, server_count=20):
+    commands = [f"command {i}" for i in range(commands)]
+    servers = [MockRconServer() for x in range(server_count)]
+    for server in servers:
+        server.__enter__()
+    address = servers[0].address
+
+    def _valve_per_command():
+        for command in commands:
+            rcon = RCON(address, "password", timeout=5)
+            rcon.connect()
+            rcon.authenticate()
+            rcon.execute(command)
+            rcon.close()
+
+    def _valve_single_connection():
+        with RCON(address, "password", timeout=5) as rcon:
+            for command in commands:
+                rcon.execute(command)
+
+    pool = RconPool(lambda: RconClient(address, "password", timeout=5))
+
+    def _pool_sequential():
+        for command in commands:
+            pool.execute(command)
+
+    def _pool_pipelined():
+        pool.execute_many(commands)
+
+    def _valve_all_servers():
+        for server in servers:
+            with RCON(server.address, "password", timeout=5) as rcon:
+                for command in commands:
+                    rcon.execute(command)
+
+    def _async_all_servers():
+        execute_batches(
+            [
+                (
+                    {
+                        "address": s.address,
+                        "password": "password",
+                        "timeout": 5,
+                    },
+                    commands,
+                )
+                for s in servers
+            ]
+        )
+
+    print(f"{len(commands)} commands, {len(servers)} servers")
+    _timed("valve, connection per command", _valve_per_command)
+    _timed("valve, single connection", _valve_single_connection)
+    _timed("pool, sequential", _pool_sequential)
+    _timed("pool, pipelined batch", _pool_pipelined)
+    _timed("valve, all servers one by one", _valve_all_servers)
+    _timed("async, all servers on one loop", _async_all_servers)
+
+    pool.close()
+    for server in servers:
+        server.__exit__()
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
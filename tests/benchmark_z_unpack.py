@@ -0,0 +1,75 @@
+"""
+benchmarks unpacking ARK mod .z files, chunk by chunk on one thread as
+ArkServer used to vs. inflating chunks on a thread pool
+
+    python -m tests.benchmark_z_unpack [files] [size in MB]
+"""
+
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+from gs_manager.ue4 import z_unpack
+
+from .mock_z import make_data, make_z_file
+
+
+def _serial_z_unpack(from_path, to_path):
+    with open(from_path, "rb") as f_from:
+        with open(to_path, "wb") as f_to:
+            f_from.read(8)
+            size1 = struct.unpack("q", f_from.read(8))[0]
+            f_from.read(8)
+            size2 = struct.unpack("q", f_from.read(8))[0]
+            if size1 == -1641380927:
+                size1 = 131072
+            runs = (size2 + size1 - 1) / size1
+            array = []
+            for i in range(int(runs)):
+                array.append(f_from.read(8))
+                f_from.read(8)
+            for i in range(int(runs)):
+                to_read = array[i]
+                compressed = f_from.read(struct.unpack("q", to_read)[0])
+                decompressed = zlib.decompress(compressed)
+                f_to.write(decompressed)
+
+
+def _timed(name, function, paths, total_size):
+    start = time.perf_counter()
+    for path in paths:
+        function(path, path[:-2])
+    elapsed = time.perf_counter() - start
+    rate = total_size / elapsed / 1024 / 1024
+    print(f"{name:<40} {elapsed * 1000:8.1f} ms {rate:8.1f} MB/s")
+
+
+def main(files=4, size=64):
+    size = size * 1024 * 1024
+    temp_dir = tempfile.mkdtemp()
+    try:
+        data = make_data(size)
+        paths = [
+            make_z_file(os.path.join(temp_dir, f"file{i}.z"), data)
+            for i in range(files)
+        ]
+
+        print(f"{files} file(s), {size // 1024 // 1024} MB each")
+        _timed("serial", _serial_z_unpack, paths, size * files)
+        for threads in [1, 2, 4, os.cpu_count()]:
+            _timed(
+                f"thread pool, {threads} thread(s)",
+                lambda f, t: z_unpack(f, t, threads=threads),
+                paths,
+                size * files,
+            )
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,94 @@
+"""
+scripted stand-in for an interactive steamcmd. Prints a prompt, reads a
+command from stdin and answers it like steamcmd does.
+"""
+
+import sys
+
+PROMPT = "\x1b[1m\nSteam>\x1b[0m"
+# user -> password, anonymous logs in without one
+ACCOUNTS = {"anonymous": None, "user": "secret"}
+
+
+def out(text, end="\n"):
+    sys.stdout.write(text + end)
+    sys.stdout.flush()
+
+
+def app_update(args):
+    app_id = args[0]
+    if app_id == "404":
+        out(f"ERROR! Failed to install app '{app_id}' (No subscription)")
+        return
+
+    for phase, state, current, total in [
+        ("verifying install", "0x5", 0, 1000),
+        ("downloading", "0x61", 250, 1000),
+        ("downloading", "0x61", 1000, 1000),
+    ]:
+        out(
+            f" Update state ({state}) {phase}, progress: "
+            f"{current * 100 / total:.2f} ({current} / {total})"
+        )
+    out(f"Success! App '{app_id}' fully installed.")
+
+
+def workshop_download_item(args):
+    item = args[1]
+    out(f"Downloading item {item} ...")
+    if item == "404":
+        out(f"ERROR! Download item {item} failed (File Not Found).")
+    else:
+        out(
+            f'Success. Downloaded item {item} to "/srv/steamapps/workshop/'
+            f'content/{args[0]}/{item}" (1024 bytes)'
+        )
+
+
+def login(args):
+    user = args[0]
+    if len(args) == 1 and user != "anonymous":
+        # steamcmd asks for the password and waits
+        out("password: ", end="")
+        args.append(sys.stdin.readline().strip())
+
+    password = args[1] if len(args) > 1 else None
+    if ACCOUNTS.get(user, False) != password:
+        out(
+            f"Logging in user '{user}' to Steam Public..."
+            "FAILED (Invalid Password)"
+        )
+    else:
+        out(f"Logging in user '{user}' to Steam Public...OK")
+        out("Waiting for user info...OK")
+
+
+def main():
+    out("Redirecting stderr to '/home/steam/Steam/logs/stderr.txt'")
+    out("[  0%] Checking for available updates...")
+    out("[----] Verifying installation...")
+    out("Steam Console Client (c) Valve Corporation")
+
+    while True:
+        out(PROMPT, end="")
+        line = sys.stdin.readline()
+        if not line:
+            return
+
+        command, *args = line.split()
+        if command == "quit":
+            return
+        elif command == "login":
+            login(args)
+        elif command == "app_update":
+            app_update(args)
+        elif command == "app_info_print":
+            out(f'"{args[0]}"\n{{\n\t"common"\n\t{{\n\t}}\n}}')
+        elif command == "workshop_download_item":
+            workshop_download_item(args)
+        elif command == "crash":
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
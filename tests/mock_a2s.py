@@ -0,0 +1,103 @@
+import socket
+import struct
+import threading
+
+HEADER = b"\xff\xff\xff\xff"
+
+
+class MockA2SServer:
+    """
+    minimal threaded Source query server. Requires a challenge for every
+    request and splits responses larger than split_size into multiple
+    packets.
+    """
+
+    challenge = b"\x11\x22\x33\x44"
+
+    def __init__(self, name="mock", players=None, rules=None, split_size=1200):
+        self.name = name
+        self.players = players or []
+        self.rules = rules or {}
+        self.split_size = split_size
+        self.requests = []
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind(("127.0.0.1", 0))
+        self.address = self._socket.getsockname()
+
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._socket.close()
+
+    def _info(self):
+        return (
+            b"I"
+            + b"\x11"
+            + self.name.encode() + b"\x00"
+            + b"TheIsland\x00"
+            + b"ark\x00"
+            + b"ARK: Survival Evolved\x00"
+            + struct.pack("<h", 0)
+            + bytes([len(self.players), 70, 0])
+            + b"dl"
+            + b"\x00\x01"
+            + b"1.0.0.0\x00"
+            + b"\x80"
+            + struct.pack("<h", 7777)
+        )
+
+    def _players(self):
+        data = b"D" + bytes([len(self.players)])
+        for index, name in enumerate(self.players):
+            data += (
+                bytes([index])
+                + name.encode()
+                + b"\x00"
+                + struct.pack("<lf", index, 60.0)
+            )
+        return data
+
+    def _rules(self):
+        data = b"E" + struct.pack("<h", len(self.rules))
+        for name, value in self.rules.items():
+            data += name.encode() + b"\x00" + value.encode() + b"\x00"
+        return data
+
+    def _send(self, payload, address):
+        payload = HEADER + payload
+        chunks = [
+            payload[i : i + self.split_size]  # noqa
+            for i in range(0, len(payload), self.split_size)
+        ]
+        if len(chunks) == 1:
+            self._socket.sendto(payload, address)
+            return
+
+        for number, chunk in enumerate(chunks):
+            header = b"\xfe\xff\xff\xff" + struct.pack(
+                "<lBBh", 1234, len(chunks), number, self.split_size
+            )
+            self._socket.sendto(header + chunk, address)
+
+    def _serve(self):
+        while True:
+            try:
+                data, address = self._socket.recvfrom(65535)
+            except OSError:
+                return
+
+            kind = chr(data[4])
+            self.requests.append(kind)
+            if not data.endswith(self.challenge):
+                self._send(b"A" + self.challenge, address)
+            elif kind == "T":
+                self._send(self._info(), address)
+            elif kind == "U":
+                self._send(self._players(), address)
+            elif kind == "V":
+                self._send(self._rules(), address)
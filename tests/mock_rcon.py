@@ -0,0 +1,102 @@
+import socket
+import struct
+import threading
+import time
+
+from gs_manager.rcon import decode_packet, encode_packet
+
+
+class MockRconServer:
+    """
+    minimal threaded Source RCON server. Responds to every command with
+    "ran <command>", split into chunks of split_size bytes, and mirrors
+    empty SERVERDATA_RESPONSE_VALUE packets like Source servers do.
+    """
+
+    def __init__(self, password="password", split_size=4096, delay=0.0):
+        self.password = password
+        self.split_size = split_size
+        self.delay = delay
+        self.commands = []
+        self.connections = 0
+        self._clients = []
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(("127.0.0.1", 0))
+        self._socket.listen(128)
+        self.address = self._socket.getsockname()
+
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._socket.close()
+
+    def disconnect(self):
+        """ hangs up on every connected client """
+
+        while len(self._clients) > 0:
+            client = self._clients.pop()
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _serve(self):
+        while True:
+            try:
+                client, _ = self._socket.accept()
+            except OSError:
+                return
+            self.connections += 1
+            self._clients.append(client)
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(
+                target=self._handle, args=(client,), daemon=True
+            ).start()
+
+    def _read(self, client, size):
+        data = b""
+        while len(data) < size:
+            chunk = client.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError()
+            data += chunk
+        return data
+
+    def _handle(self, client):
+        with client:
+            try:
+                while True:
+                    size = struct.unpack("<i", self._read(client, 4))[0]
+                    request_id, packet_type, body = decode_packet(
+                        self._read(client, size)
+                    )
+                    if packet_type == 3:
+                        if body != self.password:
+                            request_id = -1
+                        client.sendall(encode_packet(request_id, 2, ""))
+                    elif packet_type == 2:
+                        self.commands.append(body)
+                        if self.delay:
+                            time.sleep(self.delay)
+                        response = f"ran {body}"
+                        data = b""
+                        for i in range(0, len(response), self.split_size):
+                            data += encode_packet(
+                                request_id,
+                                0,
+                                response[i : i + self.split_size],  # noqa
+                            )
+                        client.sendall(data)
+                    else:
+                        client.sendall(
+                            encode_packet(request_id, 0, "")
+                            + encode_packet(request_id, 0, "\x00\x01\x00\x00")
+                        )
+            except (ConnectionError, OSError):
+                return
@@ -0,0 +1,60 @@
+"""
+writes synthetic UE4 .z files like the ones in ARK mods from the Steam
+workshop
+"""
+
+import os
+import random
+import struct
+import zlib
+
+Z_SIGNATURE = 0x9E2A83C1
+
+
+def make_data(size, seed=0):
+    """ compressible, but not trivially so, like most game assets """
+
+    rand = random.Random(seed)
+    words = [bytes(rand.getrandbits(8) for _ in range(16)) for _ in range(64)]
+    data = bytearray()
+    while len(data) < size:
+        data += rand.choice(words)
+    return bytes(data[:size])
+
+
+def make_z_file(path, data, chunk_size=131072):
+    chunks = [
+        zlib.compress(data[i : i + chunk_size])  # noqa
+        for i in range(0, len(data), chunk_size)
+    ]
+
+    with open(path, "wb") as f:
+        f.write(
+            struct.pack(
+                "<qqqq",
+                Z_SIGNATURE,
+                chunk_size,
+                sum(len(c) for c in chunks),
+                len(data),
+            )
+        )
+        for index, chunk in enumerate(chunks):
+            start = index * chunk_size
+            size = len(data[start : start + chunk_size])  # noqa
+            f.write(struct.pack("<qq", len(chunk), size))
+        for chunk in chunks:
+            f.write(chunk)
+
+    with open(f"{path}.uncompressed_size", "w") as f:
+        f.write(str(len(data)))
+    return path
+
+
+def make_mod(path, files=4, size=1024 * 1024, seed=0):
+    os.makedirs(path, exist_ok=True)
+    for index in range(files):
+        make_z_file(
+            os.path.join(path, f"file{index}.uasset.z"),
+            make_data(size, seed + index),
+        )
+    return path
@@ -0,0 +1,75 @@
+import os
+
+import click
+import mock
+import pytest
+
+servers = pytest.importorskip("gs_manager.servers")
+
+
+def _make_server(**config):
+    server_config = servers.ArkServer.config_class(load_config=False)
+    for key, value in config.items():
+        setattr(server_config, key, value)
+    return servers.ArkServer(server_config)
+
+
+def _make_workshop(tmp_path, mods):
+    base_src_dir = tmp_path / "workshop"
+    for mod in mods:
+        os.makedirs(base_src_dir / mod)
+        with open(base_src_dir / mod / "mod.info", "wb") as f:
+            f.write(mod.encode() * 1024)
+    return str(base_src_dir)
+
+
+def _create_mod_file(mod_dir, mod_file, mod_id):
+    with open(mod_file, "w") as f:
+        f.write(str(mod_id))
+    return True
+
+
+def _extract_mods(server, tmp_path, workshop_times):
+    mods = ["111", "222"]
+    base_src_dir = _make_workshop(tmp_path, mods)
+    mod_path = str(tmp_path / "Mods")
+    os.makedirs(mod_path)
+
+    # mods are installed on run_jobs worker threads
+    with click.Context(click.Command("ark"), obj=server):
+        with mock.patch.object(
+            server, "_create_mod_file", side_effect=_create_mod_file
+        ):
+            status = server._extract_mods(
+                mods, base_src_dir, workshop_times, mod_path, False
+            )
+
+    assert status == servers.STATUS_SUCCESS
+    for mod in mods:
+        with open(os.path.join(mod_path, mod, "mod.info"), "rb") as f:
+            assert f.read() == mod.encode() * 1024
+        with open(os.path.join(mod_path, f"{mod}.mod")) as f:
+            assert f.read() == mod
+    return mod_path
+
+
+def test_extract_mods_to_store(tmp_path):
+    store_path = str(tmp_path / "store")
+    server = _make_server(mod_store_path=store_path)
+
+    mod_path = _extract_mods(server, tmp_path, {"111": 100, "222": 200})
+
+    assert os.path.realpath(os.path.join(mod_path, "222")) == os.path.join(
+        store_path, "222", "200"
+    )
+
+
+@pytest.mark.parametrize("clone_mode", ["copy", "hardlink"])
+def test_extract_mods(tmp_path, clone_mode):
+    server = _make_server(mod_clone_mode=clone_mode)
+
+    mod_path = _extract_mods(server, tmp_path, {})
+
+    src_path = str(tmp_path / "workshop" / "111" / "mod.info")
+    dst_path = os.path.join(mod_path, "111", "mod.info")
+    assert os.path.samefile(src_path, dst_path) == (clone_mode == "hardlink")
@@ -0,0 +1,49 @@
+import os
+import time
+
+import click
+import mock
+import pytest
+
+base = pytest.importorskip("gs_manager.servers.base")
+
+
+@pytest.mark.parametrize("backup_days,expected", [(7, 2), (1, 1)])
+def test_write_backup_keeps_backup_days(tmp_path, backup_days, expected):
+    server_config = base.TestServer.config_class(load_config=False)
+    server_config.backup_location = str(tmp_path)
+    server_config.backup_days = backup_days
+    server = base.TestServer(server_config)
+
+    backup_folder = tmp_path / "backups"
+    os.makedirs(backup_folder)
+    old_backup = str(backup_folder / "test_old.tar.gz")
+    with open(old_backup, "wb"):
+        pass
+    three_days_ago = time.time() - 3 * 86400
+    os.utime(old_backup, (three_days_ago, three_days_ago))
+
+    world = tmp_path / "world"
+    os.makedirs(world)
+    with click.Context(click.Command("test"), obj=server):
+        status = server._write_backup("now", {"world": str(world)})
+
+    assert status == base.STATUS_SUCCESS
+    assert len(os.listdir(backup_folder)) == expected
+
+
+@pytest.mark.parametrize(
+    "progress,isatty,shown",
+    [(True, True, True), (True, False, False), (False, True, False)],
+)
+def test_progress(progress, isatty, shown):
+    server_config = base.TestServer.config_class(load_config=False)
+    server_config.progress = progress
+    server = base.TestServer(server_config)
+
+    with click.Context(click.Command("test"), obj=server):
+        with mock.patch.object(
+            base.sys.stdout, "isatty", return_value=isatty
+        ):
+            with server._progress(10, label="timeout") as tick:
+                assert (tick is not None) == shown
@@ -0,0 +1,94 @@
+import click
+import mock
+import pytest
+import yaml
+
+from gs_manager.rcon import close_rcon_pools
+from tests.mock_rcon import MockRconServer
+
+servers = pytest.importorskip("gs_manager.servers")
+
+
+def test_rcon_multi_part_by_default():
+    server_config = servers.RconServer.config_class(load_config=False)
+    server = servers.RconServer(server_config)
+
+    # the response comes back split over many packets
+    with MockRconServer(split_size=3) as mock_server:
+        server_config.rcon_port = mock_server.address[1]
+        server_config.rcon_password = "password"
+        try:
+            with click.Context(click.Command("rcon"), obj=server):
+                assert server.config.rcon_multi_part
+                assert server.rcon_pool.execute("listplayers") == (
+                    "ran listplayers"
+                )
+        finally:
+            close_rcon_pools()
+
+
+@pytest.mark.parametrize(
+    "args,config_value,expected",
+    [
+        ([], True, True),
+        ([], False, False),
+        (["--no-rcon-multi-part"], True, False),
+        (["--rcon-multi-part"], False, True),
+    ],
+)
+def test_rcon_multi_part_option(args, config_value, expected):
+    server_config = servers.RconServer.config_class(load_config=False)
+    server_config.rcon_multi_part = config_value
+    server = servers.RconServer(server_config)
+    command = click.Command(
+        "rcon",
+        params=[
+            click.Option(**option)
+            for option in server_config.global_options["all"]
+        ],
+    )
+
+    with command.make_context("rcon", args, obj=server):
+        assert server.config.rcon_multi_part is expected
+
+
+class InstanceRconServer(servers.RconServer):
+    supports_multi_instance = True
+
+
+def test_command_all_instances_in_one_batch(tmp_path):
+    with MockRconServer() as server_a, MockRconServer() as server_b:
+        config_file = str(tmp_path / ".gs_config.yml")
+        with open(config_file, "w") as f:
+            yaml.safe_dump(
+                {
+                    "server_path": str(tmp_path),
+                    "rcon_password": "password",
+                    "instance_overrides": {
+                        "a": {"rcon_port": server_a.address[1]},
+                        "b": {"rcon_port": server_b.address[1]},
+                    },
+                },
+                f,
+            )
+        server = InstanceRconServer(
+            servers.RconServer.config_class(config_file=config_file)
+        )
+
+        with click.Context(click.Command("rcon"), obj=server):
+            with mock.patch.object(
+                server, "is_running", return_value=True
+            ), mock.patch(
+                "gs_manager.servers.generic.rcon.execute_batches",
+                wraps=servers.generic.rcon.execute_batches,
+            ) as execute_batches:
+                status = server.invoke(
+                    server.command,
+                    batch=["listplayers", "saveworld"],
+                    current_instance="@all",
+                )
+
+    assert status == servers.STATUS_SUCCESS
+    assert execute_batches.call_count == 1
+    assert server_a.commands == ["listplayers", "saveworld"]
+    assert server_b.commands == ["listplayers", "saveworld"]
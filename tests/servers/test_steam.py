@@ -0,0 +1,151 @@
+import os
+
+import click
+import mock
+import pytest
+import yaml
+
+from gs_manager.steamcmd import SteamCmdError, close_steamcmd_sessions
+from tests.test_steamcmd import FAKE_STEAMCMD
+
+servers = pytest.importorskip("gs_manager.servers")
+
+
+def _make_server(**config):
+    server_config = servers.SteamServer.config_class(load_config=False)
+    server_config.steamcmd_path = FAKE_STEAMCMD
+    for key, value in config.items():
+        setattr(server_config, key, value)
+    return servers.SteamServer(server_config)
+
+
+@pytest.mark.parametrize(
+    "config",
+    [{}, {"steam_username": "user", "steam_password": "secret"}],
+)
+def test_steamcmd_login(config):
+    server = _make_server(**config)
+
+    try:
+        with click.Context(click.Command("steam"), obj=server):
+            session = server.steamcmd
+            assert session.run("app_update 376030").success
+            assert session.logged_in
+    finally:
+        close_steamcmd_sessions()
+
+
+def test_steamcmd_bad_login():
+    server = _make_server(steam_username="user", steam_password="bad")
+
+    try:
+        with click.Context(click.Command("steam"), obj=server):
+            with pytest.raises(SteamCmdError):
+                server.steamcmd.run("app_update 376030")
+    finally:
+        close_steamcmd_sessions()
+
+
+def _make_instance_server(tmp_path):
+    config_file = str(tmp_path / ".gs_config.yml")
+    with open(config_file, "w") as f:
+        yaml.safe_dump(
+            {
+                "server_path": str(tmp_path),
+                "instance_overrides": {"a": {}, "b": {}, "c": {}},
+            },
+            f,
+        )
+    return servers.SteamServer(
+        servers.SteamServer.config_class(config_file=config_file)
+    )
+
+
+def test_restart_only_affected_instances(tmp_path):
+    server = _make_instance_server(tmp_path)
+
+    with click.Context(click.Command("steam"), obj=server):
+        with mock.patch.object(server, "invoke", return_value=0) as invoke:
+            server._stop_servers(["a", "c"])
+            server._start_servers(True, False)
+
+    (stop_call, start_call) = invoke.call_args_list
+    assert stop_call[0] == (server.stop,)
+    assert start_call[0] == (server.start,)
+    for call in [stop_call, start_call]:
+        assert call[1]["current_instance"] == "@each:a,c"
+        assert call[1]["parallel"]
+    assert not os.path.exists(tmp_path / ".start_servers")
+
+
+def test_restart_without_instances(tmp_path):
+    server = _make_server(server_path=str(tmp_path))
+
+    with click.Context(click.Command("steam"), obj=server):
+        with mock.patch.object(server, "invoke", return_value=0) as invoke:
+            server._stop_servers(True)
+            server._start_servers(True, False)
+
+    for call in invoke.call_args_list:
+        assert "current_instance" not in call[1]
+    assert invoke.call_count == 2
+
+
+def test_was_running_uses_instance_names(tmp_path):
+    server = _make_instance_server(tmp_path)
+
+    with click.Context(click.Command("steam"), obj=server):
+        with mock.patch.object(
+            server, "_is_running_single", side_effect=[True, False, True]
+        ):
+            assert server._get_was_running() == ["a", "c"]
+        with mock.patch.object(
+            server, "_is_running_single", return_value=False
+        ):
+            assert server._get_was_running() == []
+
+
+@pytest.mark.parametrize(
+    "download_result,expected",
+    [
+        (SteamCmdError("steamcmd exited"), servers.STATUS_FAILED),
+        (["Timeout", None], servers.STATUS_PARTIAL_FAIL),
+    ],
+)
+def test_workshop_download_restarts_on_failure(
+    tmp_path, download_result, expected
+):
+    server = _make_server(
+        server_path=str(tmp_path),
+        app_id=376030,
+        workshop_id=346110,
+        workshop_items=["1", "2"],
+    )
+    session = mock.Mock()
+    session.workshop_download_item.side_effect = download_result
+
+    with click.Context(click.Command("steam"), obj=server) as context:
+        with mock.patch.object(
+            servers.SteamServer,
+            "steamcmd",
+            new_callable=mock.PropertyMock,
+            return_value=session,
+        ), mock.patch.object(
+            server, "_get_was_running", return_value=True
+        ), mock.patch.object(
+            server, "_stop_servers"
+        ), mock.patch.object(
+            server, "_start_servers"
+        ) as start_servers, mock.patch.object(
+            server, "invoke", return_value=servers.STATUS_SUCCESS
+        ):
+            status = context.invoke(
+                server.workshop_download,
+                allow_run=False,
+                force=True,
+                stop=False,
+                restart=True,
+            )
+
+    assert status == expected
+    start_servers.assert_called_once_with(True, True)
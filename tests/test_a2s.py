@@ -0,0 +1,84 @@
+import socket
+import time
+
+from gs_manager.a2s import (
+    A2S_INFO,
+    A2S_PLAYERS,
+    A2S_RULES,
+    ping,
+    query_info,
+    query_servers,
+)
+from tests.mock_a2s import MockA2SServer
+
+
+def _dead_address():
+    # bound, but never answers
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    return sock, sock.getsockname()
+
+
+def test_query_info_with_challenge():
+    with MockA2SServer(name="My Ark", players=["a", "b"]) as server:
+        info = query_info(server.address, timeout=2)
+
+    assert info["server_name"] == "My Ark"
+    assert info["map"] == "TheIsland"
+    assert info["player_count"] == 2
+    assert info["max_players"] == 70
+    assert info["server_type"] == "dedicated"
+    assert info["platform"] == "linux"
+    assert info["password_protected"] is False
+    assert info["vac_enabled"] is True
+    assert info["version"] == "1.0.0.0"
+    assert info["port"] == 7777
+    assert server.requests == ["T", "T"]
+
+
+def test_query_players_and_split_rules():
+    rules = {f"rule{i}": "x" * 50 for i in range(40)}
+    with MockA2SServer(players=["a", "b"], rules=rules) as server:
+        results = query_servers(
+            [server.address],
+            [A2S_INFO, A2S_PLAYERS, A2S_RULES],
+            timeout=2,
+        )
+
+    result = results[server.address]
+    assert [p["name"] for p in result[A2S_PLAYERS]] == ["a", "b"]
+    assert result[A2S_PLAYERS][1]["score"] == 1
+    assert result[A2S_RULES] == rules
+
+
+def test_query_servers_shares_deadline():
+    dead = [_dead_address() for _ in range(3)]
+    try:
+        with MockA2SServer(name="one") as one, MockA2SServer(
+            name="two"
+        ) as two:
+            addresses = [one.address, two.address] + [d[1] for d in dead]
+
+            start = time.monotonic()
+            results = query_servers(addresses, timeout=0.5)
+            elapsed = time.monotonic() - start
+    finally:
+        for sock, _ in dead:
+            sock.close()
+
+    assert results[one.address][A2S_INFO]["server_name"] == "one"
+    assert results[two.address][A2S_INFO]["server_name"] == "two"
+    for _, address in dead:
+        assert results[address] == {}
+    assert elapsed < 1.0
+
+
+def test_ping():
+    sock, address = _dead_address()
+    try:
+        assert not ping(address, timeout=0.2)
+    finally:
+        sock.close()
+
+    with MockA2SServer() as server:
+        assert ping(server.address, timeout=2)
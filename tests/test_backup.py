@@ -0,0 +1,107 @@
+import io
+import os
+
+from gs_manager.backup import ChunkRepository, iter_chunks
+
+from .mock_z import make_data
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_iter_chunks_follow_content():
+    data = os.urandom(2 * 1024 * 1024)
+    chunks = list(iter_chunks(io.BytesIO(data)))
+
+    assert b"".join(chunks) == data
+    assert all(16 * 1024 <= len(c) <= 256 * 1024 for c in chunks[:-1])
+
+    # inserting data only changes the chunks around it
+    shifted = list(iter_chunks(io.BytesIO(data[:1000] + b"x" + data[1000:])))
+    assert len(set(chunks) & set(shifted)) >= len(chunks) - 2
+
+
+def test_backup_and_restore(tmp_path):
+    world = str(tmp_path / "server" / "world")
+    _write(os.path.join(world, "region", "r.0.0.mca"), os.urandom(500000))
+    _write(os.path.join(world, "level.dat"), make_data(100000))
+    os.makedirs(os.path.join(world, "empty"))
+    os.symlink("level.dat", os.path.join(world, "level.link"))
+    config = str(tmp_path / "server" / ".gs_config.json")
+    _write(config, b"{}")
+
+    repository = ChunkRepository(str(tmp_path / "repository"))
+    paths = {"world": world, ".gs_config.json": config}
+
+    first = repository.backup("mc_1", paths)
+    assert first.files == 3
+    assert first.new_chunks == first.chunks
+
+    second = repository.backup("mc_2", paths, base="mc_1")
+    assert second.unchanged == 3
+    assert second.new_chunks == 0
+
+    # a small change only stores the chunks around it
+    region = os.path.join(world, "region", "r.0.0.mca")
+    data = bytearray(_read(region))
+    data[250000:250010] = b"x" * 10
+    _write(region, bytes(data))
+    third = repository.backup("mc_3", paths, base="mc_2")
+    assert 0 < third.new_chunks <= 2
+
+    restore_path = str(tmp_path / "restore")
+    assert repository.restore("mc_3", restore_path) == 3
+    assert _read(os.path.join(restore_path, "world", "region", "r.0.0.mca")) == bytes(data)  # noqa
+    assert os.path.isdir(os.path.join(restore_path, "world", "empty"))
+    assert os.readlink(os.path.join(restore_path, "world", "level.link")) == (
+        "level.dat"
+    )
+
+    repository.restore("mc_1", str(tmp_path / "restore1"))
+    assert _read(
+        str(tmp_path / "restore1" / "world" / "region" / "r.0.0.mca")
+    ) != bytes(data)
+
+
+def test_prune(tmp_path):
+    world = str(tmp_path / "world")
+    _write(os.path.join(world, "a"), os.urandom(100000))
+
+    repository = ChunkRepository(str(tmp_path / "repository"))
+    repository.backup("mc_1", {"world": world})
+    _write(os.path.join(world, "a"), os.urandom(100000))
+    repository.backup("mc_2", {"world": world})
+
+    assert repository.prune(3600) == []
+    assert repository.prune(-1) == ["mc_1"]
+    assert repository.snapshots == ["mc_2"]
+
+    chunks = repository.read_snapshot("mc_2")["files"]["world/a"]["chunks"]
+    count = sum(
+        len(files) for _, _, files in os.walk(repository.chunks_path)
+    )
+    assert count == len(chunks)
+    repository.restore("mc_2", str(tmp_path / "restore"))
+
+
+def test_prune_shared_repository(tmp_path):
+    world = str(tmp_path / "world")
+    _write(os.path.join(world, "a"), os.urandom(100000))
+
+    repository = ChunkRepository(str(tmp_path / "repository"))
+    for name in ["ark_1", "mc_1", "mc_2", "ark_2", "mc_3"]:
+        repository.backup(name, {"world": world})
+
+    assert repository.prune(-1, backup_name="mc") == ["mc_1", "mc_2"]
+    assert repository.snapshots == ["ark_1", "ark_2", "mc_3"]
+    # the latest snapshot of each backup is kept
+    assert repository.prune(-1) == ["ark_1"]
+    assert repository.snapshots == ["ark_2", "mc_3"]
@@ -0,0 +1,68 @@
+import os
+
+import mock
+
+from gs_manager.cache import ResultCache, get_cache
+
+
+def test_get_set(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite"))
+
+    assert cache.get("a2s_info", "127.0.0.1:27015", 10) is None
+
+    cache.set("a2s_info", "127.0.0.1:27015", {"map": "TheIsland"})
+
+    assert cache.get("a2s_info", "127.0.0.1:27015", 10) == {
+        "map": "TheIsland"
+    }
+    assert cache.get("minecraft_status", "127.0.0.1:27015", 10) is None
+
+
+def test_max_age(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite"))
+
+    with mock.patch("gs_manager.cache.time.time", return_value=1000.0):
+        cache.set("a2s_info", "key", 1)
+
+    with mock.patch("gs_manager.cache.time.time", return_value=1005.0):
+        assert cache.get("a2s_info", "key", 10) == 1
+        assert cache.get("a2s_info", "key", 2) is None
+        assert cache.get("a2s_info", "key", 0) is None
+
+        cache.purge(2)
+        assert cache.get("a2s_info", "key", 10) is None
+
+
+def test_shared_between_connections(tmp_path):
+    path = str(tmp_path / "cache" / "cache.sqlite")
+
+    ResultCache(path).set("a2s_info", "key", [1, 2])
+
+    assert os.path.isfile(path)
+    assert ResultCache(path).get("a2s_info", "key", 10) == [1, 2]
+
+
+def test_errors_are_misses(tmp_path):
+    path = tmp_path / "not_a_directory"
+    path.write_text("")
+    cache = ResultCache(str(path / "cache.sqlite"))
+
+    cache.set("a2s_info", "key", 1)
+
+    assert cache.get("a2s_info", "key", 10) is None
+
+
+def test_get_cache(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+
+    assert get_cache(path) is get_cache(path)
+
+
+def test_lock(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite"))
+
+    with cache.lock("steam_build_id", "376030:public"):
+        cache.set("steam_build_id", "376030:public", "123")
+
+    assert os.path.isfile(tmp_path / "steam_build_id-376030_public.lock")
+    assert cache.get("steam_build_id", "376030:public", 10) == "123"
@@ -0,0 +1,59 @@
+import io
+import os
+import tarfile
+
+import click
+import pytest
+
+from gs_manager import compression
+from gs_manager.compression import (
+    CompressWriter,
+    detect_compression,
+    open_decompressed,
+)
+
+from .mock_z import make_data
+
+
+@pytest.mark.parametrize("name", ["gzip", "xz", "none"])
+@pytest.mark.parametrize("threads", [1, 4])
+def test_compress_writer(tmp_path, name, threads):
+    data = make_data(300000)
+    path = str(tmp_path / "data")
+
+    with open(path, "wb") as f:
+        with CompressWriter(f, name, threads=threads, block_size=65536) as w:
+            for index in range(0, len(data), 10000):
+                w.write(data[index : index + 10000])  # noqa
+
+    assert w.bytes_in == len(data)
+    assert w.bytes_out == os.path.getsize(path)
+    assert detect_compression(path) == name
+    with open_decompressed(path) as f:
+        assert f.read() == data
+
+
+def test_tar_round_trip(tmp_path):
+    world = tmp_path / "world"
+    world.mkdir()
+    (world / "level.dat").write_bytes(make_data(100000))
+    path = str(tmp_path / "backup.tar.xz")
+
+    with open(path, "wb") as f:
+        with CompressWriter(f, "xz", threads=2, block_size=16384) as writer:
+            with tarfile.open(fileobj=writer, mode="w|") as tar:
+                tar.add(str(world), arcname="world")
+
+    with open_decompressed(path) as f:
+        with tarfile.open(fileobj=f, mode="r|") as tar:
+            tar.extractall(path=str(tmp_path / "restore"))
+
+    restored = tmp_path / "restore" / "world" / "level.dat"
+    assert restored.read_bytes() == make_data(100000)
+
+
+def test_missing_compressor(monkeypatch):
+    monkeypatch.setattr(compression, "zstandard", None)
+
+    with pytest.raises(click.ClickException):
+        CompressWriter(io.BytesIO(), "zstd")
@@ -0,0 +1,148 @@
+import os
+import shutil
+
+import mock
+
+from gs_manager.dedupe import DedupeStore
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _make_installs(tmp_path):
+    paths = []
+    for name in ["ark1", "ark2"]:
+        server_path = str(tmp_path / name)
+        _write(os.path.join(server_path, "Binaries", "a"), b"a" * 2048)
+        _write(os.path.join(server_path, "Binaries", "b"), b"b" * 2048)
+        _write(os.path.join(server_path, "small"), b"s")
+        paths.append(server_path)
+
+    _write(os.path.join(paths[1], "Saved", "s"), b"unique" * 1024)
+    return paths
+
+
+def test_dedupe_hardlink(tmp_path):
+    ark1, ark2 = _make_installs(tmp_path)
+    store = DedupeStore(str(tmp_path / "store"), "hardlink", min_size=1024)
+
+    first = store.add_tree(ark1)
+    assert (first.files, first.linked, first.bytes_saved) == (2, 0, 0)
+
+    second = store.add_tree(ark2)
+    assert (second.files, second.linked, second.bytes_saved) == (3, 2, 4096)
+    assert os.path.samefile(
+        os.path.join(ark1, "Binaries", "a"),
+        os.path.join(ark2, "Binaries", "a"),
+    )
+    assert not os.path.samefile(
+        os.path.join(ark1, "small"), os.path.join(ark2, "small")
+    )
+
+    # nothing left to do the second time
+    again = store.add_tree(ark2)
+    assert (again.linked, again.shared, again.bytes_shared) == (0, 3, 10240)
+
+    assert store.unshare_tree(ark2) == 3
+    assert not os.path.samefile(
+        os.path.join(ark1, "Binaries", "a"),
+        os.path.join(ark2, "Binaries", "a"),
+    )
+    with open(os.path.join(ark2, "Binaries", "a"), "rb") as f:
+        assert f.read() == b"a" * 2048
+
+    shutil.rmtree(ark1)
+    store.unshare_tree(ark2)
+    assert store.gc() == 3
+    store.close()
+
+
+def test_dedupe_reflink(tmp_path):
+    ark1, ark2 = _make_installs(tmp_path)
+    store = DedupeStore(str(tmp_path / "store"), min_size=1024)
+
+    # stand in for filesystems without reflink support
+    with mock.patch("gs_manager.dedupe.reflink", side_effect=shutil.copy2):
+        store.add_tree(ark1)
+        report = store.add_tree(ark2)
+        again = store.add_tree(ark2)
+
+    assert (report.linked, report.bytes_saved) == (2, 4096)
+    assert (again.linked, again.shared) == (0, 3)
+    assert not os.path.samefile(
+        os.path.join(ark1, "Binaries", "a"),
+        os.path.join(ark2, "Binaries", "a"),
+    )
+    store.close()
+
+
+def test_dedupe_skips_changed_files(tmp_path):
+    ark1, ark2 = _make_installs(tmp_path)
+    store = DedupeStore(str(tmp_path / "store"), "hardlink", min_size=1024)
+    store.add_tree(ark1)
+
+    path = os.path.join(ark2, "Binaries", "a")
+    stat = os.lstat(path)
+    _write(path, b"c" * 4096)
+
+    digest = store._file_hash(os.path.join(ark1, "Binaries", "a"), stat)
+    object_path = store.object_path(digest, stat.st_mode)
+    assert not store._replace(object_path, path, stat)
+    with open(path, "rb") as f:
+        assert f.read() == b"c" * 4096
+    store.close()
+
+
+def test_dedupe_excludes_writable_paths(tmp_path):
+    ark1, ark2 = _make_installs(tmp_path)
+    _write(os.path.join(ark1, "Saved", "s"), b"unique" * 1024)
+    store = DedupeStore(str(tmp_path / "store"), "hardlink", min_size=1024)
+
+    store.add_tree(ark1, exclude=["Saved"])
+    report = store.add_tree(ark2, exclude=["Saved"])
+
+    assert report.files == 2
+    assert os.lstat(os.path.join(ark2, "Saved", "s")).st_nlink == 1
+    store.close()
+
+
+def test_dedupe_seed_tree(tmp_path):
+    ark1, _ = _make_installs(tmp_path)
+    store = DedupeStore(str(tmp_path / "store"), "hardlink", min_size=1024)
+    store.add_tree(ark1, name="app_376030")
+
+    ark3 = str(tmp_path / "ark3")
+    _write(os.path.join(ark3, "Binaries", "b"), b"local")
+    report = store.seed_tree("app_376030", ark3)
+
+    assert (report.files, report.bytes_saved) == (1, 2048)
+    assert os.path.samefile(
+        os.path.join(ark1, "Binaries", "a"),
+        os.path.join(ark3, "Binaries", "a"),
+    )
+    # files already in the install are not touched
+    with open(os.path.join(ark3, "Binaries", "b"), "rb") as f:
+        assert f.read() == b"local"
+    assert store.seed_tree("app_unknown", ark3).files == 0
+    store.close()
+
+
+def test_unshare_only_store_links(tmp_path):
+    ark1, ark2 = _make_installs(tmp_path)
+    store = DedupeStore(str(tmp_path / "store"), "hardlink", min_size=1024)
+    store.add_tree(ark1)
+    store.add_tree(ark2)
+
+    # mods hardlinked from the mod store are not dedupe store objects
+    mod_store_file = str(tmp_path / "mod_store" / "111" / "mod.info")
+    mod_file = os.path.join(ark2, "Mods", "111", "mod.info")
+    _write(mod_store_file, b"m" * 2048)
+    os.makedirs(os.path.dirname(mod_file))
+    os.link(mod_store_file, mod_file)
+
+    assert store.unshare_tree(ark2) == 3
+    assert os.path.samefile(mod_store_file, mod_file)
+    store.close()
@@ -0,0 +1,95 @@
+import os
+import time
+
+import click
+from gs_manager.executor import ParallelExecutor, SyncExecutor, run_jobs
+from mock import Mock
+
+
+class FakeServer:
+    def __init__(self):
+        self.instance_name = None
+        self.logger = Mock()
+
+    @property
+    def server_name(self):
+        return self.instance_name
+
+    def set_instance(self, instance_name, multi_instance=False):
+        self.instance_name = instance_name
+
+
+def _run(executor, callback, instance_names):
+    server = FakeServer()
+    with click.Context(click.Command("test"), obj=server):
+        return executor.run(callback, instance_names), server
+
+
+def test_sync_executor():
+    seen = []
+
+    def _callback():
+        seen.append(server.instance_name)
+        return len(seen) - 1
+
+    executor = SyncExecutor("test")
+    server = FakeServer()
+    with click.Context(click.Command("test"), obj=server):
+        results = executor.run(_callback, ["a", "b"])
+
+    assert results == [0, 1]
+    assert seen == ["a", "b"]
+    assert server.instance_name is None
+
+
+def test_parallel_executor_results(capsys):
+    def _callback():
+        server = click.get_current_context().obj
+        click.echo(f"hello from {server.instance_name}")
+        click.echo("no newline", nl=False)
+        return {"a": 0, "bb": 2, "c": 1}[server.instance_name]
+
+    results, _ = _run(ParallelExecutor("test"), _callback, ["a", "bb", "c"])
+
+    assert results == [0, 2, 1]
+    out = capsys.readouterr().out
+    assert "a  | hello from a" in out
+    assert "bb | hello from bb" in out
+    assert "c  | no newline" in out
+
+
+def test_parallel_executor_max_parallel(tmp_path):
+    def _callback():
+        marker = tmp_path / str(os.getpid())
+        marker.write_text(str(time.monotonic()))
+        running = len(list(tmp_path.iterdir()))
+        time.sleep(0.2)
+        marker.unlink()
+        return 0 if running <= 2 else 1
+
+    results, _ = _run(
+        ParallelExecutor("test", max_parallel=2),
+        _callback,
+        ["a", "b", "c", "d"],
+    )
+
+    assert results == [0, 0, 0, 0]
+
+
+def test_run_jobs():
+    progress = []
+
+    def _job(item, report):
+        if item == "bad":
+            raise ValueError(item)
+        report(len(item))
+        report(1)
+
+    results = run_jobs(
+        _job, ["a", "bad", "ccc"], max_workers=2, on_progress=progress.append
+    )
+
+    assert results["a"] is None
+    assert results["ccc"] is None
+    assert isinstance(results["bad"], ValueError)
+    assert sum(progress) == 6
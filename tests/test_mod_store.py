@@ -0,0 +1,75 @@
+import os
+
+from gs_manager.mod_store import ModStore
+
+from .mock_z import make_data, make_z_file
+
+
+def _create_mod_file(mod_dir, mod_file):
+    with open(mod_file, "wb") as f:
+        f.write(b"mod")
+    return True
+
+
+def _make_src(path, seed):
+    os.makedirs(path, exist_ok=True)
+    make_z_file(os.path.join(path, "a.z"), make_data(1000, seed))
+    make_z_file(os.path.join(path, "b.z"), make_data(1000, 10))
+    return path
+
+
+def test_mod_store(tmp_path):
+    store = ModStore(str(tmp_path / "store"))
+    src_dir = _make_src(str(tmp_path / "workshop" / "731604991"), 1)
+
+    assert store.add("731604991", 100, src_dir, _create_mod_file)
+    # already extracted
+    assert not store.add("731604991", 100, src_dir, _create_mod_file)
+    assert store.versions("731604991") == [100]
+
+    servers = []
+    for name in ["ark1", "ark2"]:
+        mod_path = str(tmp_path / name / "Mods")
+        os.makedirs(os.path.join(mod_path, "731604991"))
+        mod_dir = os.path.join(mod_path, "731604991")
+        mod_file = os.path.join(mod_path, "731604991.mod")
+        store.link("731604991", 100, mod_dir, mod_file)
+        servers.append((mod_dir, mod_file))
+
+    assert os.path.samefile(
+        os.path.join(servers[0][0], "a"), os.path.join(servers[1][0], "a")
+    )
+    assert os.path.samefile(servers[0][1], servers[1][1])
+
+    # a new version only unpacks the changed file
+    _make_src(src_dir, 2)
+    assert store.add("731604991", 200, src_dir, _create_mod_file)
+    old_path = store.get_path("731604991", 100)
+    new_path = store.get_path("731604991", 200)
+    assert os.path.samefile(
+        os.path.join(old_path, "b"), os.path.join(new_path, "b")
+    )
+    assert not os.path.samefile(
+        os.path.join(old_path, "a"), os.path.join(new_path, "a")
+    )
+
+    store.link("731604991", 200, *servers[0])
+    assert os.path.realpath(servers[0][0]) == new_path
+    assert os.path.realpath(servers[1][0]) == old_path
+    with open(os.path.join(old_path, "a"), "rb") as f:
+        assert f.read() == make_data(1000, 1)
+
+
+def test_mod_store_hardlink(tmp_path):
+    store = ModStore(str(tmp_path / "store"), mode="hardlink")
+    src_dir = _make_src(str(tmp_path / "workshop" / "1"), 1)
+    store.add("1", 100, src_dir, _create_mod_file)
+
+    mod_dir = str(tmp_path / "Mods" / "1")
+    store.link("1", 100, mod_dir, str(tmp_path / "Mods" / "1.mod"))
+
+    assert not os.path.islink(mod_dir)
+    assert os.path.samefile(
+        os.path.join(mod_dir, "a"),
+        os.path.join(store.get_path("1", 100), "a"),
+    )
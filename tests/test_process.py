@@ -0,0 +1,111 @@
+from gs_manager.process import ProcessEntry, ProcessIndex
+
+
+def _make_index():
+    return ProcessIndex(
+        [
+            ProcessEntry(
+                pid=30,
+                ppid=20,
+                cmdline=["java", "-Xmx1G", "-jar", "server.jar", "nogui"],
+                create_time=3.0,
+            ),
+            ProcessEntry(
+                pid=20,
+                ppid=1,
+                cmdline=[
+                    "SCREEN",
+                    "-h",
+                    "1024",
+                    "-dmS",
+                    "minecraft",
+                    "java",
+                    "-Xmx1G",
+                    "-jar",
+                    "server.jar",
+                    "nogui",
+                ],
+                create_time=2.0,
+            ),
+            ProcessEntry(
+                pid=40,
+                ppid=1,
+                cmdline=["screen", "-p", "0", "-S", "minecraft", "-X", "eval"],
+                create_time=4.0,
+            ),
+            ProcessEntry(
+                pid=50,
+                ppid=1,
+                cmdline=["/srv/ShooterGameServer", "TheIsland?Name=My Ark"],
+                create_time=1.0,
+            ),
+        ]
+    )
+
+
+def test_find_command_own_process_first():
+    index = _make_index()
+
+    matches = index.find_command("java -Xmx1G -jar server.jar nogui")
+
+    assert [m.pid for m in matches] == [30, 20]
+
+
+def test_find_command_skips_shell_wrapper():
+    command = "ShooterGameServer TheIsland?listen -server"
+    index = ProcessIndex(
+        [
+            ProcessEntry(
+                pid=60, ppid=1, cmdline=["sh", "-c", command], create_time=1.0
+            ),
+            ProcessEntry(
+                pid=61,
+                ppid=60,
+                cmdline=["/srv/ark/ShooterGameServer", "TheIsland?listen"]
+                + ["-server"],
+                create_time=2.0,
+            ),
+            ProcessEntry(
+                pid=70,
+                ppid=1,
+                cmdline=["/bin/bash", "-ec", command],
+                create_time=3.0,
+            ),
+        ]
+    )
+
+    matches = index.find_command(command)
+
+    assert [m.pid for m in matches] == [61]
+
+
+def test_find_command_escaped_spaces():
+    index = _make_index()
+
+    matches = index.find_command(
+        "/srv/ShooterGameServer TheIsland?Name=My\\ Ark"
+    )
+
+    assert [m.pid for m in matches] == [50]
+
+
+def test_find_command_no_match():
+    index = _make_index()
+
+    assert index.find_command("java -jar other.jar") == []
+    assert index.find_command("") == []
+
+
+def test_find_screen_session():
+    index = _make_index()
+
+    matches = index.find_screen_session("minecraft")
+
+    assert [m.pid for m in matches] == [20]
+    assert index.find_screen_session("other") == []
+
+
+def test_children():
+    index = _make_index()
+
+    assert [c.pid for c in index.children(20)] == [30]
@@ -0,0 +1,239 @@
+import asyncio
+import time
+
+import pytest
+from gs_manager.rcon import (
+    AsyncRconClient,
+    RconAuthenticationError,
+    RconClient,
+    RconConnectionError,
+    RconError,
+    RconPool,
+    RconTimeoutError,
+    execute_batches,
+)
+
+from .mock_rcon import MockRconServer
+
+
+class FakeRcon:
+    created = 0
+
+    def __init__(self, fail_execute=None, fail_connect=False, fail_from=0):
+        FakeRcon.created += 1
+        # exception execute_many raises after fail_from successful calls
+        self.fail_execute = fail_execute
+        self.fail_connect = fail_connect
+        self.fail_from = fail_from
+        self.authenticated = False
+        self.closed = False
+        self.commands = []
+
+    def connect(self):
+        if self.fail_connect:
+            raise ConnectionRefusedError()
+
+    def authenticate(self):
+        self.authenticated = True
+
+    def execute_many(self, commands):
+        if self.fail_execute is not None:
+            if self.fail_from <= 0:
+                raise self.fail_execute()
+            self.fail_from -= 1
+        self.commands += commands
+        return [f"ran {command}" for command in commands]
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def reset_created():
+    FakeRcon.created = 0
+
+
+def test_pool_reuses_connection():
+    pool = RconPool(FakeRcon)
+
+    assert pool.execute("save") == "ran save"
+    assert pool.execute("say hi") == "ran say hi"
+    assert FakeRcon.created == 1
+
+
+def test_pool_evicts_idle_connection():
+    pool = RconPool(FakeRcon, idle_timeout=0)
+
+    pool.execute("save")
+    pool.execute("save")
+
+    assert FakeRcon.created == 2
+
+
+def test_pool_reconnects_on_failure():
+    # the connection dies while idle, before the next commands are sent
+    connections = [
+        FakeRcon(fail_execute=RconConnectionError, fail_from=1),
+        FakeRcon(),
+    ]
+    pool = RconPool(lambda: connections.pop(0))
+
+    assert pool.execute("save") == "ran save"
+    assert pool.execute("say hi") == "ran say hi"
+    assert len(connections) == 0
+
+
+def test_pool_raises_after_retries():
+    pool = RconPool(lambda: FakeRcon(fail_execute=RconConnectionError))
+
+    with pytest.raises(RconError):
+        pool.execute("save")
+    assert FakeRcon.created == 1
+
+
+@pytest.mark.parametrize("error", [RconTimeoutError, RconError, OSError])
+def test_pool_does_not_retry_sent_commands(error):
+    pool = RconPool(lambda: FakeRcon(fail_execute=error, fail_from=1))
+    pool.execute("save")
+
+    with pytest.raises(error):
+        pool.execute("DoExit")
+    assert FakeRcon.created == 1
+
+
+def test_pool_replaces_stale_connection():
+    with MockRconServer() as server:
+        pool = RconPool(
+            lambda: RconClient(server.address, "password", timeout=5)
+        )
+        pool.execute("a")
+        server.disconnect()
+        time.sleep(0.1)
+        assert pool.execute("b") == "ran b"
+        pool.close()
+
+    assert server.commands == ["a", "b"]
+    assert server.connections == 2
+
+
+def test_pool_check():
+    assert RconPool(FakeRcon).check()
+    assert not RconPool(lambda: FakeRcon(fail_connect=True)).check()
+
+
+def test_pool_close():
+    pool = RconPool(FakeRcon)
+    with pool.connection() as connection:
+        pass
+
+    pool.close()
+
+    assert connection.closed
+
+
+def test_client_execute_many():
+    with MockRconServer() as server:
+        client = RconClient(server.address, "password", timeout=5)
+        client.connect()
+        client.authenticate()
+
+        responses = client.execute_many(["save", "say hi", "listplayers"])
+        client.close()
+
+    assert responses == ["ran save", "ran say hi", "ran listplayers"]
+    assert server.commands == ["save", "say hi", "listplayers"]
+
+
+def test_client_multi_part():
+    with MockRconServer(split_size=3) as server:
+        client = RconClient(
+            server.address, "password", timeout=5, multi_part=True
+        )
+        client.connect()
+        client.authenticate()
+
+        responses = client.execute_many(["cvarlist", "status"])
+        client.close()
+
+    assert responses == ["ran cvarlist", "ran status"]
+
+
+def test_client_bad_password():
+    with MockRconServer() as server:
+        client = RconClient(server.address, "wrong", timeout=5)
+        client.connect()
+
+        with pytest.raises(RconAuthenticationError):
+            client.authenticate()
+
+
+def test_pool_batch_single_connection():
+    with MockRconServer() as server:
+        pool = RconPool(
+            lambda: RconClient(server.address, "password", timeout=5)
+        )
+        pool.execute_many(["a", "b"])
+        pool.execute("c")
+        pool.close()
+
+    assert server.connections == 1
+
+
+def test_async_client_timeout_per_request():
+    async def _run(address):
+        client = AsyncRconClient(address, "password", timeout=5)
+        await client.connect()
+        await client.authenticate()
+        with pytest.raises(RconTimeoutError):
+            await client.execute("slow", timeout=0.01)
+        response = await client.execute("fast")
+        await client.close()
+        return response
+
+    with MockRconServer(delay=0.05) as server:
+        loop = asyncio.new_event_loop()
+        response = loop.run_until_complete(_run(server.address))
+        loop.close()
+
+    assert response == "ran fast"
+
+
+def test_async_client_execute_many_timeout():
+    async def _run(address):
+        client = AsyncRconClient(address, "password", timeout=5)
+        await client.connect()
+        await client.authenticate()
+        with pytest.raises(RconTimeoutError):
+            await client.execute_many(["a", "b", "c"], timeout=0.01)
+        pending = len(client._requests)
+        await client.close()
+        return pending
+
+    with MockRconServer(delay=0.05) as server:
+        loop = asyncio.new_event_loop()
+        pending = loop.run_until_complete(_run(server.address))
+        loop.close()
+
+    assert pending == 0
+
+
+def test_execute_batches():
+    servers = [MockRconServer() for x in range(5)]
+    for server in servers:
+        server.__enter__()
+
+    batches = [
+        ({"address": s.address, "password": "password", "timeout": 5}, ["a"])
+        for s in servers
+    ]
+    batches.append(
+        ({"address": servers[0].address, "password": "bad"}, ["a"])
+    )
+
+    results = execute_batches(batches)
+
+    for server in servers:
+        server.__exit__()
+
+    assert results[:5] == [["ran a"]] * 5
+    assert isinstance(results[5], RconAuthenticationError)
@@ -0,0 +1,130 @@
+import os
+
+import mock
+import pytest
+
+from gs_manager.releases import ReleaseManager, clone_tree, scan_tree
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(data)
+
+
+def _read(path):
+    with open(path, "r") as f:
+        return f.read()
+
+
+def _make_server(tmp_path):
+    server_path = str(tmp_path / "ark")
+    _write(os.path.join(server_path, "ShooterGame", "Binaries", "a"), "v1")
+    _write(os.path.join(server_path, "ShooterGame", "Saved", "s"), "save1")
+    _write(os.path.join(server_path, "config.ini"), "old")
+    os.symlink("config.ini", os.path.join(server_path, "link.ini"))
+
+    # make sure later writes get a different mtime
+    for root, _, names in os.walk(server_path):
+        for name in names:
+            path = os.path.join(root, name)
+            if not os.path.islink(path):
+                os.utime(path, (1000, 1000))
+    return server_path
+
+
+def test_clone_tree_modes(tmp_path):
+    server_path = _make_server(tmp_path)
+
+    for mode in ["reflink", "hardlink", "copy"]:
+        clone = str(tmp_path / mode)
+        clone_tree(server_path, clone, mode)
+
+        assert scan_tree(clone) == scan_tree(server_path)
+        assert os.readlink(os.path.join(clone, "link.ini")) == "config.ini"
+
+    assert os.path.samefile(
+        os.path.join(server_path, "config.ini"),
+        str(tmp_path / "hardlink" / "config.ini"),
+    )
+    assert not os.path.samefile(
+        os.path.join(server_path, "config.ini"),
+        str(tmp_path / "copy" / "config.ini"),
+    )
+
+
+def test_clone_tree_reflink_fallback(tmp_path):
+    server_path = _make_server(tmp_path)
+    clone = str(tmp_path / "clone")
+
+    error = OSError(95, "Operation not supported")
+    with mock.patch("gs_manager.releases.fcntl.ioctl", side_effect=error):
+        mode = clone_tree(server_path, clone, "reflink")
+
+    assert mode == "copy"
+    assert scan_tree(clone) == scan_tree(server_path)
+
+
+def test_staged_release(tmp_path):
+    server_path = _make_server(tmp_path)
+    releases = ReleaseManager(server_path)
+
+    stage_path, snapshot = releases.stage("copy")
+
+    # the update changes a game file in the stage
+    _write(os.path.join(stage_path, "ShooterGame", "Binaries", "a"), "v2")
+    _write(os.path.join(stage_path, "ShooterGame", "Binaries", "b"), "new")
+    # the running server saves and removes a file meanwhile
+    _write(os.path.join(server_path, "ShooterGame", "Saved", "s"), "save2")
+    _write(os.path.join(server_path, ".start_servers"), "default")
+    os.remove(os.path.join(server_path, "config.ini"))
+
+    assert releases.sync(stage_path, snapshot) == 3
+
+    release_path = releases.activate(stage_path)
+
+    assert os.path.islink(server_path)
+    assert releases.current == release_path
+    assert _read(os.path.join(server_path, "ShooterGame", "Binaries", "a")) == "v2"  # noqa
+    assert _read(os.path.join(server_path, "ShooterGame", "Saved", "s")) == "save2"  # noqa
+    assert _read(os.path.join(server_path, ".start_servers")) == "default"
+    assert not os.path.exists(os.path.join(server_path, "config.ini"))
+
+    previous = releases.previous
+    assert previous is not None
+    assert _read(os.path.join(previous, "ShooterGame", "Binaries", "a")) == "v1"  # noqa
+
+    assert releases.rollback() == previous
+    assert releases.current == previous
+    assert releases.previous == release_path
+
+
+def test_prune_releases(tmp_path):
+    server_path = _make_server(tmp_path)
+    releases = ReleaseManager(server_path, keep=1)
+
+    for _ in range(3):
+        stage_path, _ = releases.stage("copy")
+        releases.activate(stage_path)
+
+    assert len(releases.releases) == 2
+    assert releases.current == releases.releases[-1]
+
+
+def test_discard_stage(tmp_path):
+    server_path = _make_server(tmp_path)
+    releases = ReleaseManager(server_path)
+
+    stage_path, _ = releases.stage("copy")
+    releases.discard(stage_path)
+
+    assert not os.path.exists(stage_path)
+    assert releases.releases == []
+    assert not os.path.islink(server_path)
+
+
+def test_stage_rejects_hardlink(tmp_path):
+    releases = ReleaseManager(_make_server(tmp_path))
+
+    with pytest.raises(ValueError):
+        releases.stage("hardlink")
@@ -0,0 +1,183 @@
+import os
+import sys
+
+import pytest
+
+from gs_manager.steamcmd import (
+    ProgressParser,
+    SteamCmdError,
+    SteamCmdSession,
+    add_progress_hook,
+    get_steamcmd_session,
+    parse_workshop_download,
+    remove_progress_hook,
+)
+
+FAKE_STEAMCMD = "{} {}".format(
+    sys.executable, os.path.join(os.path.dirname(__file__), "fake_steamcmd.py")
+)
+
+WORKSHOP_OUTPUT = """
+Redirecting stderr to '/home/steam/Steam/logs/stderr.txt'
+Loading Steam API...OK.
+Logging in user 'anonymous' to Steam Public...OK
+Downloading item 731604991 ...
+Success. Downloaded item 731604991 to "/srv/ark/steamapps/workshop/content/346110/731604991" (163498263 bytes)
+Downloading item 889745138 ...
+ERROR! Download item 889745138 failed (Failure).
+Downloading item 1404697612 ...
+ERROR! Timeout downloading item 1404697612
+"""  # noqa
+
+
+def test_parse_workshop_download():
+    results = parse_workshop_download(
+        WORKSHOP_OUTPUT, ["731604991", "889745138", "1404697612", "42"]
+    )
+
+    assert results == {
+        "731604991": None,
+        "889745138": "Failure",
+        "1404697612": "timed out",
+        "42": "no result from steamcmd",
+    }
+
+
+def test_parse_workshop_download_ignores_other_items():
+    results = parse_workshop_download(WORKSHOP_OUTPUT, ["889745138"])
+
+    assert results == {"889745138": "Failure"}
+
+
+def test_session_runs_commands_in_one_process():
+    with SteamCmdSession(FAKE_STEAMCMD, login="anonymous") as session:
+        pid = session._process.pid
+
+        output = session.app_info("376030")
+        result = session.app_update("376030", "/srv/ark")
+
+        assert session.logged_in
+        assert session._process.pid == pid
+
+    assert output.startswith('"376030"')
+    assert result.success
+    assert result.lines[-1] == "Success! App '376030' fully installed."
+    assert not session.running
+
+
+def test_session_progress_events():
+    events = []
+    hooked = []
+    add_progress_hook(hooked.append)
+    try:
+        with SteamCmdSession(FAKE_STEAMCMD) as session:
+            result = session.app_update(
+                "376030", "/srv/ark", on_event=events.append
+            )
+    finally:
+        remove_progress_hook(hooked.append)
+
+    assert [(e.phase, e.current, e.total) for e in events] == [
+        ("verifying install", 0, 1000),
+        ("downloading", 250, 1000),
+        ("downloading", 1000, 1000),
+    ]
+    assert events[1].state == 0x61
+    assert hooked == events
+    assert list(result.phases.keys()) == ["verifying install", "downloading"]
+    assert result.phases["downloading"].bytes == 750
+
+
+def _progress_line(phase, current, total):
+    return (
+        f"Update state (0x61) {phase}, progress: "
+        f"{current * 100 / total:.2f} ({current} / {total})"
+    )
+
+
+def test_progress_parser_rate_and_eta():
+    clock = iter([0.0, 1.0, 2.0, 3.0, 4.0, 5.0])
+    parser = ProgressParser(clock=lambda: next(clock), smoothing=0.5)
+
+    assert parser.feed("Loading Steam API...OK") is None
+
+    first = parser.feed(_progress_line("downloading", 0, 4000))
+    assert first.rate is None
+    assert first.eta is None
+
+    event = parser.feed(_progress_line("downloading", 1000, 4000))
+    assert event.rate == 1000
+    assert event.eta == 3
+    assert event.percent == 25
+
+    event = parser.feed(_progress_line("downloading", 3000, 4000))
+    assert event.rate == 1500
+    assert event.elapsed == 2
+
+    # rate starts over for a new phase
+    event = parser.feed(_progress_line("verifying update", 0, 4000))
+    assert event.rate is None
+
+    event = parser.feed(_progress_line("verifying update", 4000, 4000))
+    assert event.rate == 4000
+    assert event.eta == 0
+
+    assert parser.phases["downloading"].bytes == 3000
+    assert parser.phases["downloading"].rate == 1500
+    assert parser.phases["verifying update"].seconds == 1
+    assert str(parser.phases["downloading"]) == (
+        "downloading: 2.9 KB in 2.0s (1.5 KB/s)"
+    )
+
+
+def test_session_errors():
+    with SteamCmdSession(FAKE_STEAMCMD) as session:
+        result = session.app_update("404", "/srv/ark")
+
+        assert not result.success
+        assert "No subscription" in result.error
+        assert session.workshop_download_item("346110", "1") is None
+        assert (
+            session.workshop_download_item("346110", "404")
+            == "File Not Found"
+        )
+
+        with pytest.raises(SteamCmdError):
+            session.run("crash")
+        assert not session.running
+
+        # restarts on the next command
+        assert session.run("app_update 376030").success
+
+
+def test_session_bad_login():
+    session = SteamCmdSession(FAKE_STEAMCMD, login="user bad")
+    try:
+        with pytest.raises(SteamCmdError):
+            session.run("app_update 376030")
+        assert not session.logged_in
+    finally:
+        session.close()
+
+
+def test_session_missing_steamcmd():
+    with pytest.raises(SteamCmdError):
+        SteamCmdSession("/does/not/exist/steamcmd").start()
+
+
+def test_get_steamcmd_session():
+    session = get_steamcmd_session(FAKE_STEAMCMD, "anonymous")
+
+    assert get_steamcmd_session(FAKE_STEAMCMD, "anonymous") is session
+    assert get_steamcmd_session(FAKE_STEAMCMD, None) is not session
+
+
+def test_session_login_timeout():
+    # steamcmd waits for a password that never comes
+    session = SteamCmdSession(FAKE_STEAMCMD, login="user", login_timeout=1)
+    try:
+        with pytest.raises(SteamCmdError):
+            session.login()
+        assert not session.logged_in
+    finally:
+        session.close()
@@ -0,0 +1,118 @@
+import os
+
+import pytest
+
+from gs_manager.ue4 import (
+    MANIFEST_NAME,
+    read_manifest,
+    unpack_tree,
+    z_unpack,
+)
+
+from .mock_z import make_data, make_z_file
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("threads", [1, 4])
+def test_z_unpack(tmp_path, threads):
+    data = make_data(1000000)
+    from_path = make_z_file(str(tmp_path / "a.z"), data, chunk_size=65536)
+    to_path = str(tmp_path / "a")
+
+    assert z_unpack(from_path, to_path, threads=threads, readahead=2) == len(
+        data
+    )
+    assert _read(to_path) == data
+
+
+def test_z_unpack_empty(tmp_path):
+    from_path = make_z_file(str(tmp_path / "a.z"), b"")
+    to_path = str(tmp_path / "a")
+
+    assert z_unpack(from_path, to_path) == 0
+    assert _read(to_path) == b""
+
+
+def test_z_unpack_truncated(tmp_path):
+    from_path = make_z_file(
+        str(tmp_path / "a.z"), make_data(300000), chunk_size=65536
+    )
+    with open(from_path, "r+b") as f:
+        f.truncate(f.seek(0, 2) - 100)
+
+    with pytest.raises(ValueError):
+        z_unpack(from_path, str(tmp_path / "a"), threads=4)
+
+
+def test_unpack_tree(tmp_path):
+    src_dir = str(tmp_path / "workshop" / "731604991")
+    data = make_data(300000)
+    os.makedirs(os.path.join(src_dir, "Maps"))
+    make_z_file(os.path.join(src_dir, "Maps", "a.umap.z"), data, 65536)
+    with open(os.path.join(src_dir, "mod.info"), "wb") as f:
+        f.write(b"info")
+
+    dst_dir = str(tmp_path / "Mods" / "731604991")
+    progress = []
+    unpack_tree(src_dir, dst_dir, report=progress.append)
+
+    assert sorted(os.listdir(dst_dir)) == [MANIFEST_NAME, "Maps", "mod.info"]
+    assert os.listdir(os.path.join(dst_dir, "Maps")) == ["a.umap"]
+    assert _read(os.path.join(dst_dir, "Maps", "a.umap")) == data
+    assert os.path.samefile(
+        os.path.join(src_dir, "mod.info"), os.path.join(dst_dir, "mod.info")
+    )
+    # the workshop download is left alone
+    assert os.path.isfile(os.path.join(src_dir, "Maps", "a.umap.z"))
+    assert sum(progress) == (
+        os.path.getsize(os.path.join(src_dir, "Maps", "a.umap.z")) + 4
+    )
+
+
+def test_unpack_tree_bad_size(tmp_path):
+    src_dir = str(tmp_path / "src")
+    os.makedirs(src_dir)
+    path = make_z_file(os.path.join(src_dir, "a.z"), make_data(1000))
+    with open(f"{path}.uncompressed_size", "w") as f:
+        f.write("999")
+
+    with pytest.raises(ValueError):
+        unpack_tree(src_dir, str(tmp_path / "dst"))
+
+
+def test_unpack_tree_incremental(tmp_path):
+    src_dir = str(tmp_path / "src")
+    dst_dir = str(tmp_path / "dst")
+    os.makedirs(src_dir)
+    make_z_file(os.path.join(src_dir, "a.z"), make_data(1000, 1))
+    make_z_file(os.path.join(src_dir, "b.z"), make_data(1000, 2))
+    with open(os.path.join(src_dir, "mod.info"), "wb") as f:
+        f.write(b"info")
+
+    changed, removed = unpack_tree(src_dir, dst_dir, mode="copy")
+    assert sorted(changed) == ["a.z", "b.z", "mod.info"]
+    assert removed == []
+    assert sorted(read_manifest(dst_dir)) == ["a.z", "b.z", "mod.info"]
+
+    assert unpack_tree(src_dir, dst_dir, mode="copy") == ([], [])
+
+    # rewritten with the same content, like a steamcmd validate
+    os.utime(os.path.join(src_dir, "mod.info"), (1000, 1000))
+    # updated and removed
+    make_z_file(os.path.join(src_dir, "a.z"), make_data(2000, 3))
+    os.remove(os.path.join(src_dir, "b.z"))
+    os.remove(os.path.join(src_dir, "b.z.uncompressed_size"))
+
+    assert unpack_tree(src_dir, dst_dir, mode="copy") == (["a.z"], ["b.z"])
+    assert _read(os.path.join(dst_dir, "a")) == make_data(2000, 3)
+    assert not os.path.exists(os.path.join(dst_dir, "b"))
+
+    # outputs changed behind its back are unpacked again
+    with open(os.path.join(dst_dir, "a"), "wb") as f:
+        f.write(b"broken")
+    assert unpack_tree(src_dir, dst_dir, mode="copy") == (["a.z"], [])
+    assert _read(os.path.join(dst_dir, "a")) == make_data(2000, 3)
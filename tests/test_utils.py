@@ -1,7 +1,13 @@
 import subprocess
 
+import psutil
 import pytest
-from gs_manager.utils import run_command, to_pascal_case, to_snake_case
+from gs_manager.utils import (
+    lower_priority,
+    run_command,
+    to_pascal_case,
+    to_snake_case,
+)
 from mock import Mock, patch
 
 
@@ -118,3 +124,14 @@ def test_run_command_pipeline_5():
     output = run_command("echo test | cat | xargs echo 2 | cat | xargs echo 3")
 
     assert output == "3 2 test"
+
+
+@patch("gs_manager.utils.psutil.Process")
+@patch("gs_manager.utils.os.nice")
+def test_lower_priority(mock_nice, mock_process):
+    lower_priority()
+
+    mock_nice.assert_called_once_with(19)
+    mock_process.return_value.ionice.assert_called_once_with(
+        psutil.IOPRIO_CLASS_IDLE
+    )
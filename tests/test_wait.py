@@ -0,0 +1,123 @@
+import os
+import subprocess
+import time
+
+import click
+import pytest
+from gs_manager.wait import (
+    LogLineProbe,
+    Probe,
+    wait_for_exit,
+    wait_for_probes,
+)
+
+
+def test_probe_backoff():
+    probe = Probe(lambda: False, min_interval=0.1, max_interval=0.3)
+
+    assert not probe.poll(0)
+    assert probe.next_check == 0.1
+    probe.poll(1)
+    probe.poll(2)
+    probe.poll(3)
+
+    assert probe.interval == 0.3
+
+
+def test_wait_for_probes():
+    calls = []
+
+    def _check():
+        calls.append(1)
+        return len(calls) >= 3
+
+    start = time.monotonic()
+    assert wait_for_probes([Probe(_check, min_interval=0.01)], 5)
+    assert time.monotonic() - start < 1
+
+
+def test_wait_for_probes_keeps_own_intervals():
+    fast_calls = []
+    slow_calls = []
+
+    def _fast():
+        fast_calls.append(1)
+        return len(fast_calls) >= 20
+
+    def _slow():
+        slow_calls.append(1)
+        return False
+
+    probes = [
+        Probe(_fast, min_interval=0.01, max_interval=0.01),
+        Probe(_slow, min_interval=1, max_interval=1, timeout=0.5),
+    ]
+    wait_for_probes(probes, 5)
+
+    assert len(fast_calls) == 20
+    assert len(slow_calls) == 1
+
+
+def test_wait_for_probes_timeout():
+    assert not wait_for_probes([Probe(lambda: False)], 0.2)
+    assert not wait_for_probes([Probe(lambda: False, timeout=0.1)], 5)
+
+
+def test_wait_for_probes_abort():
+    start = time.monotonic()
+    assert not wait_for_probes([Probe(lambda: False)], 5, abort=lambda: True)
+    assert time.monotonic() - start < 1
+
+
+def test_log_line_probe_ignores_old_lines(tmp_path):
+    log = tmp_path / "latest.log"
+    log.write_text("Done (1.0s)! For help,\n")
+
+    probe = LogLineProbe(str(log), r"Done \(")
+    assert not probe.check()
+
+    with open(log, "a") as f:
+        f.write("Starting\nDone (2.0s)! For help,\n")
+    assert probe.check()
+
+
+def test_log_line_probe_rotated(tmp_path):
+    log = tmp_path / "latest.log"
+    log.write_text("Done (1.0s)! For help,\n")
+
+    probe = LogLineProbe(str(log), r"Done \(")
+    os.rename(log, tmp_path / "old.log")
+    log.write_text("Done (2.0s)")
+    assert not probe.check()
+
+    with open(log, "a") as f:
+        f.write("! For help,\n")
+    assert probe.check()
+
+
+def test_log_line_probe_errors(tmp_path):
+    log = tmp_path / "latest.log"
+
+    probe = LogLineProbe(str(log), r"Done \(", errors={"EULA": "eula"})
+    assert not probe.check()
+
+    log.write_text("You need to agree to the EULA\n")
+    with pytest.raises(click.ClickException):
+        probe.check()
+
+
+def test_wait_for_exit():
+    process = subprocess.Popen(["sleep", "0.2"])
+
+    start = time.monotonic()
+    assert wait_for_exit(process.pid, 5)
+    assert time.monotonic() - start < 2
+    process.wait()
+
+
+def test_wait_for_exit_timeout():
+    process = subprocess.Popen(["sleep", "5"])
+
+    assert not wait_for_exit(process.pid, 0.2)
+    process.kill()
+    process.wait()
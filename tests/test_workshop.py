@@ -0,0 +1,111 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+import requests
+
+from gs_manager.cache import ResultCache
+from gs_manager.workshop import PublishedFileResolver
+
+
+class PublishedFilesHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        data = parse_qs(self.rfile.read(length).decode())
+        self.server.requests.append(data)
+
+        if self.server.fail:
+            self.send_response(500)
+            self.end_headers()
+            return
+
+        count = int(data["itemcount"][0])
+        details = []
+        for index in range(count):
+            file_id = data[f"publishedfileids[{index}]"][0]
+            if file_id == "404":
+                details.append({"publishedfileid": file_id, "result": 9})
+            else:
+                details.append(
+                    {
+                        "publishedfileid": file_id,
+                        "result": 1,
+                        "time_updated": int(file_id) * 10,
+                    }
+                )
+
+        body = json.dumps(
+            {
+                "response": {
+                    "result": 1,
+                    "resultcount": count,
+                    "publishedfiledetails": details,
+                }
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def api():
+    server = HTTPServer(("127.0.0.1", 0), PublishedFilesHandler)
+    server.requests = []
+    server.fail = False
+    server.url = "http://{}:{}/".format(*server.server_address)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_get_time_updated_batches(api):
+    resolver = PublishedFileResolver(url=api.url, batch_size=2)
+
+    times = resolver.get_time_updated([1, "2", "404"])
+
+    assert times == {"1": 10, "2": 20, "404": None}
+    assert [r["itemcount"] for r in api.requests] == [["2"], ["1"]]
+
+
+def test_get_time_updated_single_request(api):
+    resolver = PublishedFileResolver(url=api.url)
+    file_ids = [str(i) for i in range(1, 61)]
+
+    times = resolver.get_time_updated(file_ids)
+
+    assert times["60"] == 600
+    assert len(api.requests) == 1
+    assert api.requests[0]["publishedfileids[59]"] == ["60"]
+
+
+def test_get_time_updated_cached(api, tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite"))
+    resolver = PublishedFileResolver(cache=cache, max_age=60, url=api.url)
+
+    resolver.get_time_updated(["1", "2"])
+    times = resolver.get_time_updated(["1", "2", "3"])
+
+    assert times == {"1": 10, "2": 20, "3": 30}
+    assert len(api.requests) == 2
+    assert "publishedfileids[1]" not in api.requests[1]
+    assert api.requests[1]["publishedfileids[0]"] == ["3"]
+
+
+def test_get_time_updated_error(api):
+    api.fail = True
+    resolver = PublishedFileResolver(url=api.url)
+
+    with pytest.raises(requests.HTTPError):
+        resolver.get_time_updated(["1"])